@@ -1,15 +1,20 @@
-from flask import Flask, jsonify, request, send_from_directory
-from werkzeug.security import generate_password_hash, check_password_hash
-from marshmallow import Schema, fields, validate, ValidationError
+from flask import Flask, Response, jsonify, request, send_from_directory
+from marshmallow import ValidationError
 from database import (
     get_user_by_id,
-    get_all_users_db,
+    get_users_page_db,
+    iter_users_db,
     create_user_db,
     update_user_db,
     delete_user_db,
     search_users_db,
     get_user_by_email,
+    SEARCH_DEFAULT_LIMIT,
 )
+from bulk_import import FORMATS as IMPORT_FORMATS, import_users, read_rows
+from hashing import hasher, HasherBusy
+from schemas import user_schema, user_update_schema, users_schema
+import json
 import logging
 import os
 
@@ -17,17 +22,8 @@ app = Flask(__name__, static_folder='frontend/build/static', template_folder='fr
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Marshmallow Schema
-class UserSchema(Schema):
-    id = fields.Int(dump_only=True)
-    name = fields.Str(required=True, validate=validate.Length(min=1))
-    age = fields.Int(required=False, validate=validate.Range(min=1))
-    email = fields.Email(required=True)
-    password = fields.Str(required=True, load_only=True, validate=validate.Length(min=6))
-
-user_schema = UserSchema()
-user_update_schema = UserSchema(partial=True)
-users_schema = UserSchema(many=True)
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -37,15 +33,72 @@ def serve_react_app(path):
     else:
         return send_from_directory(app.template_folder, 'index.html')
 
+def hashing_busy_response():
+    logging.warning("Password hashing at capacity; request rejected")
+    response = jsonify({"error": "Server busy, please retry shortly"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"message": "User Management System API is running"}), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({"password_hashing": hasher.stats()}), 200
+
+def stream_users(after, fmt):
+    # Serializes one page at a time, so memory stays flat however many users there are
+    try:
+        first = True
+        if fmt == 'json':
+            yield '['
+        for rows in iter_users_db(after, STREAM_BATCH_SIZE):
+            items = [json.dumps(user) for user in users_schema.dump(rows)]
+            if fmt == 'ndjson':
+                yield '\n'.join(items) + '\n'
+            else:
+                yield ('' if first else ',') + ','.join(items)
+            first = False
+        if fmt == 'json':
+            yield ']'
+    except Exception as e:
+        # Headers are already sent; the client sees a truncated body
+        logging.error(f"Error streaming users: {e}")
+        raise
+
 @app.route('/users', methods=['GET'])
 def get_all_users():
     try:
-        users = get_all_users_db()
-        return jsonify(users_schema.dump(users)), 200
+        try:
+            after = int(request.args.get('after', 0))
+            limit = int(request.args['limit']) if 'limit' in request.args else None
+        except ValueError:
+            return jsonify({"error": "after and limit must be integers"}), 400
+        if after < 0:
+            return jsonify({"error": "after must be a non-negative integer"}), 400
+        fmt = request.args.get('format', 'json')
+        if fmt not in ('json', 'ndjson'):
+            return jsonify({"error": "format must be json or ndjson"}), 400
+
+        if limit is None:
+            # Whole table (past 'after'), streamed as a chunked JSON array or NDJSON
+            mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+            return Response(stream_users(after, fmt), mimetype=mimetype), 200
+
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+        users = users_schema.dump(get_users_page_db(after, limit))
+        if fmt == 'ndjson':
+            response = Response(''.join(json.dumps(user) + '\n' for user in users), mimetype='application/x-ndjson')
+        else:
+            response = jsonify(users)
+        if len(users) == limit:
+            # More may follow: pass the last id back as 'after' to get the next page
+            next_after = users[-1]['id']
+            response.headers['X-Next-After'] = str(next_after)
+            response.headers['Link'] = f'</users?after={next_after}&limit={limit}&format={fmt}>; rel="next"'
+        return response, 200
     except Exception as e:
         logging.error(f"Error fetching all users: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -69,7 +122,7 @@ def create_user():
         if not json_data:
             return jsonify({"error": "Invalid JSON data"}), 400
         data = user_schema.load(json_data)
-        hashed_password = generate_password_hash(data['password'], method='sha256')
+        hashed_password = hasher.hash(data['password'])
         age = data.get('age', None)
         user_id = create_user_db(data['name'], data['email'], hashed_password, age)
         if user_id:
@@ -81,10 +134,26 @@ def create_user():
     except ValidationError as err:
         logging.warning(f"Validation error during user creation: {err.messages}")
         return jsonify(err.messages), 400
+    except HasherBusy:
+        return hashing_busy_response()
     except Exception as e:
         logging.error(f"Error creating user: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
+@app.route('/users/import', methods=['POST'])
+def import_users_bulk():
+    try:
+        fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+        if fmt not in IMPORT_FORMATS:
+            return jsonify({"error": "format must be ndjson or csv"}), 400
+        # The body is read as a stream, one batch at a time, so large files aren't held in memory
+        report = import_users(read_rows(request.stream, fmt))
+        logging.info(f"Bulk import: {report.imported} imported, {report.invalid} invalid, {report.conflicts} conflicts")
+        return jsonify(report.to_dict()), 200
+    except Exception as e:
+        logging.error(f"Error importing users: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
 @app.route('/user/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
     try:
@@ -95,7 +164,7 @@ def update_user(user_id):
         if not data:
             return jsonify({"error": "No valid fields provided for update"}), 400
         if 'password' in data:
-            data['password'] = generate_password_hash(data['password'], method='sha256')
+            data['password'] = hasher.hash(data['password'])
         updated = update_user_db(
             user_id,
             name=data.get('name'),
@@ -113,6 +182,8 @@ def update_user(user_id):
     except ValidationError as err:
         logging.warning(f"Validation error during user update: {err.messages}")
         return jsonify(err.messages), 400
+    except HasherBusy:
+        return hashing_busy_response()
     except Exception as e:
         logging.error(f"Error updating user {user_id}: {e}")
         return jsonify({"error": "Internal server error"}), 500
@@ -137,7 +208,14 @@ def search_users():
         name = request.args.get('name')
         if not name:
             return jsonify({"error": "Please provide a name to search"}), 400
-        users = search_users_db(name)
+        try:
+            limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+        prefix = request.args.get('prefix', '').lower() in ('1', 'true', 'yes')
+        users = search_users_db(name, limit, prefix)
         return jsonify(users_schema.dump(users)), 200
     except Exception as e:
         logging.error(f"Error searching users: {e}")
@@ -157,13 +235,15 @@ def login():
             return jsonify({"error": "Email and password are required"}), 400
 
         user = get_user_by_email(email)
-        if user and check_password_hash(user['password'], password):
+        if user and hasher.verify(user['password'], password):
             logging.info(f"User {user['id']} logged in successfully.")
             return jsonify({"status": "success", "user_id": user['id'], "message": "Login successful"}), 200
         else:
             logging.warning(f"Login failed for email: {email}")
             return jsonify({"status": "failed", "message": "Invalid email or password"}), 401
 
+    except HasherBusy:
+        return hashing_busy_response()
     except Exception as e:
         logging.error(f"Error during login: {e}")
         return jsonify({"error": "Internal server error"}), 500
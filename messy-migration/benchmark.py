@@ -0,0 +1,103 @@
+"""Requests per second for the main endpoints, with and without the connection pool.
+
+Usage:
+    python benchmark.py                          # 1,000 users, 2,000 requests per endpoint, 8 threads
+    python benchmark.py --users 100000 --requests 5000 --threads 16
+
+Runs in-process through Flask's test client against a throwaway database.
+"without pool" restores the original get_db(), which opened (and never
+closed) a fresh, untuned sqlite3 connection for every query; the pooled
+run follows on the same data.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import database
+from app import app
+
+
+@contextmanager
+def unpooled_get_db():
+    # The original implementation: sqlite3's context manager commits but doesn't close
+    conn = sqlite3.connect(database.DATABASE)
+    conn.row_factory = sqlite3.Row
+    with conn:
+        yield conn
+
+
+def seed(count):
+    # Precomputed hash: hashing isn't what this benchmark measures
+    with database.get_db() as conn:
+        conn.executemany(
+            "INSERT INTO users (name, age, email, password) VALUES (?, ?, ?, ?)",
+            ((f"User {i}", 20 + i % 50, f"user{i}@example.com", 'not-a-real-hash') for i in range(count)),
+        )
+
+
+def run_requests(make_request, count, threads):
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(worker_id):
+        client = app.test_client()
+        rng = random.Random(worker_id)
+        barrier.wait()
+        for _ in range(count // threads):
+            response = make_request(client, rng)
+            assert response.status_code == 200, response.status_code
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return round(count // threads * threads / elapsed)
+
+
+def measure(users, count, threads):
+    return {
+        "GET /user/<id>": run_requests(lambda c, rng: c.get(f'/user/{rng.randint(1, users)}'), count, threads),
+        "PUT /user/<id>": run_requests(
+            lambda c, rng: c.put(f'/user/{rng.randint(1, users)}', json={"age": rng.randint(1, 99)}), count, threads
+        ),
+        "GET /search": run_requests(lambda c, rng: c.get(f'/search?name=User {rng.randint(1, users)}'), count, threads),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per endpoint')
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)  # Per-request log lines would dominate the timings
+    pooled_get_db = database.get_db
+    with tempfile.TemporaryDirectory() as directory:
+        database.DATABASE = os.path.join(directory, 'bench.db')
+        # Created without the pool, so the first run also keeps the default rollback journal
+        database.get_db = unpooled_get_db
+        database.init_db()
+        seed(args.users)
+        results = {}
+        results["without pool"] = measure(args.users, args.requests, args.threads)
+        database.get_db = pooled_get_db
+        results["with pool"] = measure(args.users, args.requests, args.threads)
+        database.close_pools()
+    print(json.dumps({
+        "users": args.users, "requests": args.requests, "threads": args.threads, "requests_per_sec": results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+import csv
+import io
+import json
+import re
+from marshmallow import ValidationError
+from database import find_existing_emails_db, insert_users_db
+from hashing import hasher
+from schemas import UserSchema
+
+FORMATS = ('ndjson', 'csv')
+# Rows validated, hashed and inserted together; each batch is one transaction
+IMPORT_BATCH_SIZE = 1000
+# Invalid and conflicting rows listed in the report; the rest are only counted
+MAX_REPORTED_ROWS = 1000
+
+# Rows may carry a Werkzeug hash instead of a password (e.g. when migrating users)
+_PASSWORD_HASH = re.compile(r'(pbkdf2:[a-z0-9]+(:\d+)?|scrypt(:\d+){0,3})\$[^$]+\$[0-9a-f]+')
+
+# Password is checked separately, since it can be replaced by password_hash
+import_schema = UserSchema(partial=('password',))
+
+
+def read_rows(stream, fmt='ndjson'):
+    """Yields (line number, row dict) from a binary stream; unparseable rows come as (line number, error message)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            if None in row:
+                yield reader.line_num, "too many fields"
+                continue
+            # Empty cells are missing values, e.g. an optional age
+            yield reader.line_num, {key: value for key, value in row.items() if value not in ('', None)}
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, "invalid JSON"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, "expected a JSON object"
+            continue
+        yield line_number, row
+
+
+def validate_rows(rows):
+    """Validates a batch of row dicts with one UserSchema load.
+
+    Returns a list aligned with 'rows': a (name, age, email, password,
+    password_hash) tuple for each valid row, or a dict of error messages.
+    """
+    rows = [dict(row) for row in rows]
+    password_hashes = [row.pop('password_hash', None) for row in rows]
+    try:
+        loaded, errors = import_schema.load(rows, many=True), {}
+    except ValidationError as err:
+        loaded, errors = err.valid_data, err.messages
+    results = []
+    for index, (data, password_hash) in enumerate(zip(loaded, password_hashes)):
+        messages = errors.get(index)
+        if messages is None:
+            if password_hash is not None:
+                if 'password' in data:
+                    messages = {"password_hash": ["Give either password or password_hash, not both."]}
+                elif not isinstance(password_hash, str) or not _PASSWORD_HASH.fullmatch(password_hash):
+                    messages = {"password_hash": ["Not a supported password hash."]}
+            elif 'password' not in data:
+                messages = {"password": ["Missing data for required field."]}
+        if messages is None:
+            results.append((data['name'], data.get('age'), data['email'], data.get('password'), password_hash))
+        else:
+            results.append(messages)
+    return results
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.invalid = 0
+        self.conflicts = 0
+        self.errors = []
+        self.conflicting = []
+
+    def add_error(self, line, messages):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ROWS:
+            self.errors.append({"line": line, "errors": messages})
+
+    def add_conflict(self, line, email):
+        self.conflicts += 1
+        if len(self.conflicting) < MAX_REPORTED_ROWS:
+            self.conflicting.append({"line": line, "email": email})
+
+    def to_dict(self):
+        return {
+            "imported": self.imported,
+            "invalid": self.invalid,
+            "conflicts": self.conflicts,
+            "errors": self.errors,
+            "conflicting": self.conflicting,
+        }
+
+
+def import_users(rows, batch_size=IMPORT_BATCH_SIZE, password_hasher=hasher, progress=None):
+    """Validates, hashes and inserts (line number, row) pairs from read_rows(), batch by batch.
+
+    Rows whose email is already taken, or repeats one earlier in the same
+    import, are reported as conflicts and skipped. Returns an ImportReport.
+    """
+    report = ImportReport()
+    batch = []
+    for line, row in rows:
+        batch.append((line, row))
+        if len(batch) >= batch_size:
+            _import_batch(batch, password_hasher, report)
+            batch = []
+            if progress:
+                progress(report)
+    if batch:
+        _import_batch(batch, password_hasher, report)
+        if progress:
+            progress(report)
+    return report
+
+
+def _import_batch(batch, password_hasher, report):
+    parsed = [(line, row) for line, row in batch if not isinstance(row, str)]
+    results = iter(validate_rows([row for _, row in parsed]))
+    valid = []
+    seen = set()  # Emails earlier in this batch; repeats of earlier batches are caught by the database check
+    for line, row in batch:
+        result = {"row": [row]} if isinstance(row, str) else next(results)
+        if isinstance(result, dict):
+            report.add_error(line, result)
+        elif result[2] in seen:
+            report.add_conflict(line, result[2])
+        else:
+            seen.add(result[2])
+            valid.append((line, result))
+
+    # Checked before hashing, so no hashing time is spent on rows that can't be inserted
+    taken = find_existing_emails_db(user[2] for _, user in valid)
+    pending = []
+    for line, user in valid:
+        if user[2] in taken:
+            report.add_conflict(line, user[2])
+        else:
+            pending.append((line, user))
+
+    to_hash = [user[3] for _, user in pending if user[4] is None]
+    hashes = iter(password_hasher.hash_many(to_hash) if to_hash else [])
+    users = [
+        (name, age, email, password_hash if password_hash is not None else next(hashes))
+        for _, (name, age, email, _password, password_hash) in pending
+    ]
+    # Re-checked inside the insert transaction, for emails taken while this batch was hashing
+    taken = insert_users_db(users)
+    for line, user in pending:
+        if user[2] in taken:
+            report.add_conflict(line, user[2])
+    report.imported += len(users) - len(taken)
@@ -1,14 +1,130 @@
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from werkzeug.security import generate_password_hash
 
 DATABASE = 'users.db'
 
-def get_db():
-    conn = sqlite3.connect(DATABASE)
+# Connection pool settings
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5.0))  # seconds to wait for a free connection
+BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 64 * 1024))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def connect(path):
+    # Connections may be handed to another thread by the pool, but only one thread uses each at a time
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
     conn.row_factory = sqlite3.Row  # Enable dict-like access
+    # Per-connection tuning, applied once when the connection is opened
+    conn.execute("PRAGMA journal_mode=WAL")  # Readers don't block the writer and vice versa
+    conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; fsync only at checkpoints
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size={-CACHE_SIZE_KB}")  # Negative value means KiB, not pages
     return conn
 
-def init_db():
+
+class ConnectionPool:
+    """Bounded pool of tuned connections to one database file.
+
+    Connections are opened lazily up to max_size. When all of them are in
+    use, borrowers wait up to timeout seconds and then get PoolTimeout.
+    """
+
+    def __init__(self, path, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()  # Most recently used first, so its page cache is warm
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.max_size:
+                self._opened += 1
+                try:
+                    return connect(self.path)
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+    def release(self, conn, broken=False):
+        if broken:
+            with self._lock:
+                self._opened -= 1
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool():
+    # One pool per database file, so switching DATABASE (e.g. in tests) gets fresh connections
+    with _pools_lock:
+        pool = _pools.get(DATABASE)
+        if pool is None:
+            pool = _pools[DATABASE] = ConnectionPool(DATABASE)
+        return pool
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+@contextmanager
+def get_db():
+    """Borrow a connection: commits on success, rolls back on error, then returns it to the pool."""
+    pool = get_pool()
+    conn = pool.acquire()
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            broken = True  # Don't hand a connection in an unknown state to the next request
+        raise
+    finally:
+        pool.release(conn, broken)
+
+def create_schema():
+    """Creates the users table and its search index, without any rows."""
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute('''
@@ -20,6 +136,13 @@ def init_db():
                 password TEXT NOT NULL
             )
         ''')
+    create_search_index()
+
+def init_db():
+    """Creates the schema and, if the table is empty, the sample users."""
+    create_schema()
+    with get_db() as conn:
+        cursor = conn.cursor()
         # Insert sample data if empty
         cursor.execute("SELECT COUNT(*) FROM users")
         if cursor.fetchone()[0] == 0:
@@ -30,6 +153,7 @@ def init_db():
             cursor.execute("INSERT INTO users (name, age, email, password) VALUES (?, ?, ?, ?)",
                 ('Bob Johnson', 40, 'bob@example.com', generate_password_hash('qwerty789')))
         conn.commit()
+    backfill_search_index()
 
 def get_user_by_id(user_id):
     with get_db() as conn:
@@ -43,12 +167,22 @@ def get_user_by_email(email):
         cursor.execute("SELECT id, name, age, email, password FROM users WHERE email = ?", (email,))
         return cursor.fetchone()
 
-def get_all_users_db():
+def get_users_page_db(after=0, limit=100):
+    # Keyset pagination: seeks straight to the first id past the cursor in the primary key index
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT id, name, age, email FROM users")
+        cursor.execute("SELECT id, name, age, email FROM users WHERE id > ? ORDER BY id LIMIT ?", (after, limit))
         return cursor.fetchall()
 
+def iter_users_db(after=0, batch_size=1000):
+    # Yields every user past 'after' one page at a time; the connection is only held while a page is read
+    while True:
+        rows = get_users_page_db(after, batch_size)
+        if not rows:
+            return
+        yield rows
+        after = rows[-1]['id']
+
 def create_user_db(name, email, password_hash, age=None):
     with get_db() as conn:
         cursor = conn.cursor()
@@ -62,6 +196,36 @@ def create_user_db(name, email, password_hash, age=None):
         except sqlite3.IntegrityError:
             return None
 
+# Emails per IN (...) lookup, well under SQLite's bound-parameter limit
+EMAIL_LOOKUP_CHUNK = 500
+
+def _existing_emails(conn, emails):
+    existing = set()
+    emails = list(emails)
+    for start in range(0, len(emails), EMAIL_LOOKUP_CHUNK):
+        chunk = emails[start:start + EMAIL_LOOKUP_CHUNK]
+        cursor = conn.execute(f"SELECT email FROM users WHERE email IN ({','.join('?' * len(chunk))})", chunk)
+        existing.update(row[0] for row in cursor)
+    return existing
+
+def find_existing_emails_db(emails):
+    with get_db() as conn:
+        return _existing_emails(conn, emails)
+
+def insert_users_db(users):
+    """Inserts (name, age, email, password_hash) tuples in one transaction with executemany.
+
+    Users whose email is already taken are skipped; returns the set of those emails.
+    """
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")  # Holds the write lock, so the email check can't go stale
+        taken = _existing_emails(conn, (user[2] for user in users))
+        conn.executemany(
+            "INSERT INTO users (name, age, email, password) VALUES (?, ?, ?, ?)",
+            (user for user in users if user[2] not in taken),
+        )
+        return taken
+
 def update_user_db(user_id, name=None, email=None, password=None, age=None):
     with get_db() as conn:
         cursor = conn.cursor()
@@ -98,8 +262,133 @@ def delete_user_db(user_id):
         conn.commit()
         return cursor.rowcount > 0
 
-def search_users_db(name):
+# --- Name search ---
+#
+# users_fts is an FTS5 index over users.name with the trigram tokenizer, so any
+# substring of 3+ characters is found through the index instead of a LIKE '%x%'
+# table scan. It's an external-content table (names aren't stored twice) kept
+# in sync by triggers. Shorter queries and prefix searches use a NOCASE index
+# on name instead, which SQLite can serve LIKE 'x%' from.
+#
+# On an existing database the index is backfilled in batches while the app
+# keeps running: search_index_state records the highest id at migration time
+# (target) and how far the backfill got (indexed_upto). Rows above target
+# are indexed by the triggers, and the triggers skip rows the backfill hasn't
+# reached yet, so no row is indexed twice. Until the backfill finishes,
+# searches fall back to the LIKE scan.
+
+SEARCH_BACKFILL_BATCH = 10000
+SEARCH_DEFAULT_LIMIT = 100
+# Matches ranked per query: very common substrings are ranked among this many of their first (lowest id)
+# matches, plus this many names starting with the query, in name order
+SEARCH_RANK_CANDIDATES = 1000
+
+# True when a row is already in users_fts (or is about to be, for inserts)
+_INDEXED = "({row}.id > (SELECT target FROM search_index_state) OR {row}.id <= (SELECT indexed_upto FROM search_index_state))"
+
+SEARCH_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(name, content='users', content_rowid='id', tokenize='trigram')",
+    "CREATE INDEX IF NOT EXISTS idx_users_name_nocase ON users(name COLLATE NOCASE)",
+    """CREATE TABLE IF NOT EXISTS search_index_state (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        target INTEGER NOT NULL,
+        indexed_upto INTEGER NOT NULL
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users WHEN {_INDEXED.format(row='new')} BEGIN
+        INSERT INTO users_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users WHEN {_INDEXED.format(row='old')} BEGIN
+        INSERT INTO users_fts(users_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF name ON users WHEN {_INDEXED.format(row='old')} BEGIN
+        INSERT INTO users_fts(users_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO users_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+]
+
+def create_search_index():
+    # Idempotent; the state row is only written the first time
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")  # Nothing can be inserted between reading MAX(id) and creating the triggers
+        conn.execute(SEARCH_SCHEMA[0])
+        conn.execute(SEARCH_SCHEMA[1])
+        conn.execute(SEARCH_SCHEMA[2])
+        conn.execute("INSERT OR IGNORE INTO search_index_state VALUES (0, (SELECT COALESCE(MAX(id), 0) FROM users), 0)")
+        for statement in SEARCH_SCHEMA[3:]:
+            conn.execute(statement)
+
+def backfill_search_index(batch_size=SEARCH_BACKFILL_BATCH, progress=None):
+    """Indexes the rows that predate the search index, one short transaction per batch.
+
+    Safe to interrupt and re-run; returns the number of rows indexed.
+    """
+    indexed = 0
+    while True:
+        with get_db() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            target, upto = conn.execute("SELECT target, indexed_upto FROM search_index_state").fetchone()
+            if upto >= target:
+                return indexed
+            end, count = conn.execute(
+                "SELECT MAX(id), COUNT(*) FROM (SELECT id FROM users WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)",
+                (upto, target, batch_size),
+            ).fetchone()
+            if count < batch_size:
+                end = target
+            conn.execute("INSERT INTO users_fts(rowid, name) SELECT id, name FROM users WHERE id > ? AND id <= ?", (upto, end))
+            conn.execute("UPDATE search_index_state SET indexed_upto = ?", (end,))
+        indexed += count
+        if progress:
+            progress(indexed, end, target)
+
+def search_index_ready(conn):
+    try:
+        row = conn.execute("SELECT indexed_upto >= target FROM search_index_state").fetchone()
+    except sqlite3.OperationalError:
+        return False  # Not migrated yet
+    return bool(row and row[0])
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_users_db(name, limit=SEARCH_DEFAULT_LIMIT, prefix=False):
+    """Case-insensitive name search, at most 'limit' results.
+
+    By default matches the query anywhere in the name. Names that start with
+    it rank first, then shorter names: with one short column the query almost
+    always occurs once, so that's the order bm25 gives, without its cost of
+    several microseconds per match. Ranking every match of a common substring
+    takes hundreds of milliseconds on a million users, so the ranked page is
+    the best of up to SEARCH_RANK_CANDIDATES substring matches plus as many
+    names starting with the query. Queries under 3 characters (too short for
+    trigrams) scan with LIKE, in id order. With prefix=True only names
+    starting with the query match, in name order.
+    """
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT id, name, age, email FROM users WHERE name LIKE ?", (f'%{name}%',))
+        if prefix:
+            cursor.execute(
+                "SELECT id, name, age, email FROM users WHERE name LIKE ? ESCAPE '\\' "
+                "ORDER BY name COLLATE NOCASE, id LIMIT ?",
+                (_like_escape(name) + '%', limit),
+            )
+        elif len(name) >= 3 and search_index_ready(conn):
+            candidates = max(limit, SEARCH_RANK_CANDIDATES)
+            cursor.execute(
+                "WITH candidates AS ("
+                "SELECT id FROM (SELECT rowid AS id FROM users_fts WHERE users_fts MATCH :match LIMIT :candidates) "
+                "UNION SELECT id FROM (SELECT id FROM users WHERE name LIKE :prefix ESCAPE '\\' "
+                "ORDER BY name COLLATE NOCASE LIMIT :candidates)) "
+                "SELECT users.id, users.name, users.age, users.email FROM candidates "
+                "JOIN users ON users.id = candidates.id "
+                "ORDER BY users.name LIKE :prefix ESCAPE '\\' DESC, length(users.name), users.id LIMIT :limit",
+                # Quoted as one phrase: matches the exact substring, like LIKE '%name%'
+                {"match": '"' + name.replace('"', '""') + '"', "candidates": candidates,
+                 "prefix": _like_escape(name) + '%', "limit": limit},
+            )
+        else:
+            cursor.execute(
+                "SELECT id, name, age, email FROM users WHERE name LIKE ? ESCAPE '\\' ORDER BY id LIMIT ?",
+                ('%' + _like_escape(name) + '%', limit),
+            )
         return cursor.fetchall()
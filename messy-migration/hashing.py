@@ -0,0 +1,176 @@
+import atexit
+import collections
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# KDF and cost for new hashes, e.g. 'pbkdf2:sha256:600000' or 'scrypt:32768:8:1'.
+# Existing hashes keep verifying with whatever method they were created with.
+HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+# Hashes allowed to wait for a worker; beyond that requests are turned away with a 503
+HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE', 4 * HASH_WORKERS))
+HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 30.0))  # seconds
+# Passwords per worker job in hash_many(); small enough that a login queued behind one doesn't wait long
+HASH_CHUNK_SIZE = int(os.environ.get('PASSWORD_HASH_CHUNK_SIZE', 16))
+
+# Latency samples kept for the percentiles in stats()
+SAMPLE_SIZE = 1000
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _hash_all(passwords, method):
+    return [generate_password_hash(password, method) for password in passwords]
+
+
+def _timed(function, *args):
+    # Runs in a worker process; wall-clock time so the parent can compute how long the job queued
+    started = time.time()
+    result = function(*args)
+    return result, started, time.time() - started
+
+
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = collections.deque(maxlen=SAMPLE_SIZE)
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def summary(self):
+        ordered = sorted(self.samples)
+
+        def percentile(q):
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2) if ordered else None
+
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2) if self.count else None,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class PasswordHasher:
+    """Runs password hashing and verification in a pool of worker processes.
+
+    KDFs are CPU-bound and hold the GIL, so running them on request threads
+    stalls every other endpoint. Here request threads only wait on a future.
+    At most workers + queue_size jobs are admitted at once; past that,
+    HasherBusy is raised straight away instead of letting the backlog (and
+    every caller's latency) grow without bound.
+    """
+
+    def __init__(self, method=HASH_METHOD, workers=HASH_WORKERS, queue_size=HASH_QUEUE_SIZE, timeout=HASH_TIMEOUT):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        # hash_many() jobs hold at most one slot per worker, leaving the queue slots to interactive requests
+        self._bulk_slots = threading.BoundedSemaphore(workers)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.queue_wait = LatencyStats()
+        self.hash_time = LatencyStats()
+        self.rejected = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs request threads can copy held locks
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _submit(self, function, *args, wait=False):
+        if not self._slots.acquire(blocking=wait):
+            with self._stats_lock:
+                self.rejected += 1
+            raise HasherBusy("Password hashing is at capacity")
+        submitted = time.time()
+        try:
+            executor = self._get_executor()
+            future = executor.submit(_timed, function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is freed when the job finishes, even if the caller timed out waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        return executor, future, submitted
+
+    def _result(self, executor, future, submitted, hashes=1):
+        try:
+            result, started, elapsed = future.result(self.timeout)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next request
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+        with self._stats_lock:
+            self.queue_wait.record(max(0.0, started - submitted))
+            self.hash_time.record(elapsed / hashes)
+        return result
+
+    def hash(self, password):
+        return self._result(*self._submit(generate_password_hash, password, self.method))
+
+    def verify(self, password_hash, password):
+        return self._result(*self._submit(check_password_hash, password_hash, password))
+
+    def hash_many(self, passwords, chunk_size=HASH_CHUNK_SIZE):
+        """Hashes a batch in parallel across the workers, in input order.
+
+        Waits for capacity instead of raising HasherBusy. hash_time is
+        recorded per password, queue_wait per chunk.
+        """
+        jobs = []
+        for start in range(0, len(passwords), chunk_size):
+            chunk = passwords[start:start + chunk_size]
+            self._bulk_slots.acquire()
+            try:
+                job = self._submit(_hash_all, chunk, self.method, wait=True)
+            except BaseException:
+                self._bulk_slots.release()
+                raise
+            job[1].add_done_callback(lambda _: self._bulk_slots.release())
+            jobs.append((job, len(chunk)))
+        hashes = []
+        for job, count in jobs:
+            hashes.extend(self._result(*job, hashes=count))
+        return hashes
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "method": self.method,
+                "workers": self.workers,
+                "rejected": self.rejected,
+                "queue_wait": self.queue_wait.summary(),
+                "hash_time": self.hash_time.summary(),
+            }
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+hasher = PasswordHasher()
+atexit.register(hasher.close)
@@ -0,0 +1,41 @@
+import argparse
+import json
+import sys
+import time
+import bulk_import
+import database
+import hashing
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk-load users from an NDJSON or CSV file straight into the database.")
+    parser.add_argument('input', help="file to import, or - for stdin")
+    parser.add_argument('--format', choices=bulk_import.FORMATS, help="default: from the file extension, else ndjson")
+    parser.add_argument('--database', default=database.DATABASE)
+    parser.add_argument('--batch-size', type=int, default=bulk_import.IMPORT_BATCH_SIZE, help="rows per transaction")
+    parser.add_argument('--workers', type=int, default=hashing.HASH_WORKERS, help="password hashing processes")
+    args = parser.parse_args()
+
+    database.DATABASE = args.database
+    # No sample users: they have well-known passwords
+    database.create_schema()
+    database.backfill_search_index()
+    fmt = args.format or ('csv' if args.input.endswith('.csv') else 'ndjson')
+    # Its own pool: the CLI doesn't share CPUs with request traffic, so it can queue as much as it likes
+    password_hasher = hashing.PasswordHasher(workers=args.workers)
+    started = time.time()
+
+    def progress(report):
+        elapsed = time.time() - started
+        print(f"{report.imported} imported, {report.invalid} invalid, {report.conflicts} conflicts "
+              f"({report.imported / elapsed:.0f} users/s)", file=sys.stderr)
+
+    source = open(args.input, 'rb') if args.input != '-' else sys.stdin.buffer
+    try:
+        report = bulk_import.import_users(
+            bulk_import.read_rows(source, fmt), args.batch_size, password_hasher, progress=progress,
+        )
+    finally:
+        password_hasher.close()
+        if args.input != '-':
+            source.close()
+    print(json.dumps(report.to_dict(), indent=2))
@@ -0,0 +1,14 @@
+import argparse
+import database
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create the full-text name search index and backfill it in batches.")
+    parser.add_argument('--batch-size', type=int, default=database.SEARCH_BACKFILL_BATCH)
+    args = parser.parse_args()
+
+    database.create_search_index()
+    indexed = database.backfill_search_index(
+        args.batch_size,
+        progress=lambda indexed, upto, target: print(f"Indexed {indexed} users (id {upto} of {target})"),
+    )
+    print(f"Search index ready ({indexed} existing users backfilled).")
@@ -0,0 +1,13 @@
+from marshmallow import Schema, fields, validate
+
+# Marshmallow Schema
+class UserSchema(Schema):
+    id = fields.Int(dump_only=True)
+    name = fields.Str(required=True, validate=validate.Length(min=1))
+    age = fields.Int(required=False, validate=validate.Range(min=1))
+    email = fields.Email(required=True)
+    password = fields.Str(required=True, load_only=True, validate=validate.Length(min=6))
+
+user_schema = UserSchema()
+user_update_schema = UserSchema(partial=True)
+users_schema = UserSchema(many=True)
@@ -3,7 +3,12 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from app import app
+import app as app_module
 import database
+import bulk_import
+import hashing
+import io
+import json
 import sqlite3
 import time
 
@@ -11,6 +16,8 @@ import time
 def client():
     # Use a separate test database for isolation
     app.config['TESTING'] = True
+    # Cheap KDF cost keeps the suite fast; production uses the PASSWORD_HASH_METHOD default
+    hashing.hasher.method = 'pbkdf2:sha256:1000'
     test_db_path = 'test_users.db'
 
     # Backup original DATABASE path and switch to test DB
@@ -37,6 +44,7 @@ def client():
     yield test_client
 
     # Tear down: close connections and remove test DB
+    database.close_pools()
     try:
         conn = sqlite3.connect(test_db_path)
         conn.close()
@@ -44,10 +52,12 @@ def client():
     except sqlite3.Error:
         pass
 
-    if os.path.exists(test_db_path):
+    for path in (test_db_path, test_db_path + '-wal', test_db_path + '-shm'):
+        if not os.path.exists(path):
+            continue
         for i in range(5):
             try:
-                os.remove(test_db_path)
+                os.remove(path)
                 break
             except PermissionError:
                 time.sleep(0.5)
@@ -238,3 +248,212 @@ def test_login_failure_nonexistent_email(client):
     assert response.status_code == 401
     assert response.json['status'] == "failed"
     assert "Invalid email or password" in response.json['message']
+
+
+def test_connection_pool_reuses_and_recovers(client):
+    pool = database.get_pool()
+    with database.get_db() as conn:
+        first = conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    # A failed query rolls back and the connection goes back to the pool
+    with pytest.raises(sqlite3.IntegrityError):
+        with database.get_db() as conn:
+            conn.execute("INSERT INTO users (name, email, password) VALUES ('Pool', 'pool@example.com', 'x')")
+            conn.execute("INSERT INTO users (name, email, password) VALUES ('Pool', 'pool@example.com', 'x')")
+    with database.get_db() as conn:
+        assert conn is first
+        assert conn.execute("SELECT COUNT(*) FROM users WHERE email = 'pool@example.com'").fetchone()[0] == 0
+    assert pool._opened <= database.POOL_SIZE
+
+
+def test_connection_pool_timeout():
+    pool = database.ConnectionPool(':memory:', max_size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(database.PoolTimeout):
+        pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    pool.release(conn, broken=True)
+    assert pool._opened == 0
+
+
+def test_get_users_keyset_pagination(client):
+    everyone = client.get('/users').json
+    first = client.get('/users?limit=2')
+    assert first.status_code == 200
+    assert [u['id'] for u in first.json] == [u['id'] for u in everyone[:2]]
+    next_after = first.headers['X-Next-After']
+    assert f'after={next_after}&limit=2' in first.headers['Link']
+
+    second = client.get(f'/users?limit=2&after={next_after}')
+    assert [u['id'] for u in second.json] == [u['id'] for u in everyone[2:4]]
+    last = client.get(f"/users?limit=1000&after={everyone[0]['id']}")
+    assert len(last.json) == len(everyone) - 1
+    assert 'X-Next-After' not in last.headers
+
+    assert client.get('/users?limit=0').status_code == 400
+    assert client.get('/users?after=abc').status_code == 400
+    assert client.get('/users?after=abc&limit=2').status_code == 400
+    assert client.get('/users?limit=abc').status_code == 400
+    assert client.get('/users?after=-1').status_code == 400
+    assert client.get('/users?format=xml').status_code == 400
+
+
+def test_get_users_streaming(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'STREAM_BATCH_SIZE', 2)
+    everyone = client.get('/users').json
+    assert [u['id'] for u in everyone] == sorted(u['id'] for u in everyone)
+
+    response = client.get('/users?format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines == everyone
+    assert 'password' not in lines[0]
+
+
+def test_search_ranking_prefix_and_sync(client):
+    for name, email in (("Malina Kovacs", "malina@example.com"), ("Lina", "lina@example.com"),
+                        ("Linares 100%", "linares@example.com")):
+        client.post('/users', json={"name": name, "email": email, "password": "pass1234"})
+
+    names = [u['name'] for u in client.get('/search?name=lina').json]
+    # Names starting with the query come first, then shorter names first
+    assert names[:2] == ["Lina", "Linares 100%"]
+    assert "Malina Kovacs" in names
+    assert [u['name'] for u in client.get('/search?name=lina&prefix=1').json] == ["Lina", "Linares 100%"]
+    assert [u['name'] for u in client.get('/search?name=00%25').json] == ["Linares 100%"]
+    assert client.get('/search?name=Lin%25&prefix=1').json == []  # LIKE wildcards in the query are literal
+    assert len(client.get('/search?name=lina&limit=1').json) == 1
+    assert client.get('/search?name=lina&limit=5000').status_code == 400
+    # Short queries still match anywhere in the name; only prefix=1 anchors them
+    assert "Malina Kovacs" in [u['name'] for u in client.get('/search?name=in').json]
+    assert "Malina Kovacs" not in [u['name'] for u in client.get('/search?name=in&prefix=1').json]
+
+    # Renames and deletes reach the index through the triggers
+    user_id = client.get('/search?name=Malina').json[0]['id']
+    client.put(f'/user/{user_id}', json={"name": "Marta Kovacs"})
+    assert client.get('/search?name=malina').json == []
+    assert client.get('/search?name=marta').json[0]['id'] == user_id
+    client.delete(f'/user/{user_id}')
+    assert client.get('/search?name=marta').json == []
+
+
+def test_search_index_backfill(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'legacy.db'))
+    with database.get_db() as conn:
+        # A database from before the search index existed
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, age INTEGER, "
+                     "email TEXT NOT NULL UNIQUE, password TEXT NOT NULL)")
+        conn.executemany("INSERT INTO users (name, email, password) VALUES (?, ?, 'x')",
+                         [(f"Legacy {i}", f"legacy{i}@example.com") for i in range(25)])
+    database.create_search_index()
+    with database.get_db() as conn:
+        assert not database.search_index_ready(conn)
+        # Writes during the migration: a new row, and a rename not yet backfilled
+        conn.execute("INSERT INTO users (name, email, password) VALUES ('Legacy new', 'new@example.com', 'x')")
+        conn.execute("UPDATE users SET name = 'Renamed' WHERE id = 20")
+    assert len(database.search_users_db('legacy')) == 25  # LIKE fallback until the backfill is done
+
+    batches = []
+    assert database.backfill_search_index(batch_size=10, progress=lambda *args: batches.append(args)) == 25
+    assert batches[-1] == (25, 25, 25)
+    with database.get_db() as conn:
+        assert database.search_index_ready(conn)
+        assert conn.execute("INSERT INTO users_fts(users_fts) VALUES ('integrity-check')").rowcount
+    assert len(database.search_users_db('legacy')) == 25
+    assert [u['id'] for u in database.search_users_db('renamed')] == [20]
+    database.close_pools()
+
+
+def test_search_ranks_late_prefix_matches(tmp_path, monkeypatch):
+    # A name starting with the query is ranked even after more substring matches than are ranked
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'ranking.db'))
+    monkeypatch.setattr(database, 'SEARCH_RANK_CANDIDATES', 10)
+    database.create_schema()
+    database.insert_users_db([(f"Carolina {i}", None, f"carolina{i}@example.com", "x") for i in range(50)]
+                             + [("Lina", None, "lina@example.com", "x")])
+    assert [u['name'] for u in database.search_users_db('lina', limit=3)][0] == "Lina"
+    database.close_pools()
+
+
+def test_create_schema_has_no_sample_users(tmp_path, monkeypatch):
+    # What import_users.py sets up: no seeded accounts with well-known passwords
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'import.db'))
+    database.create_schema()
+    assert database.find_existing_emails_db(['john@example.com']) == set()
+    assert database.insert_users_db([("Imported User", 33, "imported@example.com", "not-a-real-hash")]) == set()
+    with database.get_db() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+        assert database.search_index_ready(conn)
+    assert [u['name'] for u in database.search_users_db('imported')] == ["Imported User"]
+    database.close_pools()
+
+
+def test_password_hashing_runs_in_pool(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    stats = response.json['password_hashing']
+    assert stats['method'] == 'pbkdf2:sha256:1000'
+    assert stats['hash_time']['count'] > 0
+    assert stats['queue_wait']['p50_ms'] is not None
+
+    password_hash = hashing.hasher.hash('secret123')
+    assert password_hash.startswith('pbkdf2:sha256:1000$')
+    assert hashing.hasher.verify(password_hash, 'secret123')
+    assert not hashing.hasher.verify(password_hash, 'wrong')
+
+
+def test_password_hashing_saturated_returns_503(client, monkeypatch):
+    busy = hashing.PasswordHasher(workers=1, queue_size=0)
+    monkeypatch.setattr(app_module, 'hasher', busy)
+    assert busy._slots.acquire(blocking=False)  # The only slot is taken
+    response = client.post('/login', json={"email": "john@example.com", "password": "password123"})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    response = client.post('/users', json={"name": "Busy", "email": "busy@example.com", "password": "password123"})
+    assert response.status_code == 503
+    assert busy.stats()['rejected'] == 2
+
+
+def test_bulk_import_ndjson(client):
+    prehashed = hashing.hasher.hash('migrated1')
+    lines = [
+        {"name": "Bulk One", "email": "bulk1@example.com", "password": "password1", "age": 20},
+        {"name": "Bulk Two", "email": "bulk2@example.com", "password_hash": prehashed},
+        {"name": "", "email": "not-an-email", "password": "x"},
+        {"name": "Bulk Dup", "email": "bulk1@example.com", "password": "password1"},
+        {"name": "Existing", "email": "john@example.com", "password": "password1"},
+        {"name": "Bad Hash", "email": "bulk3@example.com", "password_hash": "plaintext"},
+    ]
+    body = '\n'.join(json.dumps(line) for line in lines) + '\nnot json\n'
+    response = client.post('/users/import', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    report = response.json
+    assert (report['imported'], report['invalid'], report['conflicts']) == (2, 3, 2)
+    assert [row['line'] for row in report['errors']] == [3, 6, 7]
+    assert report['conflicting'] == [{"line": 4, "email": "bulk1@example.com"}, {"line": 5, "email": "john@example.com"}]
+
+    login = client.post('/login', json={"email": "bulk2@example.com", "password": "migrated1"})
+    assert login.status_code == 200
+    assert client.get('/search?name=Bulk One').json[0]['age'] == 20
+
+
+def test_bulk_import_csv_batches(client):
+    rows = ["name,email,password,age"] + [f"Csv {i},csv{i}@example.com,password{i},{i % 3 or ''}" for i in range(7)]
+    rows.append("Too,many,fields,1,2")
+    data = '\n'.join(rows).encode()
+    report = bulk_import.import_users(bulk_import.read_rows(io.BytesIO(data), 'csv'), batch_size=3)
+    assert report.imported == 7
+    assert report.errors[0]['line'] == 9
+    assert client.get('/search?name=Csv 3').json[0]['age'] is None
+
+    # Importing the same file again only reports conflicts
+    response = client.post('/users/import', data=data, content_type='text/csv')
+    assert (response.json['imported'], response.json['conflicts']) == (0, 7)
+    assert client.post('/users/import?format=xml', data='').status_code == 400
+
+
+def test_hash_many_keeps_order(client):
+    passwords = [f"password{i}" for i in range(5)]
+    hashes = hashing.hasher.hash_many(passwords, chunk_size=2)
+    assert all(hashing.hasher.verify(h, p) for h, p in zip(hashes, passwords))
@@ -0,0 +1,164 @@
+# allocators.py
+# Short code allocators used by URLStore. An allocator only proposes candidate
+# codes; URLStore reserves them atomically under its own lock, so collisions
+# (e.g. with imported codes) are simply retried with the next candidate.
+import hashlib
+import os
+import threading
+from collections import deque
+
+from app.utils import SHORT_CODE_SPACE, encode_base62, random_short_code
+
+class CodeAllocator:
+    """
+    Base class for short code allocators.
+    Subclasses must implement next_code(), which has to be thread-safe.
+    """
+
+    def next_code(self) -> str:
+        raise NotImplementedError
+
+    def resume(self, issued: int):
+        """Called after a restart with the number of links already stored."""
+
+    def close(self):
+        """Releases any background resources held by the allocator."""
+
+class RandomCodeAllocator(CodeAllocator):
+    """
+    Proposes uniformly random codes. This is the original behaviour; the
+    uniqueness check is an O(1) membership test done by the store.
+    """
+
+    def next_code(self) -> str:
+        return random_short_code()
+
+class CounterCodeAllocator(CodeAllocator):
+    """
+    Maps a monotonically increasing counter through a keyed permutation of
+    [0, 62^6) and encodes the result in base62.
+
+    The permutation is a 4-round Feistel network over 36 bits keyed with
+    BLAKE2b, with cycle-walking to stay inside the code space. Because it is a
+    bijection, every counter value yields a distinct code, so allocation never
+    collides until the space is exhausted; because it is keyed, consecutive
+    codes look unrelated and cannot be guessed without the secret.
+    """
+
+    _HALF_BITS = 18
+    _HALF_MASK = (1 << _HALF_BITS) - 1
+    _ROUNDS = 4
+
+    def __init__(self, secret: bytes = None, start: int = 0):
+        self._key = secret or os.urandom(16)
+        self._counter = start
+        self._lock = threading.Lock()
+
+    def next_code(self) -> str:
+        with self._lock:
+            if self._counter >= SHORT_CODE_SPACE:
+                raise RuntimeError("Short code space exhausted")
+            value = self._counter
+            self._counter += 1
+        return encode_base62(self.permute(value))
+
+    @property
+    def counter(self) -> int:
+        return self._counter
+
+    def resume(self, issued: int):
+        # Skip past counter values already used before a restart. Codes that
+        # were created elsewhere are still caught by the store's retry.
+        with self._lock:
+            self._counter = max(self._counter, issued)
+
+    def permute(self, value: int) -> int:
+        # Cycle-walk: the 36-bit Feistel domain is slightly larger than 62^6,
+        # so re-encrypt until the result lands inside the code space.
+        while True:
+            value = self._feistel(value)
+            if value < SHORT_CODE_SPACE:
+                return value
+
+    def _feistel(self, value: int) -> int:
+        left = value >> self._HALF_BITS
+        right = value & self._HALF_MASK
+        for round_number in range(self._ROUNDS):
+            left, right = right, left ^ self._round(round_number, right)
+        return (left << self._HALF_BITS) | right
+
+    def _round(self, round_number: int, half: int) -> int:
+        digest = hashlib.blake2b(
+            bytes((round_number,)) + half.to_bytes(3, "big"),
+            key=self._key,
+            digest_size=4,
+        ).digest()
+        return int.from_bytes(digest, "big") & self._HALF_MASK
+
+class PooledCodeAllocator(CodeAllocator):
+    """
+    Hands out codes from a pre-generated pool of random codes.
+    A background thread tops the pool up whenever it drops below the low
+    watermark, so the request path only pops from a deque. If the pool is
+    drained faster than it refills, a code is generated inline instead.
+    """
+
+    def __init__(self, pool_size: int = 10000, low_watermark: float = 0.25):
+        self.pool_size = pool_size
+        self.low_watermark = max(1, int(pool_size * low_watermark))
+        self._pool = deque()
+        self._pooled = set()  # Avoids handing out the same code twice from one pool
+        self._lock = threading.Lock()
+        self._refill_needed = threading.Event()
+        self._stopped = threading.Event()
+        self._refill()
+        self._thread = threading.Thread(target=self._refill_loop, name="code-pool-refill", daemon=True)
+        self._thread.start()
+
+    def next_code(self) -> str:
+        with self._lock:
+            if self._pool:
+                code = self._pool.popleft()
+                self._pooled.discard(code)
+            else:
+                code = None
+            if len(self._pool) < self.low_watermark:
+                self._refill_needed.set()
+        return code if code is not None else random_short_code()
+
+    def __len__(self):
+        return len(self._pool)
+
+    def close(self):
+        self._stopped.set()
+        self._refill_needed.set()
+        self._thread.join(timeout=1)
+
+    def _refill(self):
+        # Generate outside the lock and publish in one step
+        missing = self.pool_size - len(self._pool)
+        fresh = [random_short_code() for _ in range(max(0, missing))]
+        with self._lock:
+            for code in fresh:
+                if code not in self._pooled:
+                    self._pooled.add(code)
+                    self._pool.append(code)
+
+    def _refill_loop(self):
+        while not self._stopped.is_set():
+            self._refill_needed.wait()
+            self._refill_needed.clear()
+            if not self._stopped.is_set():
+                self._refill()
+
+def make_allocator(kind: str, secret: str = "", pool_size: int = 10000) -> CodeAllocator:
+    """
+    Builds an allocator from its configuration name.
+    """
+    if kind == "random":
+        return RandomCodeAllocator()
+    if kind == "counter":
+        return CounterCodeAllocator(secret=secret.encode() if secret else None)
+    if kind == "pool":
+        return PooledCodeAllocator(pool_size=pool_size)
+    raise ValueError(f"Unknown short code allocator: {kind!r}")
@@ -0,0 +1,127 @@
+# analytics.py
+# Time-bucketed click counts per link, kept in fixed-size ring buffers.
+import threading
+import time
+from array import array
+
+# (name, bucket width in seconds, number of buckets kept). Every click updates
+# one bucket per tier, so finer tiers cover short windows and coarser tiers
+# cover long ones while memory per link stays fixed.
+TIERS = (
+    ("minute", 60, 60),      # last hour, per minute
+    ("hour", 3600, 48),      # last two days, per hour
+    ("day", 86400, 30),      # last 30 days, per day
+)
+TIER_BY_NAME = {name: (index, width, size) for index, (name, width, size) in enumerate(TIERS)}
+# Window suffixes accepted by parse_window()
+WINDOW_UNITS = {"m": "minute", "h": "hour", "d": "day"}
+
+class LinkWindows:
+    """
+    Ring buffers for one link. 'heads' holds the newest bucket number written
+    per tier; buckets between the old and new head are zeroed lazily when the
+    head advances, so an update costs O(1) amortised.
+    """
+
+    __slots__ = ("counts", "heads")
+
+    def __init__(self):
+        self.counts = [array("I", bytes(4 * size)) for _, _, size in TIERS]
+        self.heads = [0] * len(TIERS)
+
+    def add(self, now: float, amount: int = 1):
+        for tier, (_, width, size) in enumerate(TIERS):
+            bucket = int(now // width)
+            self._advance(tier, bucket, size)
+            self.counts[tier][bucket % size] += amount
+
+    def series(self, tier: int, buckets: int, now: float) -> list:
+        """
+        Returns the last 'buckets' bucket counts of a tier, oldest first.
+        """
+        _, width, size = TIERS[tier]
+        current = int(now // width)
+        head = self.heads[tier]
+        counts = self.counts[tier]
+        result = []
+        for bucket in range(current - buckets + 1, current + 1):
+            # Only buckets within 'size' of the head still hold live data
+            live = head - size < bucket <= head
+            result.append(counts[bucket % size] if live else 0)
+        return result
+
+    def _advance(self, tier: int, bucket: int, size: int):
+        head = self.heads[tier]
+        if bucket <= head:
+            return
+        counts = self.counts[tier]
+        for stale in range(max(head + 1, bucket - size + 1), bucket + 1):
+            counts[stale % size] = 0
+        self.heads[tier] = bucket
+
+class ClickAnalytics:
+    """
+    Per-link windowed click counters. Links get their ring buffers on their
+    first click; updates for different links use striped locks.
+    """
+
+    def __init__(self, num_locks: int = 64, clock=time.time):
+        self.clock = clock
+        self._windows = {}
+        self._locks = [threading.Lock() for _ in range(num_locks)]
+
+    def record(self, short_code: str, amount: int = 1):
+        now = self.clock()
+        with self._locks[hash(short_code) % len(self._locks)]:
+            windows = self._windows.get(short_code)
+            if windows is None:
+                windows = self._windows[short_code] = LinkWindows()
+            windows.add(now, amount)
+
+    def window(self, short_code: str, unit: str, buckets: int) -> dict:
+        """
+        Returns the click series for the last 'buckets' units of 'unit'
+        ("minute", "hour" or "day") together with its total.
+        """
+        tier, width, size = TIER_BY_NAME[unit]
+        if not 1 <= buckets <= size:
+            raise ValueError(f"A {unit} window covers 1 to {size} buckets")
+        now = self.clock()
+        with self._locks[hash(short_code) % len(self._locks)]:
+            windows = self._windows.get(short_code)
+            series = windows.series(tier, buckets, now) if windows else [0] * buckets
+        return {
+            "unit": unit,
+            "buckets": series,
+            "total": sum(series),
+            "start": (int(now // width) - buckets + 1) * width,
+        }
+
+    def discard(self, short_code: str):
+        with self._locks[hash(short_code) % len(self._locks)]:
+            self._windows.pop(short_code, None)
+
+    def on_store_invalidated(self, short_code):
+        # Store invalidation hook: clicks belong to the link's current mapping
+        if short_code is None:
+            self.clear()
+        else:
+            self.discard(short_code)
+
+    def clear(self):
+        self._windows.clear()
+
+def parse_window(value: str):
+    """
+    Parses a window such as "60m", "24h" or "30d" into (unit, buckets).
+    Raises ValueError if the format or size is not supported.
+    """
+    value = (value or "").strip().lower()
+    unit = WINDOW_UNITS.get(value[-1:])
+    if unit is None or not value[:-1].isdigit():
+        raise ValueError("window must look like 60m, 24h or 30d")
+    buckets = int(value[:-1])
+    size = TIER_BY_NAME[unit][2]
+    if not 1 <= buckets <= size:
+        raise ValueError(f"window for unit {value[-1]} must be between 1 and {size}")
+    return unit, buckets
@@ -0,0 +1,300 @@
+# asgi.py
+# ASGI entry point. The shorten, redirect and stats routes run natively on the
+# event loop using the same service functions and store as the Flask app;
+# every other route is handed to the Flask app on a worker thread.
+#
+# Serve with any ASGI server, e.g.:
+#   uvicorn app.asgi:app
+# or select it with SHORTENER_SERVER_MODE=asgi and run python -m app.serve.
+import asyncio
+import contextvars
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from werkzeug.utils import redirect as build_redirect
+
+from app import config
+from app.main import app as flask_app, redirect_cache
+from app.metrics import route_name
+from app.models import metrics, unique_visitors
+from app.service import find_link, link_expires_at, link_stats, shorten_link, track_redirect, visitor_fingerprint
+
+class ShortenerASGI:
+    """
+    ASGI application for the URL shortener.
+
+    Store access on the event loop: lookups, click recording and stats are
+    in-memory operations that hold a lock for microseconds and never wait on
+    I/O, so they run inline. Creating a link can wait for a durable log
+    commit (SHORTENER_LOG_SYNC_WRITES), so it runs on the thread pool, as
+    does the WSGI fallback. A slow client therefore only costs a coroutine,
+    not a thread.
+    """
+
+    def __init__(self, wsgi_app, max_threads: int = 32, max_body: int = 1024 * 1024):
+        self.wsgi_app = wsgi_app
+        self.max_body = max_body
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="asgi-worker")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        # Same matches as the Flask URL rules for these endpoints
+        route = route_name(scope["method"], path)
+        if route is None:
+            await self._call_wsgi(scope, receive, send)
+            return
+        started = time.perf_counter_ns()
+        try:
+            if route == "shorten_url":
+                await self._shorten(scope, receive, send)
+            elif route == "get_url_stats":
+                await self._stats(scope, send, path[len("/api/stats/"):])
+            else:
+                await self._redirect(scope, send, path[1:])
+        finally:
+            if metrics is not None:
+                metrics.observe(route, time.perf_counter_ns() - started)
+
+    # --- native routes ----------------------------------------------------
+
+    async def _shorten(self, scope, receive, send):
+        body = await self._read_body(receive)
+        if body is None:
+            await _send_json(send, 413, {"error": "Request body too large."})
+            return
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        loop = asyncio.get_running_loop()
+        try:
+            # May block on the durable log commit, so keep it off the event loop
+            short_code, created, expires_at = await loop.run_in_executor(self.executor, shorten_link, data)
+        except ValueError as error:
+            await _send_json(send, 400, {"error": str(error)})
+            return
+
+        result = {
+            "short_code": short_code,
+            "short_url": _base_url(scope) + short_code
+        }
+        if expires_at is not None:
+            result["expires_at"] = datetime.fromtimestamp(expires_at).isoformat()
+        await _send_json(send, 201 if created else 200, result)
+
+    async def _redirect(self, scope, send, short_code):
+        if redirect_cache is not None:
+            entry = redirect_cache.get(short_code)
+            if entry is not None:
+                track_redirect(short_code, _visitor(scope))
+                await _send_cached(send, entry)
+                return
+            cache_token = redirect_cache.token()
+
+        url_info = find_link(short_code)
+        if not url_info:
+            await _send_json(send, 404, {"error": "Resource not found."})
+            return
+        track_redirect(short_code, _visitor(scope))
+
+        response = build_redirect(url_info["original_url"])
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": _asgi_headers(response.headers.to_wsgi_list()),
+        })
+        await send({"type": "http.response.body", "body": response.get_data()})
+        if redirect_cache is not None:
+            redirect_cache.put(short_code, response, cache_token, expires_at=link_expires_at(short_code))
+
+    async def _stats(self, scope, send, short_code):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        window = query.get("window", [None])[0]
+        try:
+            stats = link_stats(short_code, window)
+        except ValueError as error:
+            await _send_json(send, 400, {"error": str(error)})
+            return
+        if stats is None:
+            await _send_json(send, 404, {"error": "Resource not found."})
+            return
+        await _send_json(send, 200, stats)
+
+    # --- helpers ----------------------------------------------------------
+
+    async def _read_body(self, receive):
+        # Returns the request body, or None if it exceeds max_body
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    async def _call_wsgi(self, scope, receive, send):
+        """
+        Runs the Flask app for routes without a native handler. The request
+        body is read from receive() as the app consumes it and the response
+        body is pulled chunk by chunk on the thread pool, so streamed NDJSON
+        uploads and responses are never held in memory whole.
+        """
+        loop = asyncio.get_running_loop()
+        environ = _wsgi_environ(scope, io.BufferedReader(_ReceiveStream(receive, loop)))
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = _asgi_headers(headers)
+
+        # Every step runs in one context: Flask's request context lives in
+        # context variables and is pushed and popped by different steps, which
+        # may land on different pool threads
+        context = contextvars.copy_context()
+
+        def run(fn, *args):
+            return loop.run_in_executor(self.executor, context.run, fn, *args)
+
+        result = await run(self.wsgi_app, environ, start_response)
+        iterator = iter(result)
+        try:
+            chunk = await run(next, iterator, None)
+            await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+            while chunk is not None:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                chunk = await run(next, iterator, None)
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                await run(result.close)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+class _ReceiveStream(io.RawIOBase):
+    """
+    Request body for the WSGI fallback. Read on a pool thread, it waits for
+    each http.request message on the event loop as the app asks for more.
+    A client disconnect ends the body.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._chunk = b""
+        self._offset = 0
+        self._done = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self._offset >= len(self._chunk):
+            if self._done:
+                return 0
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message["type"] == "http.disconnect":
+                self._done = True
+                continue
+            self._chunk = message.get("body", b"")
+            self._offset = 0
+            self._done = not message.get("more_body", False)
+        size = min(len(buffer), len(self._chunk) - self._offset)
+        buffer[:size] = self._chunk[self._offset:self._offset + size]
+        self._offset += size
+        return size
+
+def _asgi_headers(headers) -> list:
+    # WSGI (name, value) string pairs to ASGI byte pairs
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+def _base_url(scope) -> str:
+    # Short URLs point back at the host the client used
+    headers = dict(scope.get("headers", []))
+    host = headers.get(b"host", b"").decode("latin-1") or flask_app.config.get("SERVER_NAME") or "localhost"
+    return f"{scope.get('scheme', 'http')}://{host}{scope.get('root_path', '')}/"
+
+def _visitor(scope):
+    if unique_visitors is None:
+        return None
+    client = scope.get("client")
+    user_agent = None
+    for name, value in scope.get("headers", []):
+        if name == b"user-agent":
+            user_agent = value.decode("latin-1")
+            break
+    return visitor_fingerprint(client[0] if client else None, user_agent)
+
+def _wsgi_environ(scope, body) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        # The body ends where the ASGI server says it does, with or without a
+        # Content-Length (e.g. chunked uploads)
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+            continue
+        key = "HTTP_" + name
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+async def _send_json(send, status: int, body: dict):
+    payload = json.dumps(body).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": payload})
+
+async def _send_cached(send, entry):
+    await send({
+        "type": "http.response.start",
+        "status": int(entry.status.split(" ", 1)[0]),
+        "headers": _asgi_headers(entry.headers),
+    })
+    await send({"type": "http.response.body", "body": entry.body})
+
+app = ShortenerASGI(flask_app, max_threads=config.ASGI_THREADS, max_body=config.ASGI_MAX_BODY)
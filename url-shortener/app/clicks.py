@@ -0,0 +1,182 @@
+# clicks.py
+# Click counting strategies for the redirect path.
+import threading
+
+class DirectClickCounter:
+    """
+    Increments the store directly on every click (the original behaviour).
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def record(self, short_code: str):
+        self.store.increment_clicks(short_code)
+
+    def get_clicks(self, short_code: str):
+        url_info = self.store.get_url_info(short_code)
+        return url_info["clicks"] if url_info else None
+
+    def get_many(self, short_codes) -> dict:
+        return self.store.get_many(short_codes)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def on_store_invalidated(self, short_code):
+        pass
+
+class _ThreadBuffer:
+    __slots__ = ("lock", "counts", "size", "thread")
+
+    def __init__(self):
+        # Only contended while the flusher swaps this buffer out
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.size = 0
+        self.thread = threading.current_thread()
+
+class ClickBuffer:
+    """
+    Write-behind click counter.
+
+    Each thread counts clicks into its own buffer, so the redirect path never
+    touches the shared store for writes. A background thread merges all
+    buffers into the store every 'flush_interval' seconds, or sooner when a
+    buffer reaches 'flush_threshold' pending clicks. get_clicks() folds the
+    unflushed deltas back in, so reported counts stay exact.
+    """
+
+    def __init__(self, store, flush_interval: float = 1.0, flush_threshold: int = 1000):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._local = threading.local()
+        self._buffers = []
+        self._registry_lock = threading.Lock()
+        # Held while buffers are moved into the store so readers never see a
+        # click in both places (or in neither)
+        self._flush_lock = threading.Lock()
+        # Codes invalidated while a flush is merging (None in it: all codes);
+        # None when no flush is running
+        self._invalidated = None
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, name="click-flusher", daemon=True)
+        self._thread.start()
+
+    def record(self, short_code: str):
+        buffer = self._buffer()
+        with buffer.lock:
+            buffer.counts[short_code] = buffer.counts.get(short_code, 0) + 1
+            buffer.size += 1
+            full = buffer.size >= self.flush_threshold
+        if full:
+            self._flush_requested.set()
+
+    def get_clicks(self, short_code: str):
+        """
+        Returns the exact click count (stored + pending), or None if the short
+        code does not exist.
+        """
+        with self._flush_lock:
+            url_info = self.store.get_url_info(short_code)
+            if not url_info:
+                return None
+            return url_info["clicks"] + self.pending(short_code)
+
+    def get_many(self, short_codes) -> dict:
+        """
+        Like store.get_many(), with pending clicks folded into each count.
+        """
+        with self._flush_lock:
+            found = self.store.get_many(short_codes)
+            for buffer in self._snapshot_buffers():
+                with buffer.lock:
+                    for short_code in found:
+                        delta = buffer.counts.get(short_code)
+                        if delta:
+                            original_url, clicks, created_at = found[short_code]
+                            found[short_code] = (original_url, clicks + delta, created_at)
+        return found
+
+    def pending(self, short_code: str) -> int:
+        total = 0
+        for buffer in self._snapshot_buffers():
+            with buffer.lock:
+                total += buffer.counts.get(short_code, 0)
+        return total
+
+    def flush(self):
+        with self._flush_lock:
+            with self._registry_lock:
+                self._invalidated = set()
+            merged = {}
+            for buffer in self._snapshot_buffers():
+                with buffer.lock:
+                    counts, buffer.counts, buffer.size = buffer.counts, {}, 0
+                for short_code, delta in counts.items():
+                    merged[short_code] = merged.get(short_code, 0) + delta
+            with self._registry_lock:
+                invalidated, self._invalidated = self._invalidated, None
+            if None in invalidated:
+                merged.clear()
+            for short_code in invalidated:
+                merged.pop(short_code, None)
+            if merged:
+                self.store.add_clicks(merged)
+            self._prune_dead_buffers()
+
+    def on_store_invalidated(self, short_code):
+        """
+        Store invalidation hook: pending clicks belong to the link's old
+        mapping, so they are dropped for 'short_code', or for every code when
+        it is None. Called under the store's lock, so it never waits for a
+        flush; a running flush drops the code from what it has merged instead.
+        """
+        for buffer in self._snapshot_buffers():
+            with buffer.lock:
+                if short_code is None:
+                    buffer.counts, buffer.size = {}, 0
+                else:
+                    buffer.size -= buffer.counts.pop(short_code, 0)
+        with self._registry_lock:
+            if self._invalidated is not None:
+                self._invalidated.add(short_code)
+
+    def close(self):
+        self._stopped.set()
+        self._flush_requested.set()
+        self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    def _buffer(self) -> _ThreadBuffer:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = _ThreadBuffer()
+            with self._registry_lock:
+                self._buffers.append(buffer)
+        return buffer
+
+    def _snapshot_buffers(self):
+        with self._registry_lock:
+            return list(self._buffers)
+
+    def _prune_dead_buffers(self):
+        # Caller holds self._flush_lock, so dead threads' buffers are empty here
+        with self._registry_lock:
+            self._buffers = [b for b in self._buffers if b.thread.is_alive() or b.counts]
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            self.flush()
+
+def create_click_counter(store, buffered: bool, flush_interval: float = 1.0, flush_threshold: int = 1000):
+    if buffered:
+        return ClickBuffer(store, flush_interval=flush_interval, flush_threshold=flush_threshold)
+    return DirectClickCounter(store)
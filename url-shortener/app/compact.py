@@ -0,0 +1,423 @@
+# compact.py
+# Memory-compact URL store. Instead of one Python dict per link, every field
+# lives in a typed array indexed by row number:
+#
+#   _codes       array('q')  short code encoded as a base62 integer
+#   _offsets     array('Q')  start of the URL in the byte arena
+#   _lengths     array('I')  URL length in bytes
+#   _clicks      array('Q')  click count
+#   _created_at  array('d')  creation timestamp
+#   _arena       bytearray   UTF-8 URL bytes, back to back
+#
+# Lookups go through an open-addressing hash table (array('q') of row + 1,
+# 0 = empty) keyed by the integer code. A link costs roughly 50 bytes plus its
+# URL, compared to several hundred bytes for the dict-per-link layout.
+#
+# Deleted rows are marked with a negative code and reused by later inserts, so
+# rows never move under a running iter_entries(). URL bytes left behind by
+# deletes and overwrites are counted as garbage and the arena is rewritten
+# once garbage makes up half of it.
+import threading
+import time
+from array import array
+
+from app.allocators import RandomCodeAllocator
+from app.utils import ALPHANUMERIC_CHARS, SHORT_CODE_LENGTH, decode_base62, encode_base62
+
+_EMPTY = 0
+# Code column value of a deleted row
+_DELETED = -1
+# Fibonacci hashing spreads sequential integers across the table
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK_64 = (1 << 64) - 1
+_MAX_LOAD = 0.6
+# Column bytes per row: code, offset, length, clicks, created_at
+_ROW_BYTES = 8 + 8 + 4 + 8 + 8
+
+class URLRecord:
+    """
+    Read-only view of one stored link, handed to the API layer.
+    Supports item access (record["clicks"]) so it can stand in for the dict
+    entries returned by URLStore.get_url_info().
+    """
+
+    __slots__ = ("short_code", "original_url", "clicks", "created_at")
+
+    _FIELDS = ("original_url", "clicks", "created_at")
+
+    def __init__(self, short_code: str, original_url: str, clicks: int, created_at: float):
+        self.short_code = short_code
+        self.original_url = original_url
+        self.clicks = clicks
+        self.created_at = created_at
+
+    def __getitem__(self, key):
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._FIELDS else default
+
+    def __repr__(self):
+        return f"URLRecord({self.short_code!r}, {self.original_url!r}, clicks={self.clicks})"
+
+def encode_code(short_code: str):
+    """
+    Returns the integer key for a short code, or None if the code cannot be
+    stored compactly (only SHORT_CODE_LENGTH alphanumeric codes can).
+    """
+    if not isinstance(short_code, str) or len(short_code) != SHORT_CODE_LENGTH:
+        return None
+    try:
+        return decode_base62(short_code)
+    except ValueError:
+        return None
+
+class CompactURLStore:
+    """
+    Array-backed store with the same API as URLStore. Only 6-character
+    alphanumeric short codes are accepted. Replacing a URL with add_url()
+    leaves the old bytes in the arena until a delete triggers compaction.
+    """
+
+    def __init__(self, allocator=None, journal=None, capacity: int = 1024):
+        self.lock = threading.Lock()
+        self.allocator = allocator or RandomCodeAllocator()
+        self.journal = journal
+        self.code_filter = None
+        self.invalidation_hooks = []
+        self._init_storage(capacity)
+
+    def _init_storage(self, capacity: int):
+        size = 1
+        while size * _MAX_LOAD < capacity:
+            size *= 2
+        self._table = array("q", bytes(8 * size))
+        self._codes = array("q")
+        self._offsets = array("Q")
+        self._lengths = array("I")
+        self._clicks = array("Q")
+        self._created_at = array("d")
+        self._arena = bytearray()
+        # Arena bytes no longer referenced by any row
+        self._garbage = 0
+        # Deleted rows waiting to be reused
+        self._free_rows = array("q")
+
+    # --- hash table -------------------------------------------------------
+
+    def _home(self, key: int) -> int:
+        return ((key * _HASH_MULTIPLIER) & _MASK_64) >> 20 & (len(self._table) - 1)
+
+    def _slot(self, key: int) -> int:
+        mask = len(self._table) - 1
+        slot = self._home(key)
+        table = self._table
+        codes = self._codes
+        while True:
+            row = table[slot]
+            if row == _EMPTY or codes[row - 1] == key:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _find_row(self, key: int) -> int:
+        # Caller holds self.lock. Returns the row index or -1.
+        row = self._table[self._slot(key)]
+        return row - 1 if row != _EMPTY else -1
+
+    def _grow(self):
+        old_rows = len(self._codes)
+        self._table = array("q", bytes(8 * len(self._table) * 2))
+        for row in range(old_rows):
+            if self._codes[row] != _DELETED:
+                self._table[self._slot(self._codes[row])] = row + 1
+
+    def _unlink_slot(self, slot: int):
+        # Caller holds self.lock. Empties a slot and shifts later entries of the
+        # probe run back (linear probing needs no tombstones this way).
+        table = self._table
+        codes = self._codes
+        mask = len(table) - 1
+        table[slot] = _EMPTY
+        probe = (slot + 1) & mask
+        while table[probe] != _EMPTY:
+            home = self._home(codes[table[probe] - 1])
+            # Move the entry into the hole unless the hole lies before its home
+            if (probe - home) & mask >= (probe - slot) & mask:
+                table[slot] = table[probe]
+                table[probe] = _EMPTY
+                slot = probe
+            probe = (probe + 1) & mask
+
+    # --- storage ----------------------------------------------------------
+
+    def _put(self, key: int, original_url: str, clicks: int, created_at: float):
+        # Caller holds self.lock. Inserts a new row or overwrites an existing one.
+        if self.code_filter is not None:
+            self.code_filter.add(encode_base62(key))
+        encoded = original_url.encode()
+        slot = self._slot(key)
+        row = self._table[slot] - 1
+        if row >= 0:
+            for hook in self.invalidation_hooks:
+                hook(encode_base62(key))
+            self._garbage += self._lengths[row]
+            self._offsets[row] = len(self._arena)
+            self._lengths[row] = len(encoded)
+            self._clicks[row] = clicks
+            self._created_at[row] = created_at
+        elif self._free_rows:
+            row = self._free_rows.pop()
+            self._codes[row] = key
+            self._offsets[row] = len(self._arena)
+            self._lengths[row] = len(encoded)
+            self._clicks[row] = clicks
+            self._created_at[row] = created_at
+            self._table[slot] = row + 1
+        else:
+            if (len(self._codes) + 1) > len(self._table) * _MAX_LOAD:
+                self._grow()
+                slot = self._slot(key)
+            row = len(self._codes)
+            self._codes.append(key)
+            self._offsets.append(len(self._arena))
+            self._lengths.append(len(encoded))
+            self._clicks.append(clicks)
+            self._created_at.append(created_at)
+            self._table[slot] = row + 1
+        self._arena += encoded
+
+    def _record(self, row: int) -> URLRecord:
+        offset = self._offsets[row]
+        return URLRecord(
+            encode_base62(self._codes[row]),
+            self._arena[offset:offset + self._lengths[row]].decode(),
+            self._clicks[row],
+            self._created_at[row],
+        )
+
+    def _insert(self, key: int, short_code: str, original_url: str):
+        # Caller holds self.lock. Returns the journal sequence number, if any.
+        created_at = time.time()
+        self._put(key, original_url, 0, created_at)
+        if self.journal is not None:
+            return self.journal.log_shorten(short_code, original_url, created_at)
+        return None
+
+    def _wait_durable(self, seq):
+        if seq is not None and self.journal.sync_writes:
+            self.journal.wait_durable(seq)
+
+    @staticmethod
+    def _require_key(short_code: str) -> int:
+        key = encode_code(short_code)
+        if key is None:
+            raise ValueError(
+                f"CompactURLStore only stores {SHORT_CODE_LENGTH}-character codes from {ALPHANUMERIC_CHARS!r}"
+            )
+        return key
+
+    # --- URLStore API -----------------------------------------------------
+
+    def create_url(self, original_url: str) -> str:
+        with self.lock:
+            while True:
+                short_code = self.allocator.next_code()
+                key = self._require_key(short_code)
+                if self._find_row(key) < 0:
+                    break
+            seq = self._insert(key, short_code, original_url)
+        self._wait_durable(seq)
+        return short_code
+
+    def create_urls(self, original_urls: list) -> list:
+        with self.lock:
+            created = []
+            for original_url in original_urls:
+                while True:
+                    short_code = self.allocator.next_code()
+                    key = self._require_key(short_code)
+                    if self._find_row(key) < 0:
+                        break
+                self._put(key, original_url, 0, time.time())
+                created.append(short_code)
+            seq = self._record_created(created)
+        self._wait_durable(seq)
+        return created
+
+    def insert_many(self, mappings: list) -> set:
+        taken = set()
+        with self.lock:
+            inserted = []
+            for short_code, original_url in mappings:
+                key = self._require_key(short_code)
+                if self._find_row(key) >= 0:
+                    taken.add(short_code)
+                else:
+                    self._put(key, original_url, 0, time.time())
+                    inserted.append(short_code)
+            seq = self._record_created(inserted)
+        self._wait_durable(seq)
+        return taken
+
+    def _record_created(self, short_codes: list):
+        # Caller holds self.lock. Logs a batch of new links as one event.
+        # (The code filter was already updated by _put.)
+        if self.journal is None or not short_codes:
+            return None
+        entries = []
+        for short_code in short_codes:
+            record = self._record(self._find_row(encode_code(short_code)))
+            entries.append((short_code, record.original_url, record.created_at))
+        return self.journal.log_shortens(entries)
+
+    def try_insert(self, short_code: str, original_url: str) -> bool:
+        key = self._require_key(short_code)
+        with self.lock:
+            if self._find_row(key) >= 0:
+                return False
+            seq = self._insert(key, short_code, original_url)
+        self._wait_durable(seq)
+        return True
+
+    def add_url(self, short_code: str, original_url: str):
+        key = self._require_key(short_code)
+        with self.lock:
+            seq = self._insert(key, short_code, original_url)
+        self._wait_durable(seq)
+
+    def load_entries(self, entries):
+        with self.lock:
+            for short_code, original_url, clicks, created_at in entries:
+                self._put(self._require_key(short_code), original_url, clicks, created_at)
+
+    def get_url_info(self, short_code: str):
+        key = encode_code(short_code)
+        if key is None:
+            return None
+        with self.lock:
+            row = self._find_row(key)
+            return self._record(row) if row >= 0 else None
+
+    def get_many(self, short_codes) -> dict:
+        found = {}
+        with self.lock:
+            for short_code in short_codes:
+                key = encode_code(short_code)
+                row = self._find_row(key) if key is not None else -1
+                if row >= 0:
+                    offset = self._offsets[row]
+                    found[short_code] = (
+                        self._arena[offset:offset + self._lengths[row]].decode(),
+                        self._clicks[row],
+                        self._created_at[row],
+                    )
+        return found
+
+    def increment_clicks(self, short_code: str):
+        return bool(self.add_clicks({short_code: 1}))
+
+    def add_clicks(self, counts: dict):
+        """
+        Applies a batch of click deltas {short_code: delta} under one lock.
+        Codes that do not exist are ignored. Returns the number applied.
+        """
+        with self.lock:
+            applied = {}
+            for short_code, delta in counts.items():
+                key = encode_code(short_code)
+                row = self._find_row(key) if key is not None else -1
+                if row >= 0:
+                    self._clicks[row] += delta
+                    applied[short_code] = delta
+            if applied and self.journal is not None:
+                self.journal.log_clicks(applied)
+        return len(applied)
+
+    def delete_many(self, short_codes) -> int:
+        """
+        Removes the given links (missing codes are ignored) under one lock.
+        Returns the number of column and arena bytes released.
+        """
+        freed = 0
+        with self.lock:
+            for short_code in short_codes:
+                key = encode_code(short_code)
+                if key is None:
+                    continue
+                slot = self._slot(key)
+                row = self._table[slot] - 1
+                if row < 0:
+                    continue
+                freed += _ROW_BYTES + self._lengths[row]
+                self._garbage += self._lengths[row]
+                self._unlink_slot(slot)
+                self._codes[row] = _DELETED
+                self._lengths[row] = 0
+                self._free_rows.append(row)
+                for hook in self.invalidation_hooks:
+                    hook(short_code)
+            if self._garbage > len(self._arena) // 2:
+                self._compact_arena()
+        return freed
+
+    def _compact_arena(self):
+        # Caller holds self.lock. Copies the live URL bytes into a fresh arena.
+        arena = bytearray()
+        old = self._arena
+        for row in range(len(self._codes)):
+            if self._codes[row] == _DELETED:
+                continue
+            offset = self._offsets[row]
+            self._offsets[row] = len(arena)
+            arena += old[offset:offset + self._lengths[row]]
+        self._arena = arena
+        self._garbage = 0
+
+    def is_short_code_taken(self, short_code: str) -> bool:
+        key = encode_code(short_code)
+        if key is None:
+            return False
+        with self.lock:
+            return self._find_row(key) >= 0
+
+    def iter_entries(self, chunk_size: int = 1000):
+        """
+        Yields (short_code, original_url, clicks, created_at) for every row that
+        existed when iteration started, reading chunk_size rows per lock hold.
+        Rows deleted in the meantime are skipped, and so are freed rows reused
+        by other codes since the start, found by comparing each row's key with
+        a copy of the key column taken then. Clicks and overwrites made while
+        iterating show up in chunks read afterwards.
+        """
+        with self.lock:
+            codes = self._codes
+            keys = codes[:]
+        for start in range(0, len(keys), chunk_size):
+            with self.lock:
+                if self._codes is not codes:
+                    return  # Store was cleared
+                chunk = [self._record(row) for row in range(start, min(len(keys), start + chunk_size))
+                         if keys[row] != _DELETED and codes[row] == keys[row]]
+            for record in chunk:
+                yield record.short_code, record.original_url, record.clicks, record.created_at
+
+    def clear(self):
+        with self.lock:
+            self._init_storage(1024)
+            for hook in self.invalidation_hooks:
+                hook(None)
+
+    def __len__(self):
+        return len(self._codes) - len(self._free_rows)
+
+    def memory_usage(self) -> int:
+        """
+        Bytes held by the arrays, hash table and arena (excluding object headers).
+        """
+        arrays = (self._table, self._codes, self._offsets, self._lengths, self._clicks, self._created_at)
+        return sum(a.itemsize * len(a) for a in arrays) + len(self._arena)
@@ -0,0 +1,124 @@
+# config.py
+# Runtime settings for the URL shortener. Every value can be overridden with an
+# environment variable so deployments can tune the service without code changes.
+import os
+
+def env_str(name: str, default: str) -> str:
+    return os.environ.get(name, default)
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+def env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# Short code allocation: "random", "counter" (bijective base62) or "pool"
+CODE_ALLOCATOR = env_str("SHORTENER_CODE_ALLOCATOR", "random")
+# Secret key used by the counter allocator to scramble sequential codes.
+# When unset a random key is generated per process.
+CODE_SECRET = env_str("SHORTENER_CODE_SECRET", "")
+# Number of pre-generated codes the pool allocator keeps ready
+CODE_POOL_SIZE = env_int("SHORTENER_CODE_POOL_SIZE", 10000)
+
+# Storage engine: "dict" (one dict per link), "compact" (typed arrays + byte arena),
+# "shared" (shared memory segment used by every worker process on the host)
+# or "sqlite" (SQLite database file, durable without the event log)
+STORE_ENGINE = env_str("SHORTENER_STORE_ENGINE", "dict")
+# Number of lock-striped shards in the URL store; 1 keeps a single lock
+STORE_SHARDS = env_int("SHORTENER_STORE_SHARDS", 1)
+# Shared memory segment for the "shared" engine; workers using the same name
+# share one store. Capacity and arena size only apply when the segment is created.
+SHM_NAME = env_str("SHORTENER_SHM_NAME", "url-shortener")
+SHM_CAPACITY = env_int("SHORTENER_SHM_CAPACITY", 1_000_000)
+SHM_ARENA_BYTES = env_int("SHORTENER_SHM_ARENA_BYTES", 128 * 1024 * 1024)
+# Database file for the "sqlite" engine
+SQLITE_PATH = env_str("SHORTENER_SQLITE_PATH", "url-shortener.db")
+# Most queued writes the "sqlite" engine commits in one transaction
+SQLITE_BATCH_SIZE = env_int("SHORTENER_SQLITE_BATCH_SIZE", 1000)
+# Read connections the "sqlite" engine keeps open for new threads after their
+# previous threads exit; the rest are closed
+SQLITE_IDLE_READERS = env_int("SHORTENER_SQLITE_IDLE_READERS", 8)
+
+# Buffer redirect clicks per thread and merge them into the store in the background
+CLICK_BUFFERING = env_bool("SHORTENER_CLICK_BUFFERING", True)
+# Seconds between background flushes of buffered clicks
+CLICK_FLUSH_INTERVAL = env_float("SHORTENER_CLICK_FLUSH_INTERVAL", 1.0)
+# Pending clicks in one thread's buffer that trigger an early flush
+CLICK_FLUSH_THRESHOLD = env_int("SHORTENER_CLICK_FLUSH_THRESHOLD", 1000)
+
+# Directory for the durable event log and snapshots; empty keeps the store in memory only
+DATA_DIR = env_str("SHORTENER_DATA_DIR", "")
+# Seconds the log writer waits to gather concurrent writes into one fsync
+LOG_COMMIT_INTERVAL = env_float("SHORTENER_LOG_COMMIT_INTERVAL", 0.005)
+# Make /api/shorten wait until its log entry is on disk
+LOG_SYNC_WRITES = env_bool("SHORTENER_LOG_SYNC_WRITES", True)
+# Seconds between log compactions into a snapshot (0 disables)
+SNAPSHOT_INTERVAL = env_float("SHORTENER_SNAPSHOT_INTERVAL", 300.0)
+
+# Return the existing short code when the same (normalized) URL is shortened again
+DEDUPE = env_bool("SHORTENER_DEDUPE", False)
+
+# Largest list accepted by POST /api/shorten/batch as a JSON body
+BATCH_MAX_ITEMS = env_int("SHORTENER_BATCH_MAX_ITEMS", 10000)
+# URLs validated and stored together when a batch is streamed as NDJSON
+BATCH_CHUNK_SIZE = env_int("SHORTENER_BATCH_CHUNK_SIZE", 1000)
+
+# Most short codes accepted by one /api/stats/bulk request
+BULK_STATS_MAX_CODES = env_int("SHORTENER_BULK_STATS_MAX_CODES", 10000)
+
+# Keep per-minute/hour/day click ring buffers for links that receive clicks
+CLICK_WINDOWS = env_bool("SHORTENER_CLICK_WINDOWS", True)
+# Estimate unique visitors per link with HyperLogLog sketches (opt-in)
+UNIQUE_VISITORS = env_bool("SHORTENER_UNIQUE_VISITORS", False)
+# Registers per sketch are 2**precision bytes; standard error is 1.04 / sqrt(2**precision)
+UNIQUE_VISITORS_PRECISION = env_int("SHORTENER_UNIQUE_VISITORS_PRECISION", 10)
+# Daily sketches kept per link for windowed unique counts
+UNIQUE_VISITORS_DAYS = env_int("SHORTENER_UNIQUE_VISITORS_DAYS", 7)
+# Key for hashing visitor fingerprints; set it to keep hashes stable and private
+UNIQUE_VISITORS_SALT = env_str("SHORTENER_UNIQUE_VISITORS_SALT", "")
+# Track the hottest links for /api/stats/top with bounded-memory sketches
+TOP_LINKS = env_bool("SHORTENER_TOP_LINKS", True)
+# Links each top-links sketch tracks; also the largest k that can be requested
+TOP_LINKS_CAPACITY = env_int("SHORTENER_TOP_LINKS_CAPACITY", 1000)
+
+# Bloom filter in front of the store that rejects unknown codes on redirect
+BLOOM_FILTER = env_bool("SHORTENER_BLOOM_FILTER", False)
+# Number of links the Bloom filter is sized for
+BLOOM_CAPACITY = env_int("SHORTENER_BLOOM_CAPACITY", 1_000_000)
+# Target false-positive rate at full capacity
+BLOOM_FP_RATE = env_float("SHORTENER_BLOOM_FP_RATE", 0.01)
+
+# Serve repeat redirects from prebuilt responses in a WSGI middleware
+REDIRECT_CACHE = env_bool("SHORTENER_REDIRECT_CACHE", True)
+# Most short codes kept in the redirect cache
+REDIRECT_CACHE_ENTRIES = env_int("SHORTENER_REDIRECT_CACHE_ENTRIES", 10000)
+# Upper bound on cached payload bytes (headers + bodies)
+REDIRECT_CACHE_BYTES = env_int("SHORTENER_REDIRECT_CACHE_BYTES", 16 * 1024 * 1024)
+
+# Accept expires_in / expires_at on /api/shorten and reclaim expired links
+LINK_EXPIRY = env_bool("SHORTENER_LINK_EXPIRY", True)
+# Seconds between timer wheel sweeps that delete expired links from the store
+EXPIRY_SWEEP_INTERVAL = env_float("SHORTENER_EXPIRY_SWEEP_INTERVAL", 1.0)
+
+# Front end started by python -m app.serve: "wsgi" (Flask) or "asgi" (app/asgi.py)
+SERVER_MODE = env_str("SHORTENER_SERVER_MODE", "wsgi")
+SERVER_HOST = env_str("SHORTENER_HOST", "0.0.0.0")
+SERVER_PORT = env_int("SHORTENER_PORT", 5000)
+# Threads used by the ASGI app for blocking work and routes served by Flask
+ASGI_THREADS = env_int("SHORTENER_ASGI_THREADS", 32)
+# Largest request body the ASGI shorten route reads, in bytes
+ASGI_MAX_BODY = env_int("SHORTENER_ASGI_MAX_BODY", 1024 * 1024)
+
+# Record route latency and store lock contention and serve them at /api/metrics
+METRICS = env_bool("SHORTENER_METRICS", True)
+
+# Links per chunk when exporting, and per store write when importing
+TRANSFER_BATCH_SIZE = env_int("SHORTENER_TRANSFER_BATCH_SIZE", 10000)
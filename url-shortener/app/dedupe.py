@@ -0,0 +1,107 @@
+# dedupe.py
+# Reverse index from canonical long URL to its existing short code, used to
+# return the same code when the same URL is shortened again.
+import hashlib
+import threading
+from contextlib import ExitStack
+
+from app.utils import normalize_url
+
+class ReverseIndex:
+    """
+    Maps normalize_url(original_url) to the short code that was created for it.
+
+    Keys are 16-byte BLAKE2b digests of the canonical URL rather than the URL
+    itself, so the index does not hold a second copy of every URL. Writers for
+    the same canonical URL are serialised by one of 'num_locks' striped locks,
+    which makes "look up, else create and index" atomic without putting a
+    global lock in front of the store.
+    """
+
+    def __init__(self, num_locks: int = 64):
+        self._codes = {}
+        self._locks = [threading.Lock() for _ in range(num_locks)]
+
+    @staticmethod
+    def _digest(canonical: str) -> bytes:
+        return hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+
+    @classmethod
+    def key_for(cls, original_url: str) -> bytes:
+        return cls._digest(normalize_url(original_url))
+
+    def shorten(self, store, original_url: str):
+        """
+        Returns (short_code, created). Reuses the indexed code if it still
+        points at the same canonical URL, otherwise creates a new link.
+        """
+        canonical = normalize_url(original_url)
+        key = self._digest(canonical)
+        with self._locks[hash(key) % len(self._locks)]:
+            short_code = self._lookup(store, key, canonical)
+            if short_code is not None:
+                return short_code, False
+            short_code = store.create_url(original_url)
+            self._codes[key] = short_code
+        return short_code, True
+
+    def shorten_many(self, store, original_urls: list) -> list:
+        """
+        Batch version of shorten(). Returns a (short_code, created) pair per
+        URL. Every URL missing from the index, deduplicated within the batch,
+        is created with a single store.create_urls() call.
+        """
+        canonicals = [normalize_url(url) for url in original_urls]
+        keys = [self._digest(canonical) for canonical in canonicals]
+        results = [None] * len(original_urls)
+        # Take the stripes in a fixed order so concurrent batches cannot deadlock
+        stripes = sorted({hash(key) % len(self._locks) for key in keys})
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._locks[stripe])
+            missing = {}
+            for position, (key, canonical) in enumerate(zip(keys, canonicals)):
+                if key in missing:
+                    missing[key].append(position)
+                    continue
+                short_code = self._lookup(store, key, canonical)
+                if short_code is not None:
+                    results[position] = (short_code, False)
+                else:
+                    missing[key] = [position]
+            created = store.create_urls([original_urls[positions[0]] for positions in missing.values()])
+            for (key, positions), short_code in zip(missing.items(), created):
+                self._codes[key] = short_code
+                results[positions[0]] = (short_code, True)
+                for position in positions[1:]:
+                    results[position] = (short_code, False)
+        return results
+
+    def _lookup(self, store, key: bytes, canonical: str):
+        # Caller holds the stripe lock for key
+        short_code = self._codes.get(key)
+        if short_code is not None:
+            url_info = store.get_url_info(short_code)
+            # The code may have been removed or overwritten since it was indexed
+            if url_info and normalize_url(url_info["original_url"]) == canonical:
+                return short_code
+        return None
+
+    def add(self, short_code: str, original_url: str):
+        self._codes[self.key_for(original_url)] = short_code
+
+    def rebuild(self, store, exclude=None):
+        """
+        Re-indexes every link in the store, e.g. after a restart. Codes for
+        which 'exclude' returns true are left out.
+        """
+        self._codes.clear()
+        for short_code, original_url, _, _ in store.iter_entries():
+            if exclude is None or not exclude(short_code):
+                self._codes.setdefault(self.key_for(original_url), short_code)
+
+    def clear(self):
+        self._codes.clear()
+
+    def __len__(self):
+        return len(self._codes)
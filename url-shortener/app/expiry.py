@@ -0,0 +1,221 @@
+# expiry.py
+# Link expiry (TTL). Deadlines are checked in O(1) on the read path; expired
+# links are reclaimed from the store by a hierarchical timer wheel, so the
+# store is never scanned for them.
+import threading
+import time
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel over integer ticks. Every level has 2**bits
+    slots, and a slot on level L spans 2**(bits * L) ticks; a timer is placed
+    on the lowest level whose span covers its distance from the current tick
+    and cascades down one level each time the wheel above turns over. Scheduling is O(1) and advancing costs
+    O(1) per tick plus O(1) per timer per level it cascades through.
+    """
+
+    def __init__(self, start_tick: int = 0, bits: int = 6, levels: int = 6):
+        self.bits = bits
+        self.levels = levels
+        self.mask = (1 << bits) - 1
+        self.current = start_tick
+        self.wheels = [[[] for _ in range(1 << bits)] for _ in range(levels)]
+        # Timers at or past the current tick, returned by the next advance()
+        self.due = []
+        # Beyond the top level (slots**levels ticks ahead); re-scheduled as the top wheel turns
+        self.overflow = []
+        self.size = 0
+
+    def schedule(self, item, tick: int):
+        self.size += 1
+        self._place(item, tick)
+
+    def _place(self, item, tick: int):
+        delta = tick - self.current
+        if delta <= 0:
+            self.due.append((item, tick))
+            return
+        for level in range(self.levels):
+            if delta < 1 << (self.bits * (level + 1)):
+                index = (tick >> (self.bits * level)) & self.mask
+                self.wheels[level][index].append((item, tick))
+                return
+        self.overflow.append((item, tick))
+
+    def advance(self, tick: int) -> list:
+        """
+        Moves the wheel to 'tick' and returns the (item, tick) pairs that fell due.
+        """
+        expired, self.due = self.due, []
+        while self.current < tick:
+            if self.size == len(expired):
+                # Nothing else is scheduled; jump straight to the target tick
+                self.current = tick
+                break
+            self.current += 1
+            self._cascade()
+            if self.due:
+                # Cascaded timers that land exactly on the current tick
+                expired.extend(self.due)
+                self.due = []
+            slot = self.wheels[0][self.current & self.mask]
+            if slot:
+                expired.extend(slot)
+                slot.clear()
+        self.size -= len(expired)
+        return expired
+
+    def _cascade(self):
+        # When a level's index wraps to 0, the next slot of the level above is
+        # redistributed onto the lower levels
+        for level in range(1, self.levels):
+            if (self.current >> (self.bits * (level - 1))) & self.mask:
+                return
+            slot = self.wheels[level][(self.current >> (self.bits * level)) & self.mask]
+            timers = list(slot)
+            slot.clear()
+            for item, tick in timers:
+                self._place(item, tick)
+        if not (self.current >> (self.bits * (self.levels - 1))) & self.mask:
+            timers, self.overflow = self.overflow, []
+            for item, tick in timers:
+                self._place(item, tick)
+
+    def clear(self):
+        for wheel in self.wheels:
+            for slot in wheel:
+                slot.clear()
+        self.due = []
+        self.overflow = []
+        self.size = 0
+
+class LinkExpiry:
+    """
+    Expiry deadlines for links created with a TTL.
+
+    is_expired() is a dict lookup and one comparison, so the redirect path
+    treats an expired link as a miss immediately, even before it is
+    reclaimed. sweep() advances the timer wheel (once per 'resolution'
+    seconds of wall time) and deletes the links that fell due from the store.
+    """
+
+    def __init__(self, store, resolution: float = 1.0, sweep_interval: float = 1.0, clock=time.time):
+        self.store = store
+        self.resolution = resolution
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        # Optional durable event log (see app/persistence.py)
+        self.journal = None
+        # Callables notified with each reclaimed short code
+        self.listeners = []
+        self._deadlines = {}
+        # Codes sweep() is deleting from the store, which it drops itself
+        self._reclaiming = set()
+        self._wheel = TimerWheel(int(clock() // resolution))
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.reclaimed = 0
+        self.bytes_freed = 0
+
+    def _tick(self, timestamp: float) -> int:
+        # Deadlines round up and sweeps round down, so a link is never
+        # reclaimed before its deadline
+        return -int(-timestamp // self.resolution)
+
+    def set(self, short_code: str, expires_at: float):
+        with self._lock:
+            self._schedule(short_code, expires_at)
+            seq = self.journal.log_expiry([(short_code, expires_at)]) if self.journal is not None else None
+        if seq is not None and self.journal.sync_writes:
+            self.journal.wait_durable(seq)
+
+    def load(self, deadlines):
+        """
+        Restores (short_code, expires_at) pairs, e.g. from persistence. Links
+        already past their deadline are reclaimed by the next sweep.
+        """
+        with self._lock:
+            for short_code, expires_at in deadlines:
+                self._schedule(short_code, expires_at)
+
+    def _schedule(self, short_code: str, expires_at: float):
+        # Caller holds self._lock. A rescheduled code keeps its stale wheel
+        # entry, which is skipped by sweep() because the deadline changed.
+        self._deadlines[short_code] = expires_at
+        self._wheel.schedule(short_code, self._tick(expires_at))
+
+    def expires_at(self, short_code: str):
+        return self._deadlines.get(short_code)
+
+    def is_expired(self, short_code: str, now: float = None) -> bool:
+        deadline = self._deadlines.get(short_code)
+        return deadline is not None and deadline <= (self.clock() if now is None else now)
+
+    def sweep(self, now: float = None) -> int:
+        """
+        Deletes every link whose deadline has passed from the store.
+        Returns the number of links reclaimed.
+        """
+        now = self.clock() if now is None else now
+        with self._lock:
+            due = []
+            for short_code, _ in self._wheel.advance(int(now // self.resolution)):
+                deadline = self._deadlines.get(short_code)
+                if deadline is not None and deadline <= now:
+                    due.append(short_code)
+            if not due:
+                return 0
+            self._reclaiming.update(due)
+        # The store's lock is taken without holding self._lock: the store calls
+        # on_store_invalidated() while holding its own lock
+        try:
+            freed = self.store.delete_many(due)
+        finally:
+            with self._lock:
+                self._reclaiming.difference_update(due)
+        with self._lock:
+            # Deleted before the deadlines are dropped, so a concurrent redirect
+            # sees either the deadline or no link at all
+            for short_code in due:
+                self._deadlines.pop(short_code, None)
+            self.bytes_freed += freed
+            self.reclaimed += len(due)
+        for listener in self.listeners:
+            for short_code in due:
+                listener(short_code)
+        return len(due)
+
+    def on_store_invalidated(self, short_code):
+        # Store invalidation hook: deadlines only belong to the links they were
+        # set for, so a cleared store drops them all and an overwritten link
+        # drops its own. The removal is journalled (as a None deadline) so a
+        # restart agrees; the overwrite itself is what callers wait on.
+        if short_code is None:
+            with self._lock:
+                self._deadlines.clear()
+                self._wheel.clear()
+        elif short_code not in self._reclaiming and self._deadlines.pop(short_code, None) is not None:
+            # The stale wheel entry is skipped by sweep()
+            if self.journal is not None:
+                self.journal.log_expiry([(short_code, None)])
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sweep_loop, name="link-expiry", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.sweep_interval + 1)
+
+    def _sweep_loop(self):
+        while not self._stopped.wait(self.sweep_interval):
+            self.sweep()
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": len(self._deadlines),
+            "reclaimed": self.reclaimed,
+            "bytes_freed": self.bytes_freed,
+        }
@@ -0,0 +1,99 @@
+# filters.py
+# Probabilistic membership filter used to reject unknown short codes before
+# the store is touched.
+import hashlib
+import math
+import threading
+
+class BloomFilter:
+    """
+    Standard Bloom filter sized for 'capacity' items at 'fp_rate' false
+    positives. might_contain() never returns False for an added code, so a
+    negative answer is a guaranteed miss.
+
+    Codes cannot be removed; deleted or expired codes simply keep answering
+    "maybe" and fall through to the store, which is safe.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, fp_rate: float = 0.01):
+        if capacity < 1 or not 0 < fp_rate < 1:
+            raise ValueError("capacity must be positive and fp_rate between 0 and 1")
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        # Adds can come from several store shards at once; the read-modify-write
+        # of a byte must not lose another thread's bit
+        self._lock = threading.Lock()
+        self.items = 0
+        self.bits_set = 0
+        # Lookup metrics (plain counters: cheap, may undercount under heavy concurrency)
+        self.checks = 0
+        self.rejected = 0
+        self.false_positives = 0
+
+    def _positions(self, short_code: str):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(short_code.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, short_code: str):
+        positions = self._positions(short_code)
+        with self._lock:
+            for position in positions:
+                mask = 1 << (position & 7)
+                byte = self._bits[position >> 3]
+                if not byte & mask:
+                    self._bits[position >> 3] = byte | mask
+                    self.bits_set += 1
+            self.items += 1
+
+    def add_many(self, short_codes):
+        for short_code in short_codes:
+            self.add(short_code)
+
+    def might_contain(self, short_code: str) -> bool:
+        self.checks += 1
+        bits = self._bits
+        for position in self._positions(short_code):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                self.rejected += 1
+                return False
+        return True
+
+    def record_false_positive(self):
+        # Called when a code passed the filter but was not in the store
+        self.false_positives += 1
+
+    def clear(self):
+        with self._lock:
+            self._bits = bytearray(len(self._bits))
+            self.items = 0
+            self.bits_set = 0
+
+    @property
+    def fill_ratio(self) -> float:
+        return self.bits_set / self.num_bits
+
+    @property
+    def estimated_fp_rate(self) -> float:
+        return self.fill_ratio ** self.num_hashes
+
+    def stats(self) -> dict:
+        passed = self.checks - self.rejected
+        return {
+            "capacity": self.capacity,
+            "target_fp_rate": self.fp_rate,
+            "num_bits": self.num_bits,
+            "num_hashes": self.num_hashes,
+            "items": self.items,
+            "fill_ratio": round(self.fill_ratio, 6),
+            "estimated_fp_rate": self.estimated_fp_rate,
+            "checks": self.checks,
+            "rejected": self.rejected,
+            "false_positives": self.false_positives,
+            "observed_fp_rate": self.false_positives / passed if passed else 0.0,
+        }
@@ -1,8 +1,15 @@
 # main.py
-from flask import Flask, request, jsonify, redirect, url_for, abort
+from flask import Flask, Response, request, jsonify, redirect, url_for, abort, stream_with_context
 from datetime import datetime
-from app.models import url_store # Import the global URL store
-from app.utils import generate_short_code, is_valid_url, ALPHANUMERIC_CHARS, SHORT_CODE_LENGTH # Import utility functions
+import json
+from app import config
+from app.models import url_store, click_counter, code_filter, dedupe_index, link_expiry, metrics, top_links # Import the global URL store and helpers
+from app.metrics import MetricsMiddleware
+from app.redirect_cache import RedirectCache, RedirectCacheMiddleware
+from app.service import find_link, link_expires_at, link_stats, shorten_link, top_link_stats, track_redirect, visitor_fingerprint
+from app.utils import is_valid_url # Import utility functions
+from app.transfer import FORMATS, MIMETYPES, import_records, iter_export, iter_records
+from app.stats import SORT_FIELDS, parse_timestamp, query_stats, stats_row
 
 app = Flask(__name__)
 
@@ -26,73 +33,316 @@ def api_health():
 # Core Requirement 1: Shorten URL Endpoint 
 @app.route('/api/shorten', methods=['POST'])
 def shorten_url():
-    data = request.get_json()
-    if not data or 'url' not in data:
-        return jsonify({"error": "URL is required in request body."}), 400
+    try:
+        short_code, created, expires_at = shorten_link(request.get_json())
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
 
-    original_url = data['url']
+    short_url = url_for('redirect_to_long_url', short_code=short_code, _external=True)
 
-    # Validate URL 
-    if not is_valid_url(original_url):
-        return jsonify({"error": "Invalid URL provided."}), 400
+    result = {
+        "short_code": short_code,
+        "short_url": short_url
+    }
+    if expires_at is not None:
+        result["expires_at"] = datetime.fromtimestamp(expires_at).isoformat()
+    return jsonify(result), 201 if created else 200
 
-    # Generate a unique short code 
-    # We pass existing_codes from the url_store for uniqueness check.
-    # Note: In a real-world scenario, you might have a more robust way to manage
-    # short code generation and collisions, potentially involving retries or
-    # pre-generating codes. For this in-memory solution, directly checking
-    # against url_store is sufficient and thread-safe due to the lock in URLStore.
-    existing_codes_set = set(url_store.urls.keys())
-    short_code = generate_short_code(existing_codes_set)
+# Batch shortening: many URLs per request, one store write per chunk
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+# Marks an NDJSON line that could not be parsed
+_MALFORMED = object()
 
-    # Store the mapping 
-    url_store.add_url(short_code, original_url)
+@app.route('/api/shorten/batch', methods=['POST'])
+def shorten_url_batch():
+    """
+    Accepts either a JSON body {"urls": [...]} or an NDJSON body
+    (Content-Type: application/x-ndjson) with one URL string or {"url": ...}
+    object per line. JSON bodies get a single JSON response; NDJSON bodies are
+    read and answered in chunks, so neither side buffers the whole batch.
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        short_url_prefix = url_for('health_check', _external=True)
+        items = _iter_ndjson_items(request.stream)
+        return Response(
+            stream_with_context(_stream_batch_results(items, short_url_prefix)),
+            mimetype='application/x-ndjson'
+        )
 
-    short_url = url_for('redirect_to_long_url', short_code=short_code, _external=True)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('urls'), list):
+        return jsonify({"error": "A list of URLs is required in request body."}), 400
+    if len(data['urls']) > config.BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {config.BATCH_MAX_ITEMS} URLs per JSON batch; use NDJSON for larger batches."}), 413
 
+    short_url_prefix = url_for('health_check', _external=True)
+    results = _shorten_batch(list(enumerate(data['urls'])), short_url_prefix)
     return jsonify({
-        "short_code": short_code,
-        "short_url": short_url
-    }), 201
+        "results": results,
+        "created": sum(1 for r in results if r.get("created")),
+        "failed": sum(1 for r in results if "error" in r)
+    }), 200
+
+def _iter_ndjson_items(stream):
+    # Yields (index, item) per non-blank line; malformed lines become an error marker
+    index = 0
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError:
+            yield index, _MALFORMED
+        index += 1
+
+def _stream_batch_results(items, short_url_prefix):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= config.BATCH_CHUNK_SIZE:
+            yield _to_ndjson(_shorten_batch(chunk, short_url_prefix))
+            chunk = []
+    if chunk:
+        yield _to_ndjson(_shorten_batch(chunk, short_url_prefix))
+
+def _to_ndjson(results):
+    return ''.join(json.dumps(result) + '\n' for result in results)
+
+def _shorten_batch(items, short_url_prefix):
+    """
+    Validates (index, item) pairs in one pass, then creates every valid URL
+    with a single store reservation. Returns one result dict per item.
+    """
+    results = []
+    valid = []
+    for index, item in items:
+        if item is _MALFORMED:
+            results.append({"index": index, "error": "Malformed JSON line."})
+            continue
+        original_url = item.get('url') if isinstance(item, dict) else item
+        if original_url is None:
+            results.append({"index": index, "error": "URL is required."})
+        elif not isinstance(original_url, str) or not is_valid_url(original_url):
+            results.append({"index": index, "url": original_url, "error": "Invalid URL provided."})
+        else:
+            result = {"index": index, "url": original_url}
+            results.append(result)
+            valid.append(result)
+
+    originals = [result["url"] for result in valid]
+    if dedupe_index is not None:
+        created = dedupe_index.shorten_many(url_store, originals)
+    else:
+        created = [(short_code, True) for short_code in url_store.create_urls(originals)]
+    for result, (short_code, is_new) in zip(valid, created):
+        result["short_code"] = short_code
+        result["short_url"] = short_url_prefix + short_code
+        result["created"] = is_new
+    return results
 
 # Core Requirement 2: Redirect Endpoint 
 @app.route('/<short_code>')
 def redirect_to_long_url(short_code):
-    url_info = url_store.get_url_info(short_code)
+    # Taken before the lookup so a concurrent invalidation voids the cache fill
+    cache_token = redirect_cache.token() if redirect_cache is not None else None
+
+    url_info = find_link(short_code)
 
     if not url_info:
         # Return 404 if short code doesn't exist 
         abort(404)
 
-    # Track each redirect (increment click count) 
-    url_store.increment_clicks(short_code)
+    track_redirect(short_code, visitor_fingerprint(request.remote_addr, request.headers.get('User-Agent')))
 
-    return redirect(url_info["original_url"])
+    response = redirect(url_info["original_url"])
+    if redirect_cache is not None:
+        # Later hits for this code are answered by RedirectCacheMiddleware
+        redirect_cache.put(short_code, response, cache_token, expires_at=link_expires_at(short_code))
+    return response
 
 # Core Requirement 3: Analytics Endpoint 
 @app.route('/api/stats/<short_code>')
 def get_url_stats(short_code):
-    url_info = url_store.get_url_info(short_code)
+    try:
+        stats = link_stats(short_code, request.args.get('window'))
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
 
-    if not url_info:
+    if stats is None:
         # Return 404 if short code doesn't exist 
         abort(404)
 
-    # Return click count, creation timestamp, and original URL 
-    created_at_dt = datetime.fromtimestamp(url_info["created_at"])
-    # Format timestamp as ISO 8601 string
-    created_at_iso = created_at_dt.isoformat()
+    return jsonify(stats), 200
+
+# Hottest links from the heavy-hitter sketches, without scanning the store
+@app.route('/api/stats/top')
+def get_top_links():
+    """
+    Query parameters:
+      k       number of links (default 10, at most SHORTENER_TOP_LINKS_CAPACITY)
+      window  optional recent window in hours or days, e.g. "24h" or "7d"
+    Click counts are estimates: each link's true count lies between
+    clicks - error and clicks.
+    """
+    if top_links is None:
+        abort(404)
+    try:
+        k = int(request.args.get('k', 10))
+    except ValueError:
+        k = 0
+    if not 1 <= k <= top_links.capacity:
+        return jsonify({"error": f"k must be between 1 and {top_links.capacity}."}), 400
+    window = request.args.get('window')
+    try:
+        links = top_link_stats(k, window)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    return jsonify({"k": k, "window": window, "links": links}), 200
+
+# Bulk analytics: many links in one request, streamed back as NDJSON
+@app.route('/api/stats/bulk', methods=['GET', 'POST'])
+def get_bulk_stats():
+    """
+    Query parameters (GET) or JSON body fields (POST):
+      codes           list of short codes (POST only; omit to scan the store)
+      prefix          only codes starting with this prefix
+      created_after   Unix timestamp or ISO 8601, inclusive
+      created_before  Unix timestamp or ISO 8601, inclusive
+      sort            "clicks" or "created_at" (descending unless order=asc)
+      limit           maximum number of rows
+    Each NDJSON line has the fields of /api/stats/<short_code> plus short_code.
+    """
+    params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    if not isinstance(params, dict) and params is not request.args:
+        return jsonify({"error": "Request body must be a JSON object."}), 400
+    try:
+        query = _parse_bulk_stats_query(params)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
 
+    exclude = link_expiry.is_expired if link_expiry is not None else None
+    rows = query_stats(url_store, click_counter, exclude=exclude, **query)
+    return Response(
+        (json.dumps(stats_row(*row)) + '\n' for row in rows),
+        mimetype='application/x-ndjson'
+    )
+
+def _parse_bulk_stats_query(params):
+    query = {}
+    codes = params.get('codes')
+    if codes is not None:
+        if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+            raise ValueError("codes must be a list of short codes.")
+        if len(codes) > config.BULK_STATS_MAX_CODES:
+            raise ValueError(f"At most {config.BULK_STATS_MAX_CODES} codes per request.")
+        query['codes'] = codes
+    if params.get('prefix'):
+        query['prefix'] = str(params['prefix'])
+    for field in ('created_after', 'created_before'):
+        if params.get(field) is not None:
+            try:
+                query[field] = parse_timestamp(params[field])
+            except ValueError:
+                raise ValueError(f"{field} must be a Unix timestamp or ISO 8601 string.")
+    sort = params.get('sort')
+    if sort is not None:
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"sort must be one of: {', '.join(SORT_FIELDS)}.")
+        query['sort'] = sort
+        query['descending'] = params.get('order', 'desc') != 'asc'
+    if params.get('limit') is not None:
+        try:
+            limit = int(params['limit'])
+        except (TypeError, ValueError):
+            limit = 0
+        if limit < 1:
+            raise ValueError("limit must be a positive integer.")
+        query['limit'] = limit
+    return query
+
+# Operational counters for the optional store components
+@app.route('/api/admin/stats')
+def get_admin_stats():
     return jsonify({
-        "url": url_info["original_url"],
-        "clicks": url_info["clicks"],
-        "created_at": created_at_iso
+        "links": len(url_store),
+        "code_filter": code_filter.stats() if code_filter is not None else None,
+        "redirect_cache": redirect_cache.stats() if redirect_cache is not None else None,
+        "expiry": link_expiry.stats() if link_expiry is not None else None,
+        "top_links": top_links.stats() if top_links is not None else None
     }), 200
 
+# Streaming backup and migration of the whole store
+@app.route('/api/admin/export')
+def export_links():
+    """
+    Streams every link as NDJSON (default) or, with ?format=binary, in the
+    compact binary format of app/transfer.py. The store lock is only held
+    while each chunk is read.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(FORMATS)}."}), 400
+    chunks = iter_export(url_store, link_expiry, fmt, chunk_size=config.TRANSFER_BATCH_SIZE)
+    return Response(chunks, mimetype=MIMETYPES[fmt])
+
+@app.route('/api/admin/import', methods=['POST'])
+def import_links():
+    """
+    Bulk-loads an export from the request body, read as a stream. The format
+    comes from ?format= or the Content-Type. Existing codes are overwritten
+    unless ?skip_existing=1. Returns imported/skipped/failed counts.
+    """
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'ndjson' if request.mimetype in NDJSON_MIMETYPES else 'binary'
+    if fmt not in FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(FORMATS)}."}), 400
+    try:
+        summary = import_records(
+            url_store,
+            iter_records(request.stream, fmt),
+            expiry=link_expiry,
+            dedupe=dedupe_index,
+            batch_size=config.TRANSFER_BATCH_SIZE,
+            skip_existing=request.args.get('skip_existing') in ('1', 'true'),
+        )
+    except ValueError as error:
+        # Unreadable binary stream; batches before the error stay imported
+        return jsonify({"error": str(error)}), 400
+    return jsonify(summary), 200
+
+# Prometheus scrape endpoint (404 when SHORTENER_METRICS is off)
+@app.route('/api/metrics')
+def get_metrics():
+    if metrics is None:
+        abort(404)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # Basic error handling for 404
 @app.errorhandler(404)
 def not_found_error(error):
     return jsonify({"error": "Resource not found."}), 404
 
+def _track_cached_redirect(short_code, environ):
+    # Redirects served by RedirectCacheMiddleware have no Flask request
+    track_redirect(short_code, visitor_fingerprint(environ.get('REMOTE_ADDR'), environ.get('HTTP_USER_AGENT')))
+
+# Prebuilt redirect responses for hot codes, served before Flask routing
+redirect_cache = None
+if config.REDIRECT_CACHE:
+    redirect_cache = RedirectCache(
+        max_entries=config.REDIRECT_CACHE_ENTRIES,
+        max_bytes=config.REDIRECT_CACHE_BYTES,
+        # A store shared between processes also changes behind this worker's back
+        generation=(lambda: url_store.generation) if hasattr(url_store, "generation") else None,
+    )
+    url_store.invalidation_hooks.append(redirect_cache.invalidate)
+    app.wsgi_app = RedirectCacheMiddleware(app.wsgi_app, redirect_cache, _track_cached_redirect)
+
+# Route latency, including redirects answered by the cache middleware
+if metrics is not None:
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app, metrics)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,303 @@
+# metrics.py
+# Request latency and store lock contention metrics, exported in the
+# Prometheus text format at /api/metrics.
+import threading
+import time
+
+# Flask endpoints whose latency is recorded
+ROUTES = ("shorten_url", "redirect_to_long_url", "get_url_stats")
+
+# Cumulative bucket bounds (seconds) exported to Prometheus; the recorded
+# histograms are much finer and are folded into these at scrape time
+EXPORT_BOUNDS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Quantiles exported alongside each histogram
+QUANTILES = (0.5, 0.99, 0.999)
+
+def route_name(method: str, path: str):
+    """
+    Returns the timed endpoint a request is routed to, or None. Matches the
+    Flask URL rules for those endpoints without going through the URL map.
+    """
+    if method == "POST":
+        return "shorten_url" if path == "/api/shorten" else None
+    if method != "GET":
+        return None
+    if path.startswith("/api/stats/") and path.count("/") == 3 and path not in ("/api/stats/bulk", "/api/stats/top"):
+        return "get_url_stats"
+    if len(path) > 1 and path.find("/", 1) == -1:
+        return "redirect_to_long_url"
+    return None
+
+class _HistogramShard:
+    __slots__ = ("counts", "total", "thread")
+
+    def __init__(self, size: int, thread=None):
+        self.counts = [0] * size
+        self.total = 0
+        self.thread = thread
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of nanosecond durations, in the style of HdrHistogram:
+    every power of two is split into 2**sub_bucket_bits equal buckets, so any
+    recorded value is known to within 1 / 2**sub_bucket_bits (about 3% with
+    the default of 5 bits) from 1 ns up to max_value.
+
+    record() is an index computation and a list increment on a per-thread
+    shard, so it never takes a lock; readers merge the shards. Shards of
+    exited threads are folded into one retired shard when a new thread
+    registers, so a thread-per-request server doesn't accumulate them.
+    """
+
+    def __init__(self, sub_bucket_bits: int = 5, max_value: int = 1 << 36):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.max_value = max_value
+        self.size = self._index(max_value) + 1
+        self._local = threading.local()
+        self._shards = []
+        # Counts of exited threads; replaced rather than updated, so a
+        # snapshot() merging the previous one is unaffected
+        self._retired = _HistogramShard(self.size)
+        self._registry_lock = threading.Lock()
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        if shift <= 0:
+            return value
+        return shift * self.sub_buckets + (value >> shift)
+
+    def upper_bound(self, index: int) -> int:
+        # Largest value that falls into bucket 'index'
+        if index < 2 * self.sub_buckets:
+            return index
+        shift = index // self.sub_buckets - 1
+        mantissa = index - shift * self.sub_buckets
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _HistogramShard(self.size, threading.current_thread())
+            with self._registry_lock:
+                self._prune_dead_shards()
+                self._shards.append(shard)
+        if value > self.max_value:
+            value = self.max_value
+        shard.counts[self._index(value)] += 1
+        shard.total += value
+
+    def _prune_dead_shards(self):
+        # Caller holds self._registry_lock. An exited thread records nothing
+        # more, so its shard can be merged and dropped.
+        live, dead = [], []
+        for shard in self._shards:
+            (live if shard.thread.is_alive() else dead).append(shard)
+        if not dead:
+            return
+        retired = _HistogramShard(self.size)
+        retired.counts = list(self._retired.counts)
+        retired.total = self._retired.total
+        for shard in dead:
+            retired.total += shard.total
+            for index, count in enumerate(shard.counts):
+                if count:
+                    retired.counts[index] += count
+        self._retired = retired
+        self._shards = live
+
+    def snapshot(self):
+        """
+        Returns (counts, count, total) merged over every thread.
+        """
+        with self._registry_lock:
+            shards = self._shards + [self._retired]
+        counts = [0] * self.size
+        total = 0
+        for shard in shards:
+            total += shard.total
+            for index, count in enumerate(shard.counts):
+                if count:
+                    counts[index] += count
+        return counts, sum(counts), total
+
+    def percentiles(self, quantiles, snapshot=None) -> dict:
+        """
+        Returns {quantile: value}; each value is the upper bound of the bucket
+        holding that rank, or None while the histogram is empty.
+        """
+        counts, count, _ = snapshot or self.snapshot()
+        results = {}
+        for quantile in sorted(quantiles):
+            if not count:
+                results[quantile] = None
+                continue
+            rank = max(1, int(quantile * count + 0.5))
+            seen = 0
+            for index, bucket in enumerate(counts):
+                seen += bucket
+                if seen >= rank:
+                    results[quantile] = self.upper_bound(index)
+                    break
+        return results
+
+    def cumulative(self, bounds_ns, snapshot=None) -> list:
+        # Number of values at or below each bound; a fine bucket counts
+        # towards a bound only if it lies entirely below it
+        counts, _, _ = snapshot or self.snapshot()
+        results = []
+        index = 0
+        seen = 0
+        for bound in bounds_ns:
+            while index < self.size and self.upper_bound(index) <= bound:
+                seen += counts[index]
+                index += 1
+            results.append(seen)
+        return results
+
+class InstrumentedLock:
+    """
+    Wraps a threading.Lock and records how long callers wait for it. An
+    uncontended acquire costs one extra non-blocking attempt; only waits that
+    actually block are timed.
+    """
+
+    __slots__ = ("_lock", "_waits")
+
+    def __init__(self, lock, waits: LatencyHistogram):
+        self._lock = lock
+        self._waits = waits
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter_ns()
+        acquired = self._lock.acquire(True, timeout)
+        self._waits.record(time.perf_counter_ns() - started)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        if not self._lock.acquire(False):
+            started = time.perf_counter_ns()
+            self._lock.acquire()
+            self._waits.record(time.perf_counter_ns() - started)
+        return True
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+def instrument_store_locks(store, waits: LatencyHistogram) -> int:
+    """
+    Replaces the lock of the store (or of each shard) with an InstrumentedLock.
+    Must run before the store is shared between threads. Locks that are not
+    plain thread locks (the shared engine's process lock) are left alone.
+    Returns the number of locks instrumented.
+    """
+    instrumented = 0
+    for part in getattr(store, "shards", [store]):
+        lock = getattr(part, "lock", None)
+        if lock is not None and hasattr(lock, "acquire"):
+            part.lock = InstrumentedLock(lock, waits)
+            instrumented += 1
+    return instrumented
+
+class Metrics:
+    """
+    Registry behind /api/metrics: one latency histogram per timed route, the
+    store lock wait histogram, and gauges read at scrape time.
+    """
+
+    def __init__(self):
+        self.routes = {route: LatencyHistogram() for route in ROUTES}
+        self.lock_waits = LatencyHistogram()
+        # name -> (help text, callable returning the current value)
+        self.gauges = {}
+
+    def observe(self, route: str, elapsed_ns: int):
+        self.routes[route].record(elapsed_ns)
+
+    def add_gauge(self, name: str, help_text: str, read):
+        self.gauges[name] = (help_text, read)
+
+    def render(self) -> str:
+        lines = []
+        _render_histogram(
+            lines,
+            "url_shortener_request_duration_seconds",
+            "Time spent handling requests, by Flask endpoint.",
+            [({"route": route}, histogram) for route, histogram in self.routes.items()],
+        )
+        _render_histogram(
+            lines,
+            "url_shortener_store_lock_wait_seconds",
+            "Time spent blocked on a contended URL store lock.",
+            [({}, self.lock_waits)],
+        )
+        _, contended, _ = self.lock_waits.snapshot()
+        lines.append("# HELP url_shortener_store_lock_contended_total Store lock acquisitions that had to wait.")
+        lines.append("# TYPE url_shortener_store_lock_contended_total counter")
+        lines.append(f"url_shortener_store_lock_contended_total {contended}")
+        for name, (help_text, read) in self.gauges.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+def _render_histogram(lines, name, help_text, series):
+    bounds_ns = [round(bound * 1e9) for bound in EXPORT_BOUNDS]
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    quantile_lines = []
+    for labels, histogram in series:
+        snapshot = histogram.snapshot()
+        _, count, total = snapshot
+        for bound, cumulative in zip(EXPORT_BOUNDS, histogram.cumulative(bounds_ns, snapshot)):
+            lines.append(f"{name}_bucket{_labels(labels, le=repr(bound))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {total / 1e9}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+        for quantile, value in histogram.percentiles(QUANTILES, snapshot).items():
+            if value is not None:
+                quantile_lines.append(f"{name}_quantile{_labels(labels, quantile=repr(quantile))} {value / 1e9}")
+    # Quantiles from the fine-grained histogram, which the coarse export buckets cannot give
+    lines.append(f"# HELP {name}_quantile Latency quantiles with about 3% relative error.")
+    lines.append(f"# TYPE {name}_quantile gauge")
+    lines.extend(quantile_lines)
+
+def _labels(labels: dict, **extra) -> str:
+    merged = dict(labels, **extra)
+    if not merged:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in merged.items()) + "}"
+
+class MetricsMiddleware:
+    """
+    WSGI middleware that times the routes in ROUTES. It wraps the redirect
+    cache middleware, so redirects answered from the cache are timed too.
+    """
+
+    def __init__(self, wsgi_app, metrics: Metrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        route = route_name(environ.get("REQUEST_METHOD", ""), environ.get("PATH_INFO", ""))
+        if route is None:
+            return self.wsgi_app(environ, start_response)
+        started = time.perf_counter_ns()
+        try:
+            return self.wsgi_app(environ, start_response)
+        finally:
+            self.metrics.observe(route, time.perf_counter_ns() - started)
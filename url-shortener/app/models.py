@@ -5,40 +5,532 @@
 # - Managing URL metadata
 
 # models.py
+import atexit
+import sys
 import threading
 import time
 
+from app import config
+from app.allocators import RandomCodeAllocator, make_allocator
+from app.analytics import ClickAnalytics
+from app.clicks import create_click_counter
+from app.compact import CompactURLStore
+from app.dedupe import ReverseIndex
+from app.expiry import LinkExpiry
+from app.filters import BloomFilter
+from app.metrics import Metrics, instrument_store_locks
+from app.persistence import Persistence
+from app.shared import SharedMemoryURLStore
+from app.sqlite_store import SQLiteURLStore
+from app.topk import TopLinks
+from app.uniques import UniqueVisitors
+
+def new_url_entry(original_url: str) -> dict:
+    # Store original URL, initialize clicks to 0, and record creation timestamp
+    return {
+        "original_url": original_url,
+        "clicks": 0,
+        "created_at": time.time()  # Unix timestamp for creation
+    }
+
 class URLStore:
-    def __init__(self):
+    def __init__(self, allocator=None, journal=None):
         # Using a dictionary to store URL mappings
         # Key: short_code, Value: { "original_url": str, "clicks": int, "created_at": float }
         self.urls = {}
         # Using a lock to handle concurrent access to the urls dictionary
         self.lock = threading.Lock()
+        # Proposes candidate short codes; uniqueness is enforced under self.lock
+        self.allocator = allocator or RandomCodeAllocator()
+        # Optional durable event log (see app/persistence.py)
+        self.journal = journal
+        # Optional membership filter that must see every stored code (see app/filters.py)
+        self.code_filter = None
+        # Callables notified with a short code when its mapping is replaced or
+        # removed (None means every code), e.g. to drop cached redirects
+        self.invalidation_hooks = []
+
+    def create_url(self, original_url: str) -> str:
+        """
+        Reserves a fresh short code and stores the mapping in one atomic step.
+        Returns the new short code.
+        """
+        with self.lock:
+            short_code = self._reserve_code()
+            seq = self._insert(short_code, original_url)
+        self._wait_durable(seq)
+        return short_code
+
+    def try_insert(self, short_code: str, original_url: str) -> bool:
+        """
+        Stores the mapping only if the short code is still free.
+        """
+        with self.lock:
+            if short_code in self.urls:
+                return False
+            seq = self._insert(short_code, original_url)
+        self._wait_durable(seq)
+        return True
+
+    def create_urls(self, original_urls: list) -> list:
+        """
+        Batch version of create_url: reserves one code per URL and stores every
+        mapping under a single lock acquisition. Returns codes in input order.
+        """
+        with self.lock:
+            short_codes = []
+            for original_url in original_urls:
+                short_code = self._reserve_code()
+                self.urls[short_code] = new_url_entry(original_url)
+                short_codes.append(short_code)
+            seq = self._record_created(short_codes)
+        self._wait_durable(seq)
+        return short_codes
+
+    def insert_many(self, mappings: list) -> set:
+        """
+        Stores every (short_code, original_url) pair whose code is still free,
+        under one lock acquisition. Returns the set of codes that were taken.
+        """
+        taken = set()
+        with self.lock:
+            inserted = []
+            for short_code, original_url in mappings:
+                if short_code in self.urls:
+                    taken.add(short_code)
+                else:
+                    self.urls[short_code] = new_url_entry(original_url)
+                    inserted.append(short_code)
+            seq = self._record_created(inserted)
+        self._wait_durable(seq)
+        return taken
+
+    def _record_created(self, short_codes: list):
+        # Caller must hold self.lock. Logs a batch of new links as one event.
+        if self.code_filter is not None:
+            self.code_filter.add_many(short_codes)
+        if self.journal is None or not short_codes:
+            return None
+        return self.journal.log_shortens([
+            (short_code, self.urls[short_code]["original_url"], self.urls[short_code]["created_at"])
+            for short_code in short_codes
+        ])
+
+    def _reserve_code(self) -> str:
+        # Caller must hold self.lock. Each retry is an O(1) dict lookup.
+        while True:
+            short_code = self.allocator.next_code()
+            if short_code not in self.urls:
+                return short_code
+
+    def _insert(self, short_code: str, original_url: str):
+        # Caller must hold self.lock. Returns the journal sequence number, if any.
+        if short_code in self.urls:
+            self._invalidate(short_code)
+        url_info = self.urls[short_code] = new_url_entry(original_url)
+        if self.code_filter is not None:
+            self.code_filter.add(short_code)
+        if self.journal is not None:
+            return self.journal.log_shorten(short_code, original_url, url_info["created_at"])
+        return None
+
+    def _invalidate(self, short_code):
+        for hook in self.invalidation_hooks:
+            hook(short_code)
+
+    def _wait_durable(self, seq):
+        # Called after releasing the lock so the group commit is not serialised
+        if seq is not None and self.journal.sync_writes:
+            self.journal.wait_durable(seq)
 
     def add_url(self, short_code: str, original_url: str):
         with self.lock:
-            # Store original URL, initialize clicks to 0, and record creation timestamp
-            self.urls[short_code] = {
-                "original_url": original_url,
-                "clicks": 0,
-                "created_at": time.time()  # Unix timestamp for creation
-            }
+            seq = self._insert(short_code, original_url)
+        self._wait_durable(seq)
+
+    def load_entries(self, entries):
+        """
+        Bulk-loads (short_code, original_url, clicks, created_at) tuples, e.g.
+        from a snapshot. Loaded entries are not written to the journal.
+        """
+        with self.lock:
+            for short_code, original_url, clicks, created_at in entries:
+                if short_code in self.urls:
+                    self._invalidate(short_code)
+                self.urls[short_code] = {
+                    "original_url": original_url,
+                    "clicks": clicks,
+                    "created_at": created_at
+                }
+                if self.code_filter is not None:
+                    self.code_filter.add(short_code)
 
     def get_url_info(self, short_code: str):
         with self.lock:
             return self.urls.get(short_code)
 
+    def get_many(self, short_codes) -> dict:
+        """
+        Looks up many codes under one lock acquisition.
+        Returns {short_code: (original_url, clicks, created_at)} for codes that exist.
+        """
+        found = {}
+        with self.lock:
+            for short_code in short_codes:
+                url_info = self.urls.get(short_code)
+                if url_info is not None:
+                    found[short_code] = (url_info["original_url"], url_info["clicks"], url_info["created_at"])
+        return found
+
     def increment_clicks(self, short_code: str):
         with self.lock:
             if short_code in self.urls:
                 self.urls[short_code]["clicks"] += 1
+                if self.journal is not None:
+                    self.journal.log_clicks({short_code: 1})
                 return True
             return False
 
+    def add_clicks(self, counts: dict):
+        """
+        Applies a batch of click deltas {short_code: delta} under one lock.
+        Codes that no longer exist are ignored.
+        """
+        with self.lock:
+            applied = {}
+            for short_code, delta in counts.items():
+                url_info = self.urls.get(short_code)
+                if url_info is not None:
+                    url_info["clicks"] += delta
+                    applied[short_code] = delta
+            if applied and self.journal is not None:
+                self.journal.log_clicks(applied)
+
+    def delete_many(self, short_codes) -> int:
+        """
+        Removes the given links (missing codes are ignored) under one lock.
+        Returns the approximate number of bytes released.
+        """
+        freed = 0
+        with self.lock:
+            for short_code in short_codes:
+                url_info = self.urls.pop(short_code, None)
+                if url_info is not None:
+                    freed += sys.getsizeof(short_code) + sys.getsizeof(url_info) + sys.getsizeof(url_info["original_url"])
+                    self._invalidate(short_code)
+        return freed
+
     def is_short_code_taken(self, short_code: str) -> bool:
         with self.lock:
             return short_code in self.urls
 
-# Initialize a global URL store instance
-url_store = URLStore()
\ No newline at end of file
+    def iter_entries(self, chunk_size: int = 1000):
+        """
+        Yields (short_code, original_url, clicks, created_at) for every link
+        that existed when iteration started. The lock is only held while
+        copying the key list and while reading each chunk, so this is not a
+        point-in-time snapshot: clicks and overwrites made while iterating
+        show up in chunks read afterwards.
+        """
+        with self.lock:
+            codes = list(self.urls)
+        for start in range(0, len(codes), chunk_size):
+            with self.lock:
+                chunk = []
+                for short_code in codes[start:start + chunk_size]:
+                    url_info = self.urls.get(short_code)
+                    if url_info is not None:
+                        chunk.append((short_code, url_info["original_url"], url_info["clicks"], url_info["created_at"]))
+            yield from chunk
+
+    def clear(self):
+        with self.lock:
+            self.urls.clear()
+            self._invalidate(None)
+
+    def __len__(self):
+        return len(self.urls)
+
+class ShardedURLStore:
+    """
+    Lock-striped URLStore. Each short code hashes to one of N independent
+    shards with its own lock and dictionary, so operations on different codes
+    do not wait for each other. Exposes the same API as URLStore.
+    """
+
+    def __init__(self, num_shards: int = 16, allocator=None, journal=None, store_class=None):
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        self.allocator = allocator or RandomCodeAllocator()
+        # Every shard is a plain store (URLStore by default) sharing the allocator and journal
+        store_class = store_class or URLStore
+        self.shards = [store_class(allocator=self.allocator, journal=journal) for _ in range(num_shards)]
+        # One hook list shared by every shard
+        self.invalidation_hooks = []
+        for shard in self.shards:
+            shard.invalidation_hooks = self.invalidation_hooks
+
+    @property
+    def journal(self):
+        return self.shards[0].journal
+
+    @journal.setter
+    def journal(self, journal):
+        for shard in self.shards:
+            shard.journal = journal
+
+    @property
+    def code_filter(self):
+        return self.shards[0].code_filter
+
+    @code_filter.setter
+    def code_filter(self, code_filter):
+        for shard in self.shards:
+            shard.code_filter = code_filter
+
+    def shard_index(self, short_code: str) -> int:
+        return hash(short_code) % len(self.shards)
+
+    def shard_for(self, short_code: str):
+        return self.shards[self.shard_index(short_code)]
+
+    def create_url(self, original_url: str) -> str:
+        # A code always maps to the same shard, so reserving it under that
+        # shard's lock is enough to keep it globally unique.
+        while True:
+            short_code = self.allocator.next_code()
+            if self.shard_for(short_code).try_insert(short_code, original_url):
+                return short_code
+
+    def create_urls(self, original_urls: list) -> list:
+        # Propose codes for the whole batch, then insert them with one write
+        # per shard; codes that turn out to be taken are re-proposed.
+        short_codes = [None] * len(original_urls)
+        pending = list(range(len(original_urls)))
+        while pending:
+            by_shard = {}
+            for position in pending:
+                short_code = self.allocator.next_code()
+                by_shard.setdefault(self.shard_index(short_code), []).append((position, short_code))
+            pending = []
+            for index, proposals in by_shard.items():
+                taken = self.shards[index].insert_many(
+                    [(short_code, original_urls[position]) for position, short_code in proposals]
+                )
+                for position, short_code in proposals:
+                    if short_code in taken:
+                        pending.append(position)
+                    else:
+                        short_codes[position] = short_code
+        return short_codes
+
+    def add_url(self, short_code: str, original_url: str):
+        self.shard_for(short_code).add_url(short_code, original_url)
+
+    def load_entries(self, entries):
+        # Route entries to their shards in bounded batches
+        batches = [[] for _ in self.shards]
+        for entry in entries:
+            index = self.shard_index(entry[0])
+            batches[index].append(entry)
+            if len(batches[index]) >= 1000:
+                self.shards[index].load_entries(batches[index])
+                batches[index] = []
+        for shard, batch in zip(self.shards, batches):
+            shard.load_entries(batch)
+
+    def get_url_info(self, short_code: str):
+        return self.shard_for(short_code).get_url_info(short_code)
+
+    def get_many(self, short_codes) -> dict:
+        by_shard = {}
+        for short_code in short_codes:
+            by_shard.setdefault(self.shard_index(short_code), []).append(short_code)
+        found = {}
+        for index, shard_codes in by_shard.items():
+            found.update(self.shards[index].get_many(shard_codes))
+        return found
+
+    def increment_clicks(self, short_code: str):
+        return self.shard_for(short_code).increment_clicks(short_code)
+
+    def add_clicks(self, counts: dict):
+        # Group the batch by shard so each shard lock is taken once
+        by_shard = {}
+        for short_code, delta in counts.items():
+            by_shard.setdefault(self.shard_index(short_code), {})[short_code] = delta
+        for index, shard_counts in by_shard.items():
+            self.shards[index].add_clicks(shard_counts)
+
+    def delete_many(self, short_codes) -> int:
+        by_shard = {}
+        for short_code in short_codes:
+            by_shard.setdefault(self.shard_index(short_code), []).append(short_code)
+        return sum(self.shards[index].delete_many(shard_codes) for index, shard_codes in by_shard.items())
+
+    def is_short_code_taken(self, short_code: str) -> bool:
+        return self.shard_for(short_code).is_short_code_taken(short_code)
+
+    def iter_entries(self, chunk_size: int = 1000):
+        for shard in self.shards:
+            yield from shard.iter_entries(chunk_size)
+
+    def clear(self):
+        for shard in self.shards:
+            shard.clear()
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+# Storage engines selectable with SHORTENER_STORE_ENGINE
+STORE_ENGINES = {
+    "dict": URLStore,
+    "compact": CompactURLStore,
+}
+
+def create_url_store(metrics=None):
+    """
+    Builds the URL store described by app.config.
+    Returns (store, link_expiry); link_expiry is None when expiry is disabled.
+    With 'metrics', the store locks record their contended waits.
+    """
+    allocator = make_allocator(
+        config.CODE_ALLOCATOR,
+        secret=config.CODE_SECRET,
+        pool_size=config.CODE_POOL_SIZE,
+    )
+    if config.STORE_ENGINE == "shared":
+        return create_shared_store(allocator), None
+    if config.STORE_ENGINE == "sqlite":
+        return create_sqlite_store(allocator)
+    store_class = STORE_ENGINES.get(config.STORE_ENGINE)
+    if store_class is None:
+        raise ValueError(f"Unknown store engine: {config.STORE_ENGINE!r}")
+    if config.STORE_SHARDS > 1:
+        store = ShardedURLStore(num_shards=config.STORE_SHARDS, allocator=allocator, store_class=store_class)
+    else:
+        store = store_class(allocator=allocator)
+
+    if metrics is not None:
+        instrument_store_locks(store, metrics.lock_waits)
+
+    if config.BLOOM_FILTER:
+        # Attached before any data is loaded so it sees every stored code
+        store.code_filter = BloomFilter(capacity=config.BLOOM_CAPACITY, fp_rate=config.BLOOM_FP_RATE)
+
+    link_expiry = None
+    if config.LINK_EXPIRY:
+        link_expiry = LinkExpiry(store, sweep_interval=config.EXPIRY_SWEEP_INTERVAL)
+        store.invalidation_hooks.append(link_expiry.on_store_invalidated)
+
+    if config.DATA_DIR:
+        persistence = Persistence(
+            config.DATA_DIR,
+            commit_interval=config.LOG_COMMIT_INTERVAL,
+            sync_writes=config.LOG_SYNC_WRITES,
+            snapshot_interval=config.SNAPSHOT_INTERVAL,
+        )
+        # Restore before attaching the journal so the replay is not re-logged
+        allocator.resume(persistence.load_into(store, link_expiry))
+        persistence.start()
+        store.journal = persistence
+        if link_expiry is not None:
+            link_expiry.journal = persistence
+        atexit.register(persistence.close)
+
+    if link_expiry is not None:
+        link_expiry.start()
+        atexit.register(link_expiry.close)
+    return store, link_expiry
+
+def create_shared_store(allocator):
+    """
+    Attaches to (or creates) the shared memory store. Per-process components
+    that must see every write cannot be combined with it: a Bloom filter would
+    reject codes created by other workers, and each worker would replay and
+    append to the same event log. Link expiry is per-process too (deadlines
+    set in one worker would not be seen by the others), so it stays off.
+    """
+    if config.BLOOM_FILTER or config.DATA_DIR:
+        raise ValueError("The shared store engine cannot be combined with SHORTENER_BLOOM_FILTER or SHORTENER_DATA_DIR")
+    if config.STORE_SHARDS > 1:
+        raise ValueError("The shared store engine has its own table; leave SHORTENER_STORE_SHARDS at 1")
+    store = SharedMemoryURLStore(
+        name=config.SHM_NAME,
+        capacity=config.SHM_CAPACITY,
+        arena_bytes=config.SHM_ARENA_BYTES,
+        allocator=allocator,
+    )
+    atexit.register(store.close)
+    return store
+
+def create_sqlite_store(allocator):
+    """
+    Opens the SQLite store. The database is durable by itself, so the event
+    log is not used; link deadlines are stored in the database as well, with
+    the store acting as link_expiry's journal.
+    """
+    if config.DATA_DIR:
+        raise ValueError("The sqlite store engine is durable by itself; leave SHORTENER_DATA_DIR empty")
+    if config.STORE_SHARDS > 1:
+        raise ValueError("The sqlite store engine does its own locking; leave SHORTENER_STORE_SHARDS at 1")
+    store = SQLiteURLStore(config.SQLITE_PATH, allocator=allocator, batch_size=config.SQLITE_BATCH_SIZE,
+                           idle_readers=config.SQLITE_IDLE_READERS)
+    atexit.register(store.close)
+    allocator.resume(len(store))
+    if config.BLOOM_FILTER:
+        store.code_filter = BloomFilter(capacity=config.BLOOM_CAPACITY, fp_rate=config.BLOOM_FP_RATE)
+
+    link_expiry = None
+    if config.LINK_EXPIRY:
+        link_expiry = LinkExpiry(store, sweep_interval=config.EXPIRY_SWEEP_INTERVAL)
+        store.invalidation_hooks.append(link_expiry.on_store_invalidated)
+        link_expiry.load(store.deadlines())
+        link_expiry.journal = store
+        link_expiry.start()
+        # Registered after store.close, so it runs first
+        atexit.register(link_expiry.close)
+    return store, link_expiry
+
+# Latency and lock contention metrics for /api/metrics (None when disabled)
+metrics = Metrics() if config.METRICS else None
+# Initialize a global URL store instance, with link expiry (None when disabled)
+url_store, link_expiry = create_url_store(metrics)
+if metrics is not None:
+    metrics.add_gauge("url_shortener_links", "Links in the URL store.", lambda: len(url_store))
+# Negative-lookup filter shared with the store (None when disabled)
+code_filter = url_store.code_filter
+# Click counting for the redirect path (write-behind unless disabled)
+click_counter = create_click_counter(
+    url_store,
+    buffered=config.CLICK_BUFFERING,
+    flush_interval=config.CLICK_FLUSH_INTERVAL,
+    flush_threshold=config.CLICK_FLUSH_THRESHOLD,
+)
+atexit.register(click_counter.close)
+url_store.invalidation_hooks.append(click_counter.on_store_invalidated)
+# Per-link minute/hour/day click windows for /api/stats/<short_code>?window=
+click_analytics = ClickAnalytics() if config.CLICK_WINDOWS else None
+if click_analytics is not None:
+    url_store.invalidation_hooks.append(click_analytics.on_store_invalidated)
+# HyperLogLog unique visitor estimates per link (None when disabled)
+unique_visitors = None
+if config.UNIQUE_VISITORS:
+    unique_visitors = UniqueVisitors(
+        precision=config.UNIQUE_VISITORS_PRECISION,
+        days=config.UNIQUE_VISITORS_DAYS,
+        salt=config.UNIQUE_VISITORS_SALT,
+    )
+    url_store.invalidation_hooks.append(unique_visitors.on_store_invalidated)
+# Heavy-hitter sketches behind /api/stats/top (None when disabled)
+top_links = TopLinks(capacity=config.TOP_LINKS_CAPACITY) if config.TOP_LINKS else None
+if top_links is not None:
+    url_store.invalidation_hooks.append(top_links.on_store_invalidated)
+# Reverse index for returning existing codes on repeated shortens (opt-in)
+dedupe_index = ReverseIndex() if config.DEDUPE else None
+if dedupe_index is not None and len(url_store):
+    # Links with a TTL are never handed out to other shortens
+    dedupe_index.rebuild(
+        url_store,
+        exclude=(lambda short_code: link_expiry.expires_at(short_code) is not None) if link_expiry else None,
+    )
@@ -0,0 +1,430 @@
+# persistence.py
+# Optional durable storage for URLStore.
+#
+# Mutations are appended to a binary event log. A background writer batches
+# pending events into one write + fsync (group commit). Periodically the log is
+# compacted into a snapshot laid out so that it can be read straight out of a
+# memory map on startup; only the log segments written after that snapshot
+# need to be replayed.
+#
+# Directory layout:
+#   snapshot.bin            latest compacted state
+#   events-00000042.log     log segments, replayed in order
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+EVENT_SHORTEN = 1
+EVENT_CLICKS = 2
+EVENT_EXPIRY = 3
+
+# Every log frame is: payload length, crc32 of payload, payload.
+# A payload holds one or more event records back to back.
+_FRAME = struct.Struct("<II")
+# Shorten record: type, code length, url length, created_at, then code and url bytes
+_SHORTEN = struct.Struct("<BBId")
+# Click record: type, code length, delta, then code bytes
+_CLICKS = struct.Struct("<BBQ")
+# Expiry record: type, code length, expires_at, then code bytes
+_EXPIRY = struct.Struct("<BBd")
+
+_SNAPSHOT_NAME = "snapshot.bin"
+_SNAPSHOT_MAGIC = b"USSNAP02"
+# Header: magic, last segment folded into the snapshot, entry count
+_SNAPSHOT_HEADER = struct.Struct("<8sQQ")
+# Fixed-size index entry: arena offset, code length, url length, clicks,
+# created_at, expires_at (0 = never). The code and url bytes live back to back
+# in the arena after the index.
+_SNAPSHOT_ENTRY = struct.Struct("<QBIQdd")
+# Version 1 snapshots have no expires_at and are still readable
+_SNAPSHOT_MAGIC_V1 = b"USSNAP01"
+_SNAPSHOT_ENTRY_V1 = struct.Struct("<QBIQd")
+# Events applied to the store per batch while replaying a segment
+_REPLAY_BATCH = 10000
+
+def _segment_name(number: int) -> str:
+    return f"events-{number:08d}.log"
+
+def encode_shorten(short_code: str, original_url: str, created_at: float) -> bytes:
+    code = short_code.encode()
+    url = original_url.encode()
+    return _SHORTEN.pack(EVENT_SHORTEN, len(code), len(url), created_at) + code + url
+
+def encode_clicks(counts: dict) -> bytes:
+    parts = []
+    for short_code, delta in counts.items():
+        code = short_code.encode()
+        parts.append(_CLICKS.pack(EVENT_CLICKS, len(code), delta) + code)
+    return b"".join(parts)
+
+def encode_expiry(entries: list) -> bytes:
+    # A None deadline (removed) is stored as 0.0, as in snapshots
+    parts = []
+    for short_code, expires_at in entries:
+        code = short_code.encode()
+        parts.append(_EXPIRY.pack(EVENT_EXPIRY, len(code), expires_at or 0.0) + code)
+    return b"".join(parts)
+
+def iter_events(payload: bytes):
+    """
+    Decodes the records of one log frame. Yields (EVENT_SHORTEN, code, url,
+    created_at), (EVENT_CLICKS, code, delta) or (EVENT_EXPIRY, code, expires_at);
+    an expires_at of 0.0 means the deadline was removed.
+    """
+    view = memoryview(payload)
+    position = 0
+    while position < len(view):
+        event_type = view[position]
+        if event_type == EVENT_SHORTEN:
+            _, code_len, url_len, created_at = _SHORTEN.unpack_from(view, position)
+            position += _SHORTEN.size
+            code = bytes(view[position:position + code_len]).decode()
+            position += code_len
+            url = bytes(view[position:position + url_len]).decode()
+            position += url_len
+            yield EVENT_SHORTEN, code, url, created_at
+        elif event_type == EVENT_CLICKS:
+            _, code_len, delta = _CLICKS.unpack_from(view, position)
+            position += _CLICKS.size
+            code = bytes(view[position:position + code_len]).decode()
+            position += code_len
+            yield EVENT_CLICKS, code, delta
+        elif event_type == EVENT_EXPIRY:
+            _, code_len, expires_at = _EXPIRY.unpack_from(view, position)
+            position += _EXPIRY.size
+            code = bytes(view[position:position + code_len]).decode()
+            position += code_len
+            yield EVENT_EXPIRY, code, expires_at
+        else:
+            raise ValueError(f"Unknown event type {event_type}")
+
+def read_segment(path: str):
+    """
+    Yields the payload of every intact frame in a log segment. Reading stops
+    at the first truncated or corrupt frame (a torn write from a crash).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    position = 0
+    while position + _FRAME.size <= len(data):
+        length, checksum = _FRAME.unpack_from(data, position)
+        start = position + _FRAME.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            return
+        yield payload
+        position = start + length
+
+def read_snapshot(path: str):
+    """
+    Memory-maps a snapshot and returns (last_segment, entries) where entries
+    yields (short_code, original_url, clicks, created_at, expires_at) tuples
+    (expires_at is 0.0 for links that never expire).
+    Returns (0, ()) if there is no snapshot.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) < _SNAPSHOT_HEADER.size:
+        return 0, ()
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, last_segment, count = _SNAPSHOT_HEADER.unpack_from(mapped, 0)
+    if magic not in (_SNAPSHOT_MAGIC, _SNAPSHOT_MAGIC_V1):
+        mapped.close()
+        raise ValueError(f"{path} is not a URL store snapshot")
+    entry_format = _SNAPSHOT_ENTRY if magic == _SNAPSHOT_MAGIC else _SNAPSHOT_ENTRY_V1
+
+    def entries():
+        try:
+            index_end = _SNAPSHOT_HEADER.size + count * entry_format.size
+            index = memoryview(mapped)[_SNAPSHOT_HEADER.size:index_end]
+            try:
+                for offset, code_len, url_len, clicks, created_at, *expiry in entry_format.iter_unpack(index):
+                    url_start = offset + code_len
+                    yield (
+                        mapped[offset:url_start].decode(),
+                        mapped[url_start:url_start + url_len].decode(),
+                        clicks,
+                        created_at,
+                        expiry[0] if expiry else 0.0,
+                    )
+            finally:
+                index.release()
+        finally:
+            mapped.close()
+
+    return last_segment, entries()
+
+def write_snapshot(path: str, last_segment: int, entries: dict):
+    """
+    Writes {short_code: [original_url, clicks, created_at, expires_at]} as a
+    snapshot. The file is written next to the target and renamed into place
+    atomically.
+    """
+    encoded = [(code.encode(), url.encode(), clicks, created_at, expires_at)
+               for code, (url, clicks, created_at, expires_at) in entries.items()]
+    offset = _SNAPSHOT_HEADER.size + len(encoded) * _SNAPSHOT_ENTRY.size
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, last_segment, len(encoded)))
+        for code, url, clicks, created_at, expires_at in encoded:
+            f.write(_SNAPSHOT_ENTRY.pack(offset, len(code), len(url), clicks, created_at, expires_at))
+            offset += len(code) + len(url)
+        for code, url, _, _, _ in encoded:
+            f.write(code)
+            f.write(url)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+class EventLog:
+    """
+    Append-only log with group commit. append() only queues the frame; a
+    writer thread writes everything queued since the last commit with one
+    write() and one fsync(). Callers that need durability wait_durable() on the
+    sequence number append() returned.
+    """
+
+    def __init__(self, directory: str, segment: int, commit_interval: float = 0.005):
+        self.directory = directory
+        self.segment = segment
+        self.commit_interval = commit_interval
+        self._file = open(os.path.join(directory, _segment_name(segment)), "ab")
+        self._pending = []
+        self._appended_seq = 0
+        self._durable_seq = 0
+        # Guards _pending/_appended_seq; _io_lock serialises writes and rotation
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._durable = threading.Condition(threading.Lock())
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._commit_loop, name="event-log-writer", daemon=True)
+        self._thread.start()
+
+    def append(self, payload: bytes) -> int:
+        frame = _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            self._pending.append(frame)
+            self._appended_seq += 1
+            seq = self._appended_seq
+        self._wakeup.set()
+        return seq
+
+    def wait_durable(self, seq: int):
+        with self._durable:
+            while self._durable_seq < seq and not self._stopped:
+                self._durable.wait()
+
+    def rotate(self) -> int:
+        """
+        Commits pending events, seals the current segment and starts a new one.
+        Returns the number of the sealed segment.
+        """
+        with self._io_lock:
+            self._commit()
+            self._file.close()
+            sealed = self.segment
+            self.segment += 1
+            self._file = open(os.path.join(self.directory, _segment_name(self.segment)), "ab")
+        return sealed
+
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout=1)
+        with self._io_lock:
+            self._commit()
+            self._file.close()
+        with self._durable:
+            self._durable.notify_all()
+
+    def _commit(self):
+        # Caller holds self._io_lock
+        with self._lock:
+            frames, self._pending = self._pending, []
+            seq = self._appended_seq
+        if frames:
+            self._file.write(b"".join(frames))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        with self._durable:
+            self._durable_seq = seq
+            self._durable.notify_all()
+
+    def _commit_loop(self):
+        while not self._stopped:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # Give concurrent writers a moment to join this group commit
+            if self.commit_interval:
+                time.sleep(self.commit_interval)
+            with self._io_lock:
+                if not self._file.closed:
+                    self._commit()
+
+class Persistence:
+    """
+    Journal for URLStore backed by an EventLog plus periodic snapshots.
+
+    Usage:
+        persistence = Persistence(directory)
+        persistence.load_into(store)   # snapshot + log replay, before serving
+        persistence.start()            # open a fresh log segment
+        store.journal = persistence
+        expiry.journal = persistence   # if link expiry is enabled
+    """
+
+    def __init__(self, directory: str, commit_interval: float = 0.005,
+                 sync_writes: bool = True, snapshot_interval: float = 300.0):
+        self.directory = directory
+        self.commit_interval = commit_interval
+        # When true, shortens wait for their group commit before returning
+        self.sync_writes = sync_writes
+        self.snapshot_interval = snapshot_interval
+        self.log = None
+        self._compact_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._compactor = None
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, _SNAPSHOT_NAME)
+
+    def segments(self):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith("events-") and name.endswith(".log"):
+                numbers.append(int(name[len("events-"):-len(".log")]))
+        return sorted(numbers)
+
+    def load_into(self, store, expiry=None) -> int:
+        """
+        Restores the store from the snapshot and any newer log segments, and
+        link deadlines into 'expiry' (a LinkExpiry) when given.
+        Returns the number of links loaded.
+        """
+        last_segment, entries = read_snapshot(self.snapshot_path)
+        deadlines = {}
+
+        def links():
+            for short_code, original_url, clicks, created_at, expires_at in entries:
+                if expires_at:
+                    deadlines[short_code] = expires_at
+                yield short_code, original_url, clicks, created_at
+
+        store.load_entries(links())
+        for number in self.segments():
+            if number > last_segment:
+                self._replay(os.path.join(self.directory, _segment_name(number)), store, deadlines)
+        if expiry is not None:
+            expiry.load(deadlines.items())
+        return len(store)
+
+    def start(self):
+        segments = self.segments()
+        # Always append to a fresh segment so a torn tail is never extended
+        self.log = EventLog(self.directory, (segments[-1] if segments else 0) + 1, self.commit_interval)
+        if self.snapshot_interval > 0:
+            self._compactor = threading.Thread(target=self._compact_loop, name="snapshot-compactor", daemon=True)
+            self._compactor.start()
+
+    # Journal interface used by URLStore
+    def log_shorten(self, short_code: str, original_url: str, created_at: float) -> int:
+        return self.log.append(encode_shorten(short_code, original_url, created_at))
+
+    def log_shortens(self, entries: list) -> int:
+        # One frame for a whole batch of (short_code, original_url, created_at)
+        return self.log.append(b"".join(encode_shorten(*entry) for entry in entries))
+
+    def log_clicks(self, counts: dict) -> int:
+        return self.log.append(encode_clicks(counts))
+
+    def log_expiry(self, entries: list) -> int:
+        # Journal interface used by LinkExpiry: (short_code, expires_at) pairs
+        return self.log.append(encode_expiry(entries))
+
+    def wait_durable(self, seq: int):
+        self.log.wait_durable(seq)
+
+    def compact(self):
+        """
+        Folds the current snapshot and all sealed log segments into a new
+        snapshot, then deletes those segments. Works from the files only, so
+        the live store is never locked while this runs (it does need memory
+        proportional to the number of links while folding). Links past their
+        expiry deadline are left out of the new snapshot.
+        """
+        with self._compact_lock:
+            sealed = self.log.rotate()
+            last_segment, snapshot_entries = read_snapshot(self.snapshot_path)
+            paths = [os.path.join(self.directory, _segment_name(n)) for n in self.segments() if n <= sealed]
+            if not any(os.path.getsize(path) for path in paths):
+                # Nothing happened since the last compaction; drop empty segments
+                if hasattr(snapshot_entries, "close"):
+                    snapshot_entries.close()
+                for path in paths:
+                    os.remove(path)
+                return
+            state = {entry[0]: list(entry[1:]) for entry in snapshot_entries}
+            folded = [n for n in self.segments() if last_segment < n <= sealed]
+            for number in folded:
+                for payload in read_segment(os.path.join(self.directory, _segment_name(number))):
+                    for event in iter_events(payload):
+                        if event[0] == EVENT_SHORTEN:
+                            state[event[1]] = [event[2], 0, event[3], 0.0]
+                        elif event[1] not in state:
+                            continue
+                        elif event[0] == EVENT_CLICKS:
+                            state[event[1]][1] += event[2]
+                        else:
+                            state[event[1]][3] = event[2]
+            now = time.time()
+            live = {code: entry for code, entry in state.items() if not 0 < entry[3] <= now}
+            write_snapshot(self.snapshot_path, sealed, live)
+            for path in paths:
+                os.remove(path)
+
+    def close(self):
+        self._stopped.set()
+        if self.log is not None:
+            self.log.close()
+
+    def _replay(self, path: str, store, deadlines: dict):
+        # Consecutive events of one kind are applied as a batch; switching kind
+        # flushes the other batch first so events keep their log order.
+        # Deadlines are collected into 'deadlines'; a new link replaces any
+        # deadline left by an earlier link with the same code.
+        created = []
+        clicks = {}
+        for payload in read_segment(path):
+            for event in iter_events(payload):
+                if event[0] == EVENT_SHORTEN:
+                    if clicks:
+                        store.add_clicks(clicks)
+                        clicks = {}
+                    created.append((event[1], event[2], 0, event[3]))
+                    deadlines.pop(event[1], None)
+                    if len(created) >= _REPLAY_BATCH:
+                        store.load_entries(created)
+                        created = []
+                elif event[0] == EVENT_EXPIRY:
+                    if event[2]:
+                        deadlines[event[1]] = event[2]
+                    else:
+                        deadlines.pop(event[1], None)
+                else:
+                    if created:
+                        store.load_entries(created)
+                        created = []
+                    clicks[event[1]] = clicks.get(event[1], 0) + event[2]
+        if created:
+            store.load_entries(created)
+        if clicks:
+            store.add_clicks(clicks)
+
+    def _compact_loop(self):
+        while not self._stopped.wait(self.snapshot_interval):
+            self.compact()
@@ -0,0 +1,144 @@
+# redirect_cache.py
+# Cache of fully built redirect responses for hot short codes, served by a
+# WSGI middleware before Flask routing runs.
+import threading
+import time
+from collections import OrderedDict
+
+class CachedRedirect:
+    __slots__ = ("status", "headers", "body", "size", "expires_at")
+
+    def __init__(self, status: str, headers: list, body: bytes, expires_at=None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+        self.size = len(body) + sum(len(name) + len(value) for name, value in headers)
+
+class RedirectCache:
+    """
+    LRU cache of prebuilt redirect payloads keyed by short code, bounded both
+    by entry count and by total payload bytes.
+
+    To avoid caching a response built from a mapping that was replaced while
+    the response was being built, writers call token() before reading the
+    store and pass it to put(); any invalidation in between voids the put.
+
+    'generation' is an optional callable returning a counter that changes
+    whenever the store is modified by someone who cannot call invalidate()
+    (another process sharing the store); a change empties the cache.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 16 * 1024 * 1024, generation=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._source = generation
+        self._source_seen = generation() if generation is not None else None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, short_code: str):
+        self._sync()
+        with self._lock:
+            entry = self._entries.get(short_code)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= time.time():
+                # The link expired; it is reclaimed from the store separately
+                del self._entries[short_code]
+                self._bytes -= entry.size
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(short_code)
+            self.hits += 1
+            return entry
+
+    def token(self) -> int:
+        self._sync()
+        return self._generation
+
+    def _sync(self):
+        if self._source is not None:
+            current = self._source()
+            if current != self._source_seen:
+                self._source_seen = current
+                self.invalidate(None)
+
+    def put(self, short_code: str, response, token: int, expires_at=None):
+        """
+        Caches a Werkzeug/Flask response for the code, unless the cache was
+        invalidated since 'token' was taken or the payload is too large.
+        The entry stops being served at 'expires_at' (the link's expiry).
+        """
+        entry = CachedRedirect(response.status, response.headers.to_wsgi_list(), response.get_data(), expires_at)
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            if token != self._generation:
+                return
+            previous = self._entries.pop(short_code, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[short_code] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def invalidate(self, short_code=None):
+        """
+        Drops one code, or everything when short_code is None. Used as a
+        store invalidation hook.
+        """
+        with self._lock:
+            self._generation += 1
+            if short_code is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                entry = self._entries.pop(short_code, None)
+                if entry is not None:
+                    self._bytes -= entry.size
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+class RedirectCacheMiddleware:
+    """
+    WSGI middleware that answers GET /<short_code> from the cache without
+    entering Flask (no request context, routing or response construction).
+    'on_hit' is called with the short code and the WSGI environ so clicks
+    (and visitors) are still tracked.
+    Everything else, including cache misses, goes to the wrapped app.
+    """
+
+    def __init__(self, wsgi_app, cache: RedirectCache, on_hit):
+        self.wsgi_app = wsgi_app
+        self.cache = cache
+        self.on_hit = on_hit
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") == "GET":
+            path = environ.get("PATH_INFO", "")
+            if len(path) > 1 and path.find("/", 1) == -1:
+                short_code = path[1:]
+                entry = self.cache.get(short_code)
+                if entry is not None:
+                    self.on_hit(short_code, environ)
+                    start_response(entry.status, list(entry.headers))
+                    return [entry.body]
+        return self.wsgi_app(environ, start_response)
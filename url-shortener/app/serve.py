@@ -0,0 +1,27 @@
+# serve.py
+# Starts the service in the mode chosen by SHORTENER_SERVER_MODE:
+#   wsgi  Flask app (app/main.py) on the Flask development server
+#   asgi  ASGI app (app/asgi.py) on uvicorn, which must be installed separately
+#
+# Usage (from the url-shortener folder):
+#   python -m app.serve
+#   SHORTENER_SERVER_MODE=asgi python -m app.serve
+# Production WSGI servers can also load app.main:app directly, and ASGI
+# servers app.asgi:app.
+from app import config
+
+def main():
+    if config.SERVER_MODE == "wsgi":
+        from app.main import app
+        app.run(host=config.SERVER_HOST, port=config.SERVER_PORT)
+    elif config.SERVER_MODE == "asgi":
+        try:
+            import uvicorn
+        except ImportError:
+            raise SystemExit("ASGI mode needs an ASGI server: pip install uvicorn")
+        uvicorn.run("app.asgi:app", host=config.SERVER_HOST, port=config.SERVER_PORT)
+    else:
+        raise SystemExit(f"Unknown SHORTENER_SERVER_MODE: {config.SERVER_MODE!r} (use wsgi or asgi)")
+
+if __name__ == "__main__":
+    main()
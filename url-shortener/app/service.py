@@ -0,0 +1,183 @@
+# service.py
+# Request handling shared by the Flask (WSGI) and ASGI front ends. These
+# functions only deal in plain values; each front end parses its own requests
+# and renders the results.
+import time
+from datetime import datetime
+
+from app.analytics import parse_window
+from app.models import url_store, click_counter, click_analytics, code_filter, dedupe_index, link_expiry, top_links, unique_visitors
+from app.stats import parse_timestamp
+from app.utils import is_valid_url
+
+def shorten_link(data):
+    """
+    Validates a shorten request body and stores the link (or, with dedupe,
+    finds the existing one). Returns (short_code, created, expires_at).
+    Raises ValueError with a message for the client on invalid input.
+    """
+    if not isinstance(data, dict) or 'url' not in data:
+        raise ValueError("URL is required in request body.")
+
+    original_url = data['url']
+
+    # Validate URL
+    if not is_valid_url(original_url):
+        raise ValueError("Invalid URL provided.")
+
+    # Optional TTL: expires_in (seconds from now) or expires_at (timestamp)
+    expires_at = parse_expiry(data)
+
+    # Reserve a unique short code and store the mapping in one step.
+    # The store's allocator proposes codes and the store checks them under its
+    # lock, so this stays O(1) no matter how many links exist.
+    # With dedupe enabled, a URL that was already shortened returns its code
+    # (links with a TTL are always new, so they never share a deadline).
+    if expires_at is not None:
+        short_code, created = url_store.create_url(original_url), True
+        link_expiry.set(short_code, expires_at)
+    elif dedupe_index is not None:
+        short_code, created = dedupe_index.shorten(url_store, original_url)
+    else:
+        short_code, created = url_store.create_url(original_url), True
+    return short_code, created, expires_at
+
+def parse_expiry(data):
+    # Returns the expiry timestamp requested in a shorten body, or None
+    expires_in = data.get('expires_in')
+    expires_at = data.get('expires_at')
+    if expires_in is None and expires_at is None:
+        return None
+    if link_expiry is None:
+        raise ValueError("Link expiry is disabled.")
+    if expires_in is not None and expires_at is not None:
+        raise ValueError("Give either expires_in or expires_at, not both.")
+    if expires_in is not None:
+        if isinstance(expires_in, bool) or not isinstance(expires_in, (int, float)) or expires_in <= 0:
+            raise ValueError("expires_in must be a positive number of seconds.")
+        return time.time() + expires_in
+    try:
+        expires_at = parse_timestamp(expires_at)
+    except ValueError:
+        raise ValueError("expires_at must be a Unix timestamp or ISO 8601 string.")
+    if expires_at <= time.time():
+        raise ValueError("expires_at must be in the future.")
+    return expires_at
+
+def find_link(short_code: str):
+    """
+    Returns the stored entry a redirect for short_code should follow, or None.
+    """
+    # Codes the filter rules out cannot exist; reject them without the store lock
+    if code_filter is not None and not code_filter.might_contain(short_code):
+        return None
+
+    # An expired link is a miss even before the timer wheel reclaims it
+    if link_expiry is not None and link_expiry.is_expired(short_code):
+        return None
+
+    url_info = url_store.get_url_info(short_code)
+    if not url_info and code_filter is not None:
+        code_filter.record_false_positive()
+    return url_info
+
+def link_expires_at(short_code: str):
+    return link_expiry.expires_at(short_code) if link_expiry is not None else None
+
+def visitor_fingerprint(remote_addr, user_agent):
+    # Identifies a client for unique visitor counts; None when they are not
+    # counted, so callers skip building it
+    if unique_visitors is None:
+        return None
+    return f"{remote_addr or ''}|{user_agent or ''}"
+
+def track_redirect(short_code, visitor=None):
+    # Track each redirect (increment click count).
+    # With write-behind buffering this only touches a thread-local counter.
+    click_counter.record(short_code)
+    # Per-minute/hour/day ring buffers, O(1) per click
+    if click_analytics is not None:
+        click_analytics.record(short_code)
+    # Heavy-hitter sketches for /api/stats/top, O(1) amortised per click
+    if top_links is not None:
+        top_links.record(short_code)
+    # HyperLogLog registers for unique visitors, fed with the hashed fingerprint
+    if visitor is not None:
+        unique_visitors.record(short_code, visitor)
+
+def top_link_stats(k: int, window=None):
+    """
+    Returns up to k of the most clicked links that still exist, most clicked
+    first. 'window' (e.g. "24h" or "7d") limits the ranking to recent clicks;
+    an invalid or unavailable window raises ValueError.
+    """
+    if window is None:
+        rows = top_links.top()
+    else:
+        unit, buckets = parse_window(window)
+        rows = top_links.top(unit, buckets)
+    # Deleted and expired links can still be in the sketches; they are skipped,
+    # looking links up one chunk of k at a time until k are found
+    links = []
+    for start in range(0, len(rows), k):
+        chunk = rows[start:start + k]
+        found = url_store.get_many(short_code for short_code, _, _ in chunk)
+        for short_code, clicks, error in chunk:
+            if short_code not in found:
+                continue
+            if link_expiry is not None and link_expiry.is_expired(short_code):
+                continue
+            links.append({
+                "short_code": short_code,
+                "url": found[short_code][0],
+                "clicks": clicks,
+                "error": error,
+            })
+            if len(links) == k:
+                return links
+    return links
+
+def link_stats(short_code: str, window=None):
+    """
+    Returns the stats body for a link, or None if it does not exist.
+    'window' (e.g. "60m" or "30d") adds a windowed click series; an invalid
+    or unavailable window raises ValueError.
+    """
+    url_info = url_store.get_url_info(short_code)
+
+    if not url_info or (link_expiry is not None and link_expiry.is_expired(short_code)):
+        return None
+
+    # Return click count, creation timestamp, and original URL
+    created_at_dt = datetime.fromtimestamp(url_info["created_at"])
+    # Format timestamp as ISO 8601 string
+    created_at_iso = created_at_dt.isoformat()
+
+    # Exact count, including clicks that have not been flushed to the store yet
+    clicks = click_counter.get_clicks(short_code)
+
+    stats = {
+        "url": url_info["original_url"],
+        "clicks": clicks if clicks is not None else url_info["clicks"],
+        "created_at": created_at_iso
+    }
+    expires_at = link_expires_at(short_code)
+    if expires_at is not None:
+        stats["expires_at"] = datetime.fromtimestamp(expires_at).isoformat()
+
+    if unique_visitors is not None:
+        stats["unique_visitors"] = unique_visitors.estimate(short_code)
+
+    # Optional windowed view, e.g. ?window=60m or ?window=30d
+    if window is not None:
+        if click_analytics is None:
+            raise ValueError("Windowed stats are disabled.")
+        unit, buckets = parse_window(window)
+        view = click_analytics.window(short_code, unit, buckets)
+        view["start"] = datetime.fromtimestamp(view["start"]).isoformat()
+        # Unique visitors are kept per day, so only day windows get them
+        if unique_visitors is not None and unit == "day" and buckets <= unique_visitors.days:
+            view["unique_visitors"] = unique_visitors.estimate(short_code, buckets)
+        stats["window"] = view
+
+    return stats
@@ -0,0 +1,482 @@
+# shared.py
+# URL store kept in a named shared memory segment so every worker process on
+# the host (e.g. gunicorn workers) sees the same links and click counts.
+#
+# The segment holds a header followed by fixed-size columns, all 8-byte words:
+#
+#   header       8 x Q   magic, capacity, table size, arena size, rows,
+#                        arena bytes used, generation, epoch
+#   _table       q[T]    open-addressing hash table of row + 1 (0 = empty)
+#   _codes       q[C]    short code encoded as a base62 integer
+#   _offsets     Q[C]    start of the URL in the byte arena
+#   _lengths     Q[C]    URL length in bytes
+#   _clicks      Q[C]    click count
+#   _created_at  d[C]    creation timestamp
+#   arena        bytes   UTF-8 URL bytes, back to back
+#
+# Unlike CompactURLStore the columns cannot grow (other processes have them
+# mapped), so capacity and arena size are fixed when the segment is created.
+# Every write holds an inter-process lock: a threading.Lock for the threads of
+# this process plus flock() on a lock file for the other processes. Lookups
+# take no lock. New rows are published by their table slot only once written,
+# and writes that change existing rows (overwrites, clear) keep the generation
+# word odd while in progress, so a lookup that saw it odd or changed retries.
+import fcntl
+import os
+import tempfile
+import threading
+import time
+import weakref
+from multiprocessing import resource_tracker, shared_memory
+
+from app.allocators import RandomCodeAllocator
+from app.compact import URLRecord, encode_code
+from app.utils import ALPHANUMERIC_CHARS, SHORT_CODE_LENGTH, encode_base62
+
+_MAGIC = 0x31534C5255524853  # "SHRURLS1"
+_HEADER_WORDS = 8
+# Header word indexes
+_CAPACITY, _TABLE_SIZE, _ARENA_SIZE, _ROWS, _ARENA_USED, _GENERATION, _EPOCH = range(1, 8)
+_EMPTY = 0
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK_64 = (1 << 64) - 1
+_MAX_LOAD = 0.6
+# Lock-free attempts a lookup makes before waiting for the writer's lock
+_OPTIMISTIC_READS = 8
+
+class ProcessLock:
+    """
+    Lock that excludes both the threads of this process and other processes.
+    flock() locks belong to the open file, so threads need their own lock too,
+    and a forked child (e.g. a gunicorn worker started with --preload) reopens
+    the file rather than sharing its parent's.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._open()
+        lock = weakref.ref(self)
+
+        def reopen():
+            if lock() is not None:
+                lock()._reopen()
+
+        os.register_at_fork(after_in_child=reopen)
+
+    def _open(self):
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def _reopen(self):
+        # In a forked child the inherited descriptor still refers to the
+        # parent's open file, and the thread lock may have been held by a parent
+        # thread that doesn't exist here
+        if self._fd is not None:
+            os.close(self._fd)
+            self._open()
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def close(self):
+        os.close(self._fd)
+        self._fd = None
+
+def _table_size(capacity: int) -> int:
+    size = 1
+    while size * _MAX_LOAD < capacity:
+        size *= 2
+    return size
+
+class SharedMemoryURLStore:
+    """
+    Store with the same API as URLStore, backed by a shared memory segment
+    named 'name'. The first process creates and formats the segment; later
+    processes attach to it. The segment outlives the processes (so links
+    survive worker restarts) until unlink() is called.
+
+    Only 6-character alphanumeric short codes are accepted. Hooks
+    (journal, code_filter, invalidation_hooks) only see changes made by this
+    process.
+    """
+
+    def __init__(self, name: str = "url-shortener", capacity: int = 1_000_000,
+                 arena_bytes: int = 128 * 1024 * 1024, allocator=None, journal=None):
+        self.name = name
+        self.allocator = allocator or RandomCodeAllocator()
+        self.journal = journal
+        self.code_filter = None
+        self.invalidation_hooks = []
+        self.lock = ProcessLock(os.path.join(tempfile.gettempdir(), f"{name}.lock"))
+        with self.lock:
+            self._shm = self._open_segment(name, capacity, arena_bytes)
+        self._map_columns()
+
+    # --- segment ----------------------------------------------------------
+
+    @staticmethod
+    def _open_segment(name: str, capacity: int, arena_bytes: int):
+        # Caller holds self.lock, so creation and formatting are not raced
+        table_size = _table_size(capacity)
+        words = _HEADER_WORDS + table_size + 5 * capacity
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=8 * words + arena_bytes)
+            header = shm.buf[:8 * _HEADER_WORDS].cast("Q")
+            header[_CAPACITY] = capacity
+            header[_TABLE_SIZE] = table_size
+            header[_ARENA_SIZE] = arena_bytes
+            header[0] = _MAGIC
+            header.release()
+        except FileExistsError:
+            shm = shared_memory.SharedMemory(name=name)
+            header = shm.buf[:8 * _HEADER_WORDS].cast("Q")
+            valid = header[0] == _MAGIC
+            header.release()
+            if not valid:
+                shm.close()
+                raise ValueError(f"Shared memory segment {name!r} is not a URL store")
+        # The resource tracker would unlink the segment when this process exits,
+        # taking it away from the other workers; lifetime is managed by unlink()
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+    def _map_columns(self):
+        buf = self._shm.buf
+        self._header = buf[:8 * _HEADER_WORDS].cast("Q")
+        capacity = self.capacity = self._header[_CAPACITY]
+        table_size = self._header[_TABLE_SIZE]
+        self.arena_size = self._header[_ARENA_SIZE]
+        offset = 8 * _HEADER_WORDS
+
+        def column(fmt, length):
+            nonlocal offset
+            view = buf[offset:offset + 8 * length].cast(fmt)
+            offset += 8 * length
+            return view
+
+        self._table = column("q", table_size)
+        self._codes = column("q", capacity)
+        self._offsets = column("Q", capacity)
+        self._lengths = column("Q", capacity)
+        self._clicks = column("Q", capacity)
+        self._created_at = column("d", capacity)
+        self._arena = buf[offset:offset + self.arena_size]
+        self._views = (self._header, self._table, self._codes, self._offsets,
+                       self._lengths, self._clicks, self._created_at, self._arena)
+
+    def close(self):
+        """
+        Detaches this process from the segment (the data stays in place).
+        """
+        for view in self._views:
+            view.release()
+        self._views = ()
+        self._shm.close()
+        self.lock.close()
+
+    def unlink(self):
+        """
+        Removes the segment and its lock file; processes already attached keep
+        their mapping until they close it.
+        """
+        with self.lock:
+            try:
+                os.unlink(self.lock.path)
+            except FileNotFoundError:
+                pass
+        resource_tracker.register(self._shm._name, "shared_memory")
+        self._shm.unlink()
+
+    # --- hash table -------------------------------------------------------
+
+    def _slot(self, key: int) -> int:
+        table = self._table
+        codes = self._codes
+        mask = len(table) - 1
+        slot = ((key * _HASH_MULTIPLIER) & _MASK_64) >> 20 & mask
+        while True:
+            row = table[slot]
+            if row == _EMPTY or codes[row - 1] == key:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _find_row(self, key: int) -> int:
+        # Returns the row index or -1. Without self.lock, see _read().
+        row = self._table[self._slot(key)]
+        return row - 1 if row != _EMPTY else -1
+
+    # --- storage ----------------------------------------------------------
+
+    def _put(self, key: int, original_url: str, clicks: int, created_at: float):
+        # Caller holds self.lock. Inserts a new row or overwrites an existing one.
+        encoded = original_url.encode()
+        header = self._header
+        start = header[_ARENA_USED]
+        if start + len(encoded) > self.arena_size:
+            raise RuntimeError(f"Shared URL store {self.name!r} is out of arena space")
+        slot = self._slot(key)
+        row = self._table[slot] - 1
+        overwrite = row >= 0
+        if not overwrite:
+            row = header[_ROWS]
+            if row >= self.capacity:
+                raise RuntimeError(f"Shared URL store {self.name!r} is full ({self.capacity} links)")
+            self._codes[row] = key
+        self._arena[start:start + len(encoded)] = encoded
+        header[_ARENA_USED] = start + len(encoded)
+        if overwrite:
+            self._begin_write()
+        self._offsets[row] = start
+        self._lengths[row] = len(encoded)
+        self._clicks[row] = clicks
+        self._created_at[row] = created_at
+        if overwrite:
+            self._end_write()
+            for hook in self.invalidation_hooks:
+                hook(encode_base62(key))
+        else:
+            # Publish the row only once its columns are written
+            self._table[slot] = row + 1
+            header[_ROWS] = row + 1
+        if self.code_filter is not None:
+            self.code_filter.add(encode_base62(key))
+
+    def _begin_write(self):
+        # Caller holds self.lock. Makes the generation odd until _end_write(); a
+        # writer that died half way may have left it odd already.
+        self._header[_GENERATION] = (self._header[_GENERATION] + 1) | 1
+
+    def _end_write(self):
+        self._header[_GENERATION] += 1
+
+    def _read(self, lookup):
+        """
+        Runs lookup() without the lock, retrying if a write that changes
+        existing rows overlapped it, and under the lock if that keeps happening.
+        """
+        header = self._header
+        for _ in range(_OPTIMISTIC_READS):
+            generation = header[_GENERATION]
+            if generation & 1:
+                time.sleep(0)
+                continue
+            try:
+                result = lookup()
+            except UnicodeDecodeError:
+                # Offset and length from different versions of a row
+                if header[_GENERATION] == generation:
+                    raise
+                continue
+            if header[_GENERATION] == generation:
+                return result
+        with self.lock:
+            return lookup()
+
+    def _url(self, row: int) -> str:
+        offset = self._offsets[row]
+        return bytes(self._arena[offset:offset + self._lengths[row]]).decode()
+
+    def _record(self, row: int) -> URLRecord:
+        return URLRecord(encode_base62(self._codes[row]), self._url(row), self._clicks[row], self._created_at[row])
+
+    def _insert(self, key: int, short_code: str, original_url: str):
+        # Caller holds self.lock. Returns the journal sequence number, if any.
+        created_at = time.time()
+        self._put(key, original_url, 0, created_at)
+        if self.journal is not None:
+            return self.journal.log_shorten(short_code, original_url, created_at)
+        return None
+
+    def _wait_durable(self, seq):
+        if seq is not None and self.journal.sync_writes:
+            self.journal.wait_durable(seq)
+
+    def _free_code(self):
+        # Caller holds self.lock. Codes are checked against the shared table, so
+        # workers drawing from independent allocators never hand out duplicates.
+        while True:
+            short_code = self.allocator.next_code()
+            key = self._require_key(short_code)
+            if self._find_row(key) < 0:
+                return short_code, key
+
+    @staticmethod
+    def _require_key(short_code: str) -> int:
+        key = encode_code(short_code)
+        if key is None:
+            raise ValueError(
+                f"SharedMemoryURLStore only stores {SHORT_CODE_LENGTH}-character codes from {ALPHANUMERIC_CHARS!r}"
+            )
+        return key
+
+    # --- URLStore API -----------------------------------------------------
+
+    @property
+    def generation(self) -> int:
+        """
+        Bumped whenever any process overwrites a link or clears the store.
+        """
+        return self._header[_GENERATION]
+
+    def create_url(self, original_url: str) -> str:
+        with self.lock:
+            short_code, key = self._free_code()
+            seq = self._insert(key, short_code, original_url)
+        self._wait_durable(seq)
+        return short_code
+
+    def create_urls(self, original_urls: list) -> list:
+        with self.lock:
+            created = []
+            for original_url in original_urls:
+                short_code, key = self._free_code()
+                self._put(key, original_url, 0, time.time())
+                created.append(short_code)
+            seq = self._record_created(created)
+        self._wait_durable(seq)
+        return created
+
+    def insert_many(self, mappings: list) -> set:
+        taken = set()
+        with self.lock:
+            inserted = []
+            for short_code, original_url in mappings:
+                key = self._require_key(short_code)
+                if self._find_row(key) >= 0:
+                    taken.add(short_code)
+                else:
+                    self._put(key, original_url, 0, time.time())
+                    inserted.append(short_code)
+            seq = self._record_created(inserted)
+        self._wait_durable(seq)
+        return taken
+
+    def _record_created(self, short_codes: list):
+        # Caller holds self.lock. Logs a batch of new links as one event.
+        if self.journal is None or not short_codes:
+            return None
+        entries = []
+        for short_code in short_codes:
+            row = self._find_row(encode_code(short_code))
+            entries.append((short_code, self._url(row), self._created_at[row]))
+        return self.journal.log_shortens(entries)
+
+    def try_insert(self, short_code: str, original_url: str) -> bool:
+        key = self._require_key(short_code)
+        with self.lock:
+            if self._find_row(key) >= 0:
+                return False
+            seq = self._insert(key, short_code, original_url)
+        self._wait_durable(seq)
+        return True
+
+    def add_url(self, short_code: str, original_url: str):
+        key = self._require_key(short_code)
+        with self.lock:
+            seq = self._insert(key, short_code, original_url)
+        self._wait_durable(seq)
+
+    def load_entries(self, entries):
+        with self.lock:
+            for short_code, original_url, clicks, created_at in entries:
+                self._put(self._require_key(short_code), original_url, clicks, created_at)
+
+    def get_url_info(self, short_code: str):
+        key = encode_code(short_code)
+        if key is None:
+            return None
+
+        def lookup():
+            row = self._find_row(key)
+            return self._record(row) if row >= 0 else None
+
+        return self._read(lookup)
+
+    def get_many(self, short_codes) -> dict:
+        keys = [(short_code, encode_code(short_code)) for short_code in short_codes]
+
+        def lookup():
+            found = {}
+            for short_code, key in keys:
+                row = self._find_row(key) if key is not None else -1
+                if row >= 0:
+                    found[short_code] = (self._url(row), self._clicks[row], self._created_at[row])
+            return found
+
+        return self._read(lookup)
+
+    def increment_clicks(self, short_code: str):
+        return bool(self.add_clicks({short_code: 1}))
+
+    def add_clicks(self, counts: dict):
+        """
+        Applies a batch of click deltas {short_code: delta} under one lock, so
+        increments from different workers are never lost. Codes that do not
+        exist are ignored. Returns the number applied.
+        """
+        with self.lock:
+            applied = {}
+            for short_code, delta in counts.items():
+                key = encode_code(short_code)
+                row = self._find_row(key) if key is not None else -1
+                if row >= 0:
+                    self._clicks[row] += delta
+                    applied[short_code] = delta
+            if applied and self.journal is not None:
+                self.journal.log_clicks(applied)
+        return len(applied)
+
+    def is_short_code_taken(self, short_code: str) -> bool:
+        key = encode_code(short_code)
+        if key is None:
+            return False
+        return self._read(lambda: self._find_row(key) >= 0)
+
+    def iter_entries(self, chunk_size: int = 1000):
+        """
+        Yields (short_code, original_url, clicks, created_at) for every row that
+        existed when iteration started, reading chunk_size rows per lock hold.
+        """
+        with self.lock:
+            rows = self._header[_ROWS]
+            epoch = self._header[_EPOCH]
+        for start in range(0, rows, chunk_size):
+            with self.lock:
+                if self._header[_EPOCH] != epoch:
+                    return  # Store was cleared
+                chunk = [self._record(row) for row in range(start, min(rows, start + chunk_size))]
+            for record in chunk:
+                yield record.short_code, record.original_url, record.clicks, record.created_at
+
+    def clear(self):
+        with self.lock:
+            header = self._header
+            table_bytes = 8 * len(self._table)
+            start = 8 * _HEADER_WORDS
+            self._begin_write()
+            self._shm.buf[start:start + table_bytes] = bytes(table_bytes)
+            header[_ROWS] = 0
+            header[_ARENA_USED] = 0
+            header[_EPOCH] += 1
+            self._end_write()
+            for hook in self.invalidation_hooks:
+                hook(None)
+
+    def __len__(self):
+        return self._header[_ROWS]
+
+    def memory_usage(self) -> int:
+        """
+        Bytes of the segment in use: header, hash table, used rows and arena.
+        """
+        return 8 * (_HEADER_WORDS + len(self._table) + 5 * len(self)) + self._header[_ARENA_USED]
@@ -0,0 +1,403 @@
+# sqlite_store.py
+# Durable URL store backed by a SQLite database file in WAL mode.
+#
+# Reads use one connection per thread and never wait for writers (WAL readers
+# see the last committed state). When a thread exits its connection goes back
+# to an idle list for the next new thread, or is closed if enough are idle, so
+# a thread-per-request server doesn't accumulate connections. All writes go through a queue to a single
+# writer thread, which applies whatever has queued up, up to batch_size
+# operations, in one transaction (group commit); callers block until their
+# transaction commits, so every write is visible to reads once it returns.
+# The sqlite3 module caches prepared statements per connection, and every
+# query below is a constant SQL string, so each is compiled once per thread.
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+from app.allocators import RandomCodeAllocator
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    short_code TEXT PRIMARY KEY,
+    original_url TEXT NOT NULL,
+    clicks INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    expires_at REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS link_count (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL);
+INSERT OR IGNORE INTO link_count VALUES (0, (SELECT COUNT(*) FROM links));
+CREATE TRIGGER IF NOT EXISTS links_counted_insert AFTER INSERT ON links
+    BEGIN UPDATE link_count SET value = value + 1; END;
+CREATE TRIGGER IF NOT EXISTS links_counted_delete AFTER DELETE ON links
+    BEGIN UPDATE link_count SET value = value - 1; END;
+"""
+
+_SELECT = "SELECT original_url, clicks, created_at FROM links WHERE short_code = ?"
+_EXISTS = "SELECT 1 FROM links WHERE short_code = ?"
+_INSERT = "INSERT OR IGNORE INTO links (short_code, original_url, clicks, created_at) VALUES (?, ?, ?, ?)"
+_REPLACE = "UPDATE links SET original_url = ?, clicks = ?, created_at = ?, expires_at = NULL WHERE short_code = ?"
+_ADD_CLICKS = "UPDATE links SET clicks = clicks + ? WHERE short_code = ?"
+_SET_EXPIRY = "UPDATE links SET expires_at = ? WHERE short_code = ?"
+_DELETE = "DELETE FROM links WHERE short_code = ? RETURNING length(short_code) + length(original_url)"
+_COUNT = "SELECT value FROM link_count"
+
+# Rows held in memory per write operation when bulk-loading
+_LOAD_CHUNK = 10000
+# Approximate bytes a row takes in the database besides its code and URL
+_ROW_OVERHEAD = 40
+
+class _Lease:
+    # Held in a thread's threading.local; collected when the thread exits
+    __slots__ = ("connection", "__weakref__")
+
+    def __init__(self, connection):
+        self.connection = connection
+
+class SQLiteURLStore:
+    """
+    URL store with the same interface as app.models.URLStore, kept in a
+    SQLite database so links and clicks survive restarts without the event
+    log. Short codes are the table's primary key (a WITHOUT ROWID table is
+    a clustered index on it). The link count is kept in a one-row table by
+    triggers, so len() does not scan the table.
+
+    The store also serves as LinkExpiry's journal: deadlines are written to
+    an expires_at column and restored with deadlines().
+    """
+
+    def __init__(self, path: str, allocator=None, journal=None, batch_size: int = 1000, busy_timeout: float = 5.0,
+                 idle_readers: int = 8):
+        self.path = path
+        self.batch_size = batch_size
+        self.idle_readers = idle_readers
+        self.busy_timeout = busy_timeout
+        self.allocator = allocator or RandomCodeAllocator()
+        # Kept for interface compatibility; SQLite is durable on its own
+        self.journal = journal
+        self._code_filter = None
+        # Callables notified with a short code when its mapping is replaced or
+        # removed (None means every code), e.g. to drop cached redirects
+        self.invalidation_hooks = []
+        # Deadline writes wait for their commit like every other write
+        self.sync_writes = True
+
+        self._local = threading.local()
+        # Read connections of exited threads, waiting for a new thread
+        self._idle = []
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        writer = self._connect()
+        writer.executescript(_SCHEMA)
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, args=(writer,), name="sqlite-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        # Connections outlive their thread, but only one thread uses each at a time
+        connection = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode NORMAL only syncs at checkpoints; a crash can lose the
+        # last transactions but never corrupts the database
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connections_lock:
+            self._connections.append(connection)
+        return connection
+
+    def _reader(self):
+        lease = getattr(self._local, "lease", None)
+        if lease is None:
+            try:
+                connection = self._idle.pop()
+            except IndexError:
+                connection = self._connect()
+            lease = self._local.lease = _Lease(connection)
+            weakref.finalize(lease, self._release, connection).atexit = False
+        return lease.connection
+
+    def _release(self, connection):
+        # Runs when the thread that held 'connection' has exited
+        if len(self._idle) < self.idle_readers:
+            self._idle.append(connection)
+            return
+        with self._connections_lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        connection.close()
+
+    @property
+    def code_filter(self):
+        return self._code_filter
+
+    @code_filter.setter
+    def code_filter(self, code_filter):
+        # The database may already hold links, so a new filter is seeded with them
+        self._code_filter = code_filter
+        if code_filter is not None:
+            for short_code, *_ in self.iter_entries():
+                code_filter.add(short_code)
+
+    # --- write queue ------------------------------------------------------
+
+    def _write(self, operation, *args):
+        future = Future()
+        self._queue.put((operation, args, future))
+        return future.result()
+
+    def _write_loop(self, connection):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                connection.close()
+                return
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # Stop after this batch
+                    break
+                batch.append(item)
+            self._commit(connection, batch)
+
+    def _commit(self, connection, batch):
+        results = []
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for operation, args, _ in batch:
+                results.append(operation(self, connection, *args))
+            connection.execute("COMMIT")
+        except Exception as error:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            for _, _, future in batch:
+                future.set_exception(error)
+            return
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    # Write operations, run by the writer thread inside a transaction
+
+    def _op_insert(self, connection, rows) -> set:
+        # rows: (short_code, original_url, clicks, created_at); returns codes already taken
+        taken = set()
+        for row in rows:
+            if connection.execute(_INSERT, row).rowcount == 0:
+                taken.add(row[0])
+        return taken
+
+    def _op_upsert(self, connection, rows) -> list:
+        # Inserts or overwrites; returns the codes that were overwritten
+        replaced = []
+        for short_code, original_url, clicks, created_at in rows:
+            if connection.execute(_INSERT, (short_code, original_url, clicks, created_at)).rowcount == 0:
+                connection.execute(_REPLACE, (original_url, clicks, created_at, short_code))
+                replaced.append(short_code)
+        return replaced
+
+    def _op_add_clicks(self, connection, counts) -> int:
+        applied = 0
+        for short_code, delta in counts.items():
+            applied += connection.execute(_ADD_CLICKS, (delta, short_code)).rowcount
+        return applied
+
+    def _op_set_expiry(self, connection, entries):
+        connection.executemany(_SET_EXPIRY, [(expires_at, short_code) for short_code, expires_at in entries])
+
+    def _op_delete(self, connection, short_codes):
+        # Returns (deleted codes, approximate bytes freed)
+        deleted = []
+        freed = 0
+        for short_code in short_codes:
+            row = connection.execute(_DELETE, (short_code,)).fetchone()
+            if row is not None:
+                deleted.append(short_code)
+                freed += row[0] + _ROW_OVERHEAD
+        return deleted, freed
+
+    def _op_clear(self, connection):
+        connection.execute("DELETE FROM links")
+
+    # --- URLStore API -----------------------------------------------------
+
+    def create_url(self, original_url: str) -> str:
+        """
+        Reserves a fresh short code and stores the mapping. A code that turns
+        out to be taken is caught by the insert and re-proposed.
+        """
+        while True:
+            short_code = self.allocator.next_code()
+            if self.try_insert(short_code, original_url):
+                return short_code
+
+    def try_insert(self, short_code: str, original_url: str) -> bool:
+        taken = self._write(SQLiteURLStore._op_insert, [(short_code, original_url, 0, time.time())])
+        if taken:
+            return False
+        self._record_created([short_code])
+        return True
+
+    def create_urls(self, original_urls: list) -> list:
+        """
+        Batch version of create_url: one transaction per attempt for the
+        whole batch. Returns codes in input order.
+        """
+        short_codes = [None] * len(original_urls)
+        pending = list(range(len(original_urls)))
+        while pending:
+            proposals = [(position, self.allocator.next_code()) for position in pending]
+            taken = self.insert_many([(short_code, original_urls[position]) for position, short_code in proposals])
+            pending = []
+            for position, short_code in proposals:
+                if short_code in taken:
+                    pending.append(position)
+                else:
+                    short_codes[position] = short_code
+        return short_codes
+
+    def insert_many(self, mappings: list) -> set:
+        """
+        Stores every (short_code, original_url) pair whose code is still free,
+        in one transaction. Returns the set of codes that were taken.
+        """
+        now = time.time()
+        taken = self._write(SQLiteURLStore._op_insert, [(code, url, 0, now) for code, url in mappings])
+        self._record_created([code for code, _ in mappings if code not in taken])
+        return taken
+
+    def _record_created(self, short_codes: list):
+        if self._code_filter is not None:
+            self._code_filter.add_many(short_codes)
+
+    def add_url(self, short_code: str, original_url: str):
+        self._load([(short_code, original_url, 0, time.time())])
+
+    def load_entries(self, entries):
+        """
+        Bulk-loads (short_code, original_url, clicks, created_at) tuples,
+        overwriting existing codes, in transactions of up to 10,000 rows.
+        """
+        chunk = []
+        for entry in entries:
+            chunk.append(entry)
+            if len(chunk) >= _LOAD_CHUNK:
+                self._load(chunk)
+                chunk = []
+        if chunk:
+            self._load(chunk)
+
+    def _load(self, rows):
+        replaced = self._write(SQLiteURLStore._op_upsert, rows)
+        self._record_created([row[0] for row in rows])
+        for short_code in replaced:
+            self._invalidate(short_code)
+
+    def _invalidate(self, short_code):
+        # Called after the change has committed
+        for hook in self.invalidation_hooks:
+            hook(short_code)
+
+    def get_url_info(self, short_code: str):
+        row = self._reader().execute(_SELECT, (short_code,)).fetchone()
+        if row is None:
+            return None
+        return {"original_url": row[0], "clicks": row[1], "created_at": row[2]}
+
+    def get_many(self, short_codes) -> dict:
+        """
+        Looks up many codes on one connection.
+        Returns {short_code: (original_url, clicks, created_at)} for codes that exist.
+        """
+        connection = self._reader()
+        found = {}
+        for short_code in short_codes:
+            row = connection.execute(_SELECT, (short_code,)).fetchone()
+            if row is not None:
+                found[short_code] = row
+        return found
+
+    def increment_clicks(self, short_code: str):
+        return self._write(SQLiteURLStore._op_add_clicks, {short_code: 1}) > 0
+
+    def add_clicks(self, counts: dict):
+        """
+        Applies a batch of click deltas {short_code: delta} in one
+        transaction. Codes that no longer exist are ignored.
+        """
+        if counts:
+            self._write(SQLiteURLStore._op_add_clicks, dict(counts))
+
+    def delete_many(self, short_codes) -> int:
+        """
+        Removes the given links (missing codes are ignored) in one transaction.
+        Returns the approximate number of bytes released.
+        """
+        deleted, freed = self._write(SQLiteURLStore._op_delete, list(short_codes))
+        for short_code in deleted:
+            self._invalidate(short_code)
+        return freed
+
+    def is_short_code_taken(self, short_code: str) -> bool:
+        return self._reader().execute(_EXISTS, (short_code,)).fetchone() is not None
+
+    def iter_entries(self, chunk_size: int = 1000):
+        """
+        Yields (short_code, original_url, clicks, created_at) for every link,
+        all from one read transaction: a consistent snapshot of the moment
+        iteration started, which never blocks writers. Uses its own
+        connection, so the generator may be consumed on any thread.
+        """
+        connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                     check_same_thread=False)
+        try:
+            connection.execute("BEGIN")
+            cursor = connection.execute("SELECT short_code, original_url, clicks, created_at FROM links")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def deadlines(self):
+        """
+        Yields (short_code, expires_at) for links with a deadline, e.g. to
+        restore LinkExpiry after a restart.
+        """
+        connection = self._reader()
+        yield from connection.execute("SELECT short_code, expires_at FROM links WHERE expires_at IS NOT NULL")
+
+    def clear(self):
+        self._write(SQLiteURLStore._op_clear)
+        self._invalidate(None)
+
+    def __len__(self):
+        return self._reader().execute(_COUNT).fetchone()[0]
+
+    # Journal interface used by LinkExpiry, so deadlines live next to their links
+    def log_expiry(self, entries: list):
+        future = Future()
+        self._queue.put((SQLiteURLStore._op_set_expiry, (list(entries),), future))
+        return future
+
+    def wait_durable(self, future):
+        future.result()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
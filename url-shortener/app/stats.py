@@ -0,0 +1,98 @@
+# stats.py
+# Bulk analytics queries over the URL store.
+import heapq
+from datetime import datetime
+from itertools import islice
+
+# Fields results can be sorted by
+SORT_FIELDS = {
+    "clicks": lambda entry: entry[2],
+    "created_at": lambda entry: entry[3],
+}
+
+def parse_timestamp(value) -> float:
+    """
+    Accepts a Unix timestamp (number or numeric string) or an ISO 8601 string.
+    Raises ValueError for anything else.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value).timestamp()
+    raise ValueError(f"Invalid timestamp: {value!r}")
+
+def stats_row(short_code: str, original_url: str, clicks: int, created_at: float) -> dict:
+    # Same fields as GET /api/stats/<short_code>, plus the code itself
+    return {
+        "short_code": short_code,
+        "url": original_url,
+        "clicks": clicks,
+        "created_at": datetime.fromtimestamp(created_at).isoformat()
+    }
+
+def query_stats(store, click_counter, codes=None, prefix=None, created_after=None,
+                created_before=None, sort=None, descending=True, limit=None, chunk_size=1000,
+                exclude=None):
+    """
+    Yields (short_code, original_url, clicks, created_at) for every link that
+    matches the query, with exact click counts.
+
+    'codes' restricts the query to those codes; otherwise the store is scanned
+    once, chunk by chunk. 'prefix', 'created_after' and 'created_before'
+    filter further, and codes for which 'exclude' returns true are skipped.
+    With 'sort' the results are ordered by that field (only the top 'limit'
+    are kept in memory when a limit is given).
+    """
+    def keep(short_code, created_at):
+        return ((prefix is None or short_code.startswith(prefix))
+                and (created_after is None or created_at >= created_after)
+                and (created_before is None or created_at <= created_before)
+                and (exclude is None or not exclude(short_code)))
+
+    if codes is not None:
+        candidates = _requested(click_counter, codes, keep, chunk_size)
+    else:
+        candidates = _scanned(store, click_counter, keep, chunk_size)
+
+    if sort is None:
+        yield from islice(candidates, limit)
+        return
+    key = SORT_FIELDS[sort]
+    if limit is not None:
+        pick = heapq.nlargest if descending else heapq.nsmallest
+        yield from pick(limit, candidates, key=key)
+    else:
+        yield from sorted(candidates, key=key, reverse=descending)
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _requested(click_counter, codes, keep, chunk_size):
+    seen = set()
+    for chunk in _chunks(codes, chunk_size):
+        chunk = [code for code in chunk if code not in seen and not seen.add(code)]
+        found = click_counter.get_many(chunk)
+        for short_code in chunk:
+            entry = found.get(short_code)
+            if entry is not None and keep(short_code, entry[2]):
+                yield (short_code,) + entry
+
+def _scanned(store, click_counter, keep, chunk_size):
+    # Code and created_at never change, so filter on the scan and only fetch
+    # exact click counts for the matching codes
+    matching = (short_code for short_code, _, _, created_at in store.iter_entries(chunk_size)
+                if keep(short_code, created_at))
+    for chunk in _chunks(matching, chunk_size):
+        found = click_counter.get_many(chunk)
+        for short_code in chunk:
+            entry = found.get(short_code)
+            if entry is not None:
+                yield (short_code,) + entry
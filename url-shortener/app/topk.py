@@ -0,0 +1,248 @@
+# topk.py
+# Hottest links, tracked incrementally with Space-Saving heavy-hitter sketches
+# so /api/stats/top never scans the store.
+import heapq
+import threading
+import time
+
+# unit -> (bucket width in seconds, number of buckets kept); the same hour
+# and day ranges as the windowed click analytics in app/analytics.py
+WINDOW_TIERS = {
+    "hour": (3600, 48),
+    "day": (86400, 30),
+}
+
+class SpaceSaving:
+    """
+    Space-Saving sketch (Metwally et al.) over at most 'capacity' keys.
+
+    A new key that arrives when the sketch is full replaces the key with the
+    smallest count and inherits that count as its error, so every reported
+    count overestimates the true one by at most 'error' (and by at most
+    total / capacity). Any key with more than total / capacity occurrences is
+    guaranteed to be tracked.
+
+    The minimum is found through a heap with one entry per key whose counts
+    are refreshed lazily: increments only touch the dict, and a stale heap top
+    is re-pushed with its current count when an eviction looks at it.
+    """
+
+    __slots__ = ("capacity", "counts", "errors", "total", "_heap")
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []
+
+    def add(self, key, amount: int = 1):
+        self.total += amount
+        count = self.counts.get(key)
+        if count is not None:
+            self.counts[key] = count + amount
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = amount
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (amount, key))
+            return
+        floor = self._refresh_min()
+        _, victim = heapq.heappop(self._heap)
+        del self.counts[victim]
+        del self.errors[victim]
+        self.counts[key] = floor + amount
+        self.errors[key] = floor
+        heapq.heappush(self._heap, (floor + amount, key))
+
+    def _refresh_min(self) -> int:
+        # Re-pushes stale heap tops until the top holds its key's current count
+        heap = self._heap
+        while True:
+            count, key = heap[0]
+            current = self.counts[key]
+            if current == count:
+                return count
+            heapq.heapreplace(heap, (current, key))
+
+    def min_count(self) -> int:
+        # Upper bound on the count of any key the sketch does not hold
+        if len(self.counts) < self.capacity:
+            return 0
+        return self._refresh_min()
+
+class _ThreadCounts:
+    __slots__ = ("lock", "counts", "size", "thread")
+
+    def __init__(self):
+        # Only contended while a merge swaps these counts out
+        self.lock = threading.Lock()
+        # window buckets -> {short_code: clicks}
+        self.counts = {}
+        self.size = 0
+        self.thread = threading.current_thread()
+
+class TopLinks:
+    """
+    Hottest links overall and per hour/day window.
+
+    One sketch covers all time; each hour and day bucket gets its own sketch
+    in a ring that is reset lazily as time moves on, like the click windows in
+    app/analytics.py. A click updates three sketches in O(1) amortised time.
+    Memory is bounded by (1 + 48 + 30) * capacity tracked links, no matter
+    how many links exist.
+
+    Like app.clicks.ClickBuffer, each thread counts clicks into its own
+    buffer, so the redirect path never takes the shared lock. Buffers are
+    merged into the sketches before every read, and by the recording thread
+    once its buffer holds 'flush_threshold' clicks.
+    """
+
+    def __init__(self, capacity: int = 1000, clock=time.time, flush_threshold: int = 1000):
+        self.capacity = capacity
+        self.clock = clock
+        self.flush_threshold = flush_threshold
+        self._all_time = SpaceSaving(capacity)
+        # unit -> ring of (bucket number, sketch) pairs, None until first used
+        self._rings = {unit: [None] * size for unit, (_, size) in WINDOW_TIERS.items()}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._buffers = []
+        self._registry_lock = threading.Lock()
+
+    def record(self, short_code: str, amount: int = 1):
+        now = self.clock()
+        buckets = tuple(int(now // width) for width, _ in WINDOW_TIERS.values())
+        buffer = self._buffer()
+        with buffer.lock:
+            pending = buffer.counts.get(buckets)
+            if pending is None:
+                pending = buffer.counts[buckets] = {}
+            pending[short_code] = pending.get(short_code, 0) + amount
+            buffer.size += 1
+            full = buffer.size >= self.flush_threshold
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._merge_pending()
+
+    def _merge_pending(self):
+        # Caller holds self._lock
+        for buffer in self._snapshot_buffers():
+            with buffer.lock:
+                counts, buffer.counts, buffer.size = buffer.counts, {}, 0
+            for buckets, pending in counts.items():
+                self._add(buckets, pending)
+        # Dead threads' buffers were emptied above; clicks recorded since stay
+        with self._registry_lock:
+            self._buffers = [b for b in self._buffers if b.thread.is_alive() or b.counts]
+
+    def _add(self, buckets: tuple, pending: dict):
+        # Caller holds self._lock
+        for short_code, amount in pending.items():
+            self._all_time.add(short_code, amount)
+        for (unit, (_, size)), bucket in zip(WINDOW_TIERS.items(), buckets):
+            ring = self._rings[unit]
+            slot = ring[bucket % size]
+            if slot is None or slot[0] < bucket:
+                slot = ring[bucket % size] = (bucket, SpaceSaving(self.capacity))
+            elif slot[0] > bucket:
+                continue  # Bucket already left the ring
+            sketch = slot[1]
+            for short_code, amount in pending.items():
+                sketch.add(short_code, amount)
+
+    def _buffer(self) -> _ThreadCounts:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = _ThreadCounts()
+            with self._registry_lock:
+                self._buffers.append(buffer)
+        return buffer
+
+    def _snapshot_buffers(self):
+        with self._registry_lock:
+            return list(self._buffers)
+
+    def top(self, unit: str = None, buckets: int = 1) -> list:
+        """
+        Returns (short_code, clicks, error) for every tracked link, most
+        clicked first. 'clicks' is an upper bound and clicks - error a lower
+        bound on the true count. With 'unit' ("hour" or "day") only the last
+        'buckets' buckets count, merged by adding the per-bucket sketches.
+        """
+        with self._lock:
+            self._merge_pending()
+            if unit is None:
+                sketches = [self._all_time]
+            else:
+                sketches = self._window_sketches(unit, buckets)
+            if len(sketches) == 1:
+                sketch = sketches[0]
+                rows = [(key, count, sketch.errors[key]) for key, count in sketch.counts.items()]
+            else:
+                rows = _merge(sketches)
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows
+
+    def _window_sketches(self, unit: str, buckets: int) -> list:
+        # Caller holds self._lock
+        if unit not in WINDOW_TIERS:
+            raise ValueError(f"Top links windows are counted in {' or '.join(f'{u}s' for u in WINDOW_TIERS)}")
+        width, size = WINDOW_TIERS[unit]
+        if not 1 <= buckets <= size:
+            raise ValueError(f"A {unit} window covers 1 to {size} buckets")
+        current = int(self.clock() // width)
+        sketches = []
+        for slot in self._rings[unit]:
+            if slot is not None and current - buckets < slot[0] <= current:
+                sketches.append(slot[1])
+        return sketches
+
+    def stats(self) -> dict:
+        self.flush()
+        return {
+            "capacity": self.capacity,
+            "tracked": len(self._all_time.counts),
+            "clicks": self._all_time.total,
+        }
+
+    def on_store_invalidated(self, short_code):
+        # Store invalidation hook: a cleared store starts the rankings over
+        if short_code is None:
+            self.clear()
+
+    def clear(self):
+        with self._lock:
+            for buffer in self._snapshot_buffers():
+                with buffer.lock:
+                    buffer.counts, buffer.size = {}, 0
+            self._all_time = SpaceSaving(self.capacity)
+            for ring in self._rings.values():
+                ring[:] = [None] * len(ring)
+
+def _merge(sketches) -> list:
+    """
+    Adds sketches together. A key missing from a sketch may still have had up
+    to that sketch's minimum count there, which is added to its count and error.
+    """
+    minimums = [sketch.min_count() for sketch in sketches]
+    total_min = sum(minimums)
+    merged = {}
+    for sketch, minimum in zip(sketches, minimums):
+        errors = sketch.errors
+        for key, count in sketch.counts.items():
+            row = merged.get(key)
+            if row is None:
+                row = merged[key] = [0, 0, 0]
+            row[0] += count
+            row[1] += errors[key]
+            row[2] += minimum
+    return [
+        (key, count + total_min - seen_min, error + total_min - seen_min)
+        for key, (count, error, seen_min) in merged.items()
+    ]
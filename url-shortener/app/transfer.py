@@ -0,0 +1,338 @@
+# transfer.py
+# Streaming export and import of the URL store, as NDJSON or a compact binary
+# format. Both directions are generators over bounded chunks, so memory use
+# does not grow with the number of links.
+#
+# CLI, against a running service (from the url-shortener folder):
+#   python -m app.transfer export --output links.ndjson
+#   python -m app.transfer export --format binary --output links.bin
+#   python -m app.transfer import links.bin --format binary --skip-existing
+#   python -m app.transfer --url http://shortener.internal:5000 import links.ndjson
+import argparse
+import http.client
+import json
+import shutil
+import struct
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+
+from app.stats import parse_timestamp
+from app.utils import ALPHANUMERIC_CHARS, is_valid_url
+
+FORMATS = ("ndjson", "binary")
+MIMETYPES = {"ndjson": "application/x-ndjson", "binary": "application/octet-stream"}
+
+# Binary stream: magic, then one record per link and a trailer record.
+# Record: code length, url length, clicks, created_at, expires_at (0 = never),
+# then the code and url bytes. The trailer has code length 0 and the record
+# count in the clicks field, so a truncated stream is detected.
+_BINARY_MAGIC = b"USEXPT01"
+_BINARY_RECORD = struct.Struct("<BIQdd")
+
+# Longest short code accepted on import
+MAX_CODE_LENGTH = 64
+# Errors listed in an import summary; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+_CODE_CHARS = frozenset(ALPHANUMERIC_CHARS)
+
+def iter_export(store, expiry=None, fmt: str = "ndjson", chunk_size: int = 10000):
+    """
+    Yields the store's links encoded as 'fmt', one bytes chunk per
+    'chunk_size' links. Entries come from store.iter_entries(), which fixes
+    the set of links when the export starts and only holds the store lock
+    while it reads each chunk: links created later are not included, links
+    deleted meanwhile are skipped, and each entry is read atomically.
+    Except with the sqlite engine this is not a point-in-time snapshot:
+    clicks and overwrites made during the export can appear in it.
+    Links that have already expired are left out.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    now = time.time()
+    if fmt == "binary":
+        yield _BINARY_MAGIC
+    chunk = []
+    count = 0
+    for short_code, original_url, clicks, created_at in store.iter_entries(chunk_size):
+        expires_at = expiry.expires_at(short_code) if expiry is not None else None
+        if expires_at is not None and expires_at <= now:
+            continue
+        chunk.append((short_code, original_url, clicks, created_at, expires_at))
+        if len(chunk) >= chunk_size:
+            count += len(chunk)
+            yield _encode(chunk, fmt)
+            chunk = []
+    count += len(chunk)
+    if chunk:
+        yield _encode(chunk, fmt)
+    if fmt == "binary":
+        yield _BINARY_RECORD.pack(0, 0, count, 0.0, 0.0)
+
+def _encode(records, fmt: str) -> bytes:
+    if fmt == "ndjson":
+        return "".join(
+            json.dumps({
+                "short_code": short_code,
+                "url": original_url,
+                "clicks": clicks,
+                "created_at": created_at,
+                "expires_at": expires_at,
+            }) + "\n"
+            for short_code, original_url, clicks, created_at, expires_at in records
+        ).encode()
+    parts = []
+    for short_code, original_url, clicks, created_at, expires_at in records:
+        code = short_code.encode()
+        url = original_url.encode()
+        parts.append(_BINARY_RECORD.pack(len(code), len(url), clicks, created_at, expires_at or 0.0))
+        parts.append(code)
+        parts.append(url)
+    return b"".join(parts)
+
+def iter_records(stream, fmt: str = "ndjson"):
+    """
+    Reads an export from a binary file-like object. Yields
+    (short_code, original_url, clicks, created_at, expires_at) tuples for
+    valid records and ValueError instances (with the record number in the
+    message) for invalid ones. A corrupt binary stream raises ValueError.
+    """
+    if fmt == "ndjson":
+        return _iter_ndjson(stream)
+    if fmt == "binary":
+        return _iter_binary(stream)
+    raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+
+def _iter_ndjson(stream):
+    number = 0
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        number += 1
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError("not a JSON object")
+            expires_at = item.get("expires_at")
+            yield _validate(
+                item.get("short_code"),
+                item.get("url"),
+                item.get("clicks", 0),
+                parse_timestamp(item["created_at"]) if item.get("created_at") is not None else time.time(),
+                parse_timestamp(expires_at) if expires_at is not None else None,
+            )
+        except (ValueError, KeyError) as error:
+            yield ValueError(f"record {number}: {error}")
+
+def _iter_binary(stream):
+    if _read_exact(stream, len(_BINARY_MAGIC)) != _BINARY_MAGIC:
+        raise ValueError("Not a URL store binary export")
+    number = 0
+    while True:
+        header = _read_exact(stream, _BINARY_RECORD.size)
+        if len(header) < _BINARY_RECORD.size:
+            raise ValueError("Binary export is truncated")
+        code_len, url_len, clicks, created_at, expires_at = _BINARY_RECORD.unpack(header)
+        if code_len == 0:
+            if clicks != number:
+                raise ValueError(f"Binary export holds {number} records but its trailer says {clicks}")
+            return
+        number += 1
+        payload = _read_exact(stream, code_len + url_len)
+        if len(payload) < code_len + url_len:
+            raise ValueError("Binary export is truncated")
+        try:
+            yield _validate(
+                payload[:code_len].decode(),
+                payload[code_len:].decode(),
+                clicks,
+                created_at,
+                expires_at or None,
+            )
+        except ValueError as error:
+            yield ValueError(f"record {number}: {error}")
+
+def _read_exact(stream, size: int) -> bytes:
+    # File-like reads may return less than asked for before the end
+    parts = []
+    while size > 0:
+        part = stream.read(size)
+        if not part:
+            break
+        parts.append(part)
+        size -= len(part)
+    return b"".join(parts)
+
+def _validate(short_code, original_url, clicks, created_at, expires_at):
+    if (not isinstance(short_code, str) or not 0 < len(short_code) <= MAX_CODE_LENGTH
+            or not _CODE_CHARS.issuperset(short_code)):
+        raise ValueError(f"invalid short code {short_code!r}")
+    if not isinstance(original_url, str) or not is_valid_url(original_url):
+        raise ValueError(f"invalid URL for {short_code}")
+    if isinstance(clicks, bool) or not isinstance(clicks, int) or clicks < 0:
+        raise ValueError(f"invalid clicks for {short_code}")
+    return short_code, original_url, clicks, created_at, expires_at
+
+def import_records(store, records, expiry=None, dedupe=None, batch_size: int = 10000,
+                   skip_existing: bool = False) -> dict:
+    """
+    Bulk-loads records from iter_records() in batches of 'batch_size', each
+    applied with one store.load_entries() call. Existing codes are overwritten
+    unless skip_existing is set. Imported links are written to the store's
+    journal (if any) so they survive a restart, their deadlines go to
+    'expiry', and links without a deadline to the dedupe index. Records
+    whose deadline has passed are skipped. Returns a summary with imported,
+    skipped and failed counts and the first few error messages.
+    """
+    summary = {"imported": 0, "skipped": 0, "failed": 0, "errors": []}
+    batch = []
+    for record in records:
+        if isinstance(record, ValueError):
+            summary["failed"] += 1
+            if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                summary["errors"].append(str(record))
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            _import_batch(store, batch, expiry, dedupe, skip_existing, summary)
+            batch = []
+    if batch:
+        _import_batch(store, batch, expiry, dedupe, skip_existing, summary)
+    return summary
+
+def _import_batch(store, batch, expiry, dedupe, skip_existing, summary):
+    now = time.time()
+    live = []
+    for record in batch:
+        expires_at = record[4]
+        if expires_at is not None and (expiry is None or expires_at <= now):
+            # Expired, or there is nothing to enforce the deadline with
+            summary["skipped"] += 1
+        else:
+            live.append(record)
+    if skip_existing and live:
+        existing = store.get_many(record[0] for record in live)
+        summary["skipped"] += sum(1 for record in live if record[0] in existing)
+        live = [record for record in live if record[0] not in existing]
+    if not live:
+        return
+
+    try:
+        store.load_entries([record[:4] for record in live])
+    except ValueError:
+        # Some codes do not fit this store engine; load one by one to find them
+        loaded = []
+        for record in live:
+            try:
+                store.load_entries([record[:4]])
+            except ValueError as error:
+                summary["failed"] += 1
+                if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                    summary["errors"].append(f"{record[0]}: {error}")
+            else:
+                loaded.append(record)
+        live = loaded
+    if not live:
+        return
+
+    deadlines = [(record[0], record[4]) for record in live if record[4] is not None]
+    if deadlines:
+        expiry.load(deadlines)
+    if dedupe is not None:
+        for short_code, original_url, _, _, expires_at in live:
+            if expires_at is None:
+                dedupe.add(short_code, original_url)
+
+    journal = store.journal
+    if deadlines and expiry.journal is not None and expiry.journal is not journal:
+        # Deadlines kept apart from the store's journal (the sqlite engine)
+        future = expiry.journal.log_expiry(deadlines)
+        if expiry.journal.sync_writes:
+            expiry.journal.wait_durable(future)
+    if journal is not None:
+        # load_entries() does not log, so the batch is journalled here as the
+        # same events a restart replays
+        seq = journal.log_shortens([(record[0], record[1], record[3]) for record in live])
+        clicks = {record[0]: record[2] for record in live if record[2]}
+        if clicks:
+            seq = journal.log_clicks(clicks)
+        if deadlines:
+            seq = journal.log_expiry(deadlines)
+        if journal.sync_writes:
+            journal.wait_durable(seq)
+    summary["imported"] += len(live)
+
+# --- CLI ------------------------------------------------------------------
+
+def _connect(base_url: str):
+    parts = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    return connection_class(parts.netloc), parts.path.rstrip("/")
+
+def export_command(args):
+    connection, prefix = _connect(args.url)
+    connection.request("GET", f"{prefix}/api/admin/export?{urlencode({'format': args.format})}")
+    response = connection.getresponse()
+    if response.status != 200:
+        sys.exit(f"Export failed: {response.status} {response.read().decode(errors='replace')}")
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        shutil.copyfileobj(response, output, 1024 * 1024)
+    finally:
+        if args.output:
+            output.close()
+
+def import_command(args):
+    connection, prefix = _connect(args.url)
+    query = {"format": args.format}
+    if args.skip_existing:
+        query["skip_existing"] = "1"
+
+    def chunks(f):
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+    source = open(args.input, "rb") if args.input != "-" else sys.stdin.buffer
+    try:
+        # Chunked upload, so the file is never read into memory as a whole
+        connection.request(
+            "POST",
+            f"{prefix}/api/admin/import?{urlencode(query)}",
+            body=chunks(source),
+            headers={"Content-Type": MIMETYPES[args.format]},
+            encode_chunked=True,
+        )
+    finally:
+        if args.input != "-":
+            source.close()
+    response = connection.getresponse()
+    print(response.read().decode())
+    if response.status != 200:
+        sys.exit(1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import the links of a running URL shortener.")
+    parser.add_argument("--url", default="http://localhost:5000", help="base URL of the service")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="stream every link to a file or stdout")
+    export_parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    export_parser.add_argument("--output", help="file to write (default: stdout)")
+    export_parser.set_defaults(handler=export_command)
+
+    import_parser = commands.add_parser("import", help="bulk-load links from an export")
+    import_parser.add_argument("input", help="export file, or - for stdin")
+    import_parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    import_parser.add_argument("--skip-existing", action="store_true", help="keep links whose code already exists")
+    import_parser.set_defaults(handler=import_command)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
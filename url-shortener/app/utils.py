@@ -7,11 +7,21 @@
 # utils.py
 import random
 import string
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit, urlunsplit
 
 # Characters allowed in short codes (alphanumeric)
 ALPHANUMERIC_CHARS = string.ascii_letters + string.digits
 SHORT_CODE_LENGTH = 6 # As per requirements
+# Number of distinct short codes of SHORT_CODE_LENGTH (62^6)
+SHORT_CODE_SPACE = len(ALPHANUMERIC_CHARS) ** SHORT_CODE_LENGTH
+# Reverse lookup used when decoding base62 codes back to integers
+_BASE62_INDEX = {char: index for index, char in enumerate(ALPHANUMERIC_CHARS)}
+
+def random_short_code() -> str:
+    """
+    Returns a random 6-character alphanumeric code without any uniqueness check.
+    """
+    return ''.join(random.choices(ALPHANUMERIC_CHARS, k=SHORT_CODE_LENGTH))
 
 def generate_short_code(existing_codes: set) -> str:
     """
@@ -20,11 +30,37 @@ def generate_short_code(existing_codes: set) -> str:
     """
     while True:
         # Generate a random 6-character string from alphanumeric characters
-        short_code = ''.join(random.choices(ALPHANUMERIC_CHARS, k=SHORT_CODE_LENGTH))
+        short_code = random_short_code()
         # Ensure the generated short code is unique
         if short_code not in existing_codes:
             return short_code
 
+def encode_base62(number: int, length: int = SHORT_CODE_LENGTH) -> str:
+    """
+    Encodes a non-negative integer as a fixed-width base62 string.
+    Raises ValueError if the number does not fit in 'length' characters.
+    """
+    if number < 0 or number >= len(ALPHANUMERIC_CHARS) ** length:
+        raise ValueError(f"{number} does not fit in {length} base62 characters")
+    chars = []
+    for _ in range(length):
+        number, remainder = divmod(number, len(ALPHANUMERIC_CHARS))
+        chars.append(ALPHANUMERIC_CHARS[remainder])
+    return ''.join(reversed(chars))
+
+def decode_base62(code: str) -> int:
+    """
+    Decodes a base62 string produced by encode_base62 back to its integer.
+    Raises ValueError for characters outside ALPHANUMERIC_CHARS.
+    """
+    number = 0
+    for char in code:
+        index = _BASE62_INDEX.get(char)
+        if index is None:
+            raise ValueError(f"Invalid base62 character: {char!r}")
+        number = number * len(ALPHANUMERIC_CHARS) + index
+    return number
+
 def is_valid_url(url: str) -> bool:
     """
     Validates if a given string is a well-formed URL.
@@ -36,4 +72,33 @@ def is_valid_url(url: str) -> bool:
         # and a network location (e.g., example.com)
         return all([result.scheme, result.netloc]) and result.scheme in ['http', 'https']
     except ValueError:
-        return False
\ No newline at end of file
+        return False
+
+# Ports that can be dropped from a URL without changing its meaning
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def normalize_url(url: str) -> str:
+    """
+    Returns a canonical form of a valid URL so that trivially different
+    spellings of the same link compare equal: lowercases the scheme and host,
+    drops default ports and uses "/" for an empty path. Query and fragment are
+    kept as they are, since servers may treat them case- and order-sensitively.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    try:
+        port = parts.port
+    except ValueError:
+        return url
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"  # IPv6 literal
+    netloc = host
+    if port is not None and port != _DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    if parts.username is not None:
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo = f"{userinfo}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
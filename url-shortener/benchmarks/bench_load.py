@@ -0,0 +1,116 @@
+# bench_load.py
+# Load test: several threads drive the Flask app through its test client with a
+# mix of shorten and redirect requests. Redirect targets follow a Zipf
+# distribution, so a few links get most of the traffic.
+#
+# Usage (from the url-shortener folder):
+#   python -m benchmarks.bench_load
+#   python -m benchmarks.bench_load --threads 8 --requests 100000 --shorten-ratio 0.05 --zipf 1.2
+#
+# Store and app settings come from the usual SHORTENER_* environment variables
+# (e.g. SHORTENER_STORE_ENGINE=compact or SHORTENER_REDIRECT_CACHE=0), so the
+# same workload can be compared across configurations. The run is in-process:
+# it measures the app and the store, not an HTTP server or the network.
+import argparse
+import json
+import random
+import threading
+import time
+
+from benchmarks.common import environment, latency_summary, zipf_cumulative_weights
+
+def worker(app, codes, cum_weights, requests, shorten_ratio, seed, samples, start):
+    rng = random.Random(seed)
+    client = app.test_client()
+    clock = time.perf_counter_ns
+    # Popularity ranks are fixed per run; draw all targets up front
+    targets = iter(rng.choices(codes, cum_weights=cum_weights, k=requests))
+    start.wait()
+    for i in range(requests):
+        if rng.random() < shorten_ratio:
+            before = clock()
+            response = client.post("/api/shorten", json={"url": f"https://www.example.com/load/{seed}/{i}"})
+            samples["shorten"].append(clock() - before)
+            expected = (200, 201)
+            next(targets)
+        else:
+            before = clock()
+            response = client.get("/" + next(targets))
+            samples["redirect"].append(clock() - before)
+            expected = (302,)
+        if response.status_code not in expected:
+            samples["errors"] += 1
+
+def run(links, threads, requests, shorten_ratio, exponent, seed):
+    from app import config
+    from app.main import app, url_store
+
+    codes = url_store.create_urls([f"https://www.example.com/articles/{i}/load" for i in range(links)])
+    rng = random.Random(seed)
+    # Rank order is shuffled so popular links are spread over the store
+    rng.shuffle(codes)
+    cum_weights = zipf_cumulative_weights(len(codes), exponent)
+
+    per_thread = [{"shorten": [], "redirect": [], "errors": 0} for _ in range(threads)]
+    start = threading.Barrier(threads + 1)
+    workers = [
+        threading.Thread(
+            target=worker,
+            args=(app, codes, cum_weights, requests // threads, shorten_ratio, seed + n, per_thread[n], start),
+        )
+        for n in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for op in ("shorten", "redirect"):
+        results[op] = latency_summary([s for samples in per_thread for s in samples[op]], elapsed)
+    results["all"] = latency_summary(
+        [s for samples in per_thread for op in ("shorten", "redirect") for s in samples[op]], elapsed
+    )
+    return {
+        "benchmark": "load",
+        "environment": environment(),
+        "settings": {
+            "links": links,
+            "threads": threads,
+            "requests": requests,
+            "shorten_ratio": shorten_ratio,
+            "zipf_exponent": exponent,
+            "seed": seed,
+        },
+        "config": {
+            "store_engine": config.STORE_ENGINE,
+            "shards": config.STORE_SHARDS,
+            "click_buffering": config.CLICK_BUFFERING,
+            "redirect_cache": config.REDIRECT_CACHE,
+            "bloom_filter": config.BLOOM_FILTER,
+            "dedupe": config.DEDUPE,
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "errors": sum(samples["errors"] for samples in per_thread),
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--links", type=int, default=10_000, help="links created before the run")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50_000, help="total requests across all threads")
+    parser.add_argument("--shorten-ratio", type=float, default=0.1, help="fraction of requests that shorten")
+    parser.add_argument("--zipf", type=float, default=1.0, help="Zipf exponent for redirect targets")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    report = run(args.links, args.threads, args.requests, args.shorten_ratio, args.zipf, args.seed)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
@@ -0,0 +1,76 @@
+# bench_memory.py
+# Reports memory per link for the dict-per-link URLStore and CompactURLStore.
+#
+# Usage (from the url-shortener folder):
+#   python -m benchmarks.bench_memory                      # 1M and 10M links
+#   python -m benchmarks.bench_memory --sizes 100000 1000000
+#
+# Each measurement runs in a fresh process and reports the growth in resident
+# memory while the store is filled, divided by the number of links.
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+
+from app.compact import CompactURLStore
+from app.models import URLStore
+from app.utils import SHORT_CODE_SPACE, encode_base62
+
+ENGINES = {
+    "dict": URLStore,
+    "compact": CompactURLStore,
+}
+
+def current_rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak RSS is the best portable fallback (kilobytes on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def generate_entries(count: int):
+    # Spread codes over the whole code space, like real allocations would
+    step = 7919 * 104729
+    for i in range(count):
+        yield (
+            encode_base62((i * step) % SHORT_CODE_SPACE),
+            f"https://www.example.com/articles/{i}/an-average-length-slug",
+            0,
+            1700000000.0 + i,
+        )
+
+def measure(engine: str, count: int, results):
+    before = current_rss()
+    store = ENGINES[engine]()
+    store.load_entries(generate_entries(count))
+    after = current_rss()
+    results.put({
+        "engine": engine,
+        "links": len(store),
+        "rss_bytes": after - before,
+        "bytes_per_link": round((after - before) / count, 1),
+    })
+
+def run(sizes, engines):
+    context = multiprocessing.get_context("spawn")
+    report = []
+    for count in sizes:
+        for engine in engines:
+            results = context.Queue()
+            process = context.Process(target=measure, args=(engine, count, results))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                report.append({"engine": engine, "links": count, "error": f"exit code {process.exitcode}"})
+            else:
+                report.append(results.get())
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.engines), indent=2))
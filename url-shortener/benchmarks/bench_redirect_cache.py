@@ -0,0 +1,75 @@
+# bench_redirect_cache.py
+# Reports redirects per second with and without the redirect response cache.
+#
+# Usage (from the url-shortener folder):
+#   python -m benchmarks.bench_redirect_cache
+#   python -m benchmarks.bench_redirect_cache --links 5000 --requests 200000
+#
+# Each mode runs in a fresh process (the cache is wired up at import time from
+# SHORTENER_REDIRECT_CACHE). Requests go straight through the WSGI callable, so
+# the numbers measure the app rather than an HTTP server or the test client.
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+
+MODES = {
+    "uncached": "0",
+    "cached": "1",
+}
+
+def measure(mode: str, links: int, requests: int, results):
+    os.environ["SHORTENER_REDIRECT_CACHE"] = MODES[mode]
+    from werkzeug.test import EnvironBuilder
+    from app.main import app, url_store
+
+    codes = url_store.create_urls([f"https://www.example.com/articles/{i}/hot-link" for i in range(links)])
+    base = EnvironBuilder(path="/", base_url="http://localhost:5000").get_environ()
+    # Zipf-like popularity: a few codes get most of the traffic
+    rng = random.Random(42)
+    order = rng.choices(codes, weights=[1 / (rank + 1) for rank in range(links)], k=requests)
+
+    def start_response(status, headers):
+        pass
+
+    # Warm-up pass fills the cache (and the code paths) before timing
+    for short_code in codes:
+        environ = dict(base, PATH_INFO="/" + short_code)
+        b"".join(app(environ, start_response))
+
+    started = time.perf_counter()
+    for short_code in order:
+        environ = dict(base, PATH_INFO="/" + short_code)
+        b"".join(app(environ, start_response))
+    elapsed = time.perf_counter() - started
+    results.put({
+        "mode": mode,
+        "links": links,
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "redirects_per_second": round(requests / elapsed),
+    })
+
+def run(links, requests, modes):
+    context = multiprocessing.get_context("spawn")
+    report = []
+    for mode in modes:
+        results = context.Queue()
+        process = context.Process(target=measure, args=(mode, links, requests, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            report.append({"mode": mode, "error": f"exit code {process.exitcode}"})
+        else:
+            report.append(results.get())
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--links", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+    print(json.dumps(run(args.links, args.requests, args.modes), indent=2))
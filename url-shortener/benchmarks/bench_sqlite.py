@@ -0,0 +1,102 @@
+# bench_sqlite.py
+# Throughput of the SQLite store against the in-memory dict store.
+#
+# Usage (from the url-shortener folder):
+#   python -m benchmarks.bench_sqlite
+#   python -m benchmarks.bench_sqlite --links 100000 --threads 1 8 32 --output sqlite.json
+#
+# Each store is preloaded with --links links, then every operation is run by
+# 1, 8 and 32 threads (by default) for --ops operations in total. With several
+# threads the SQLite writer commits whatever has queued up in one transaction,
+# so its write throughput depends on concurrency (--batch-size 1 turns the
+# grouping off for comparison); the dict store is measured the same way for
+# reference. The database lives in a temporary directory unless --path is
+# given (e.g. to measure a particular disk).
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_memory import generate_entries
+from benchmarks.bench_micro import existing_code
+from benchmarks.common import environment
+from app.models import URLStore
+from app.sqlite_store import SQLiteURLStore
+
+def run_threads(operation, arguments, threads: int) -> dict:
+    # Splits 'arguments' between 'threads' threads released together
+    parts = [arguments[i::threads] for i in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(part):
+        barrier.wait()
+        for argument in part:
+            operation(argument)
+
+    workers = [threading.Thread(target=worker, args=(part,)) for part in parts]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {"ops": len(arguments), "seconds": round(elapsed, 3), "ops_per_sec": round(len(arguments) / elapsed)}
+
+def measure(store, links: int, ops: int, threads: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    hits = [existing_code(rng.randrange(links)) for _ in range(ops)]
+    batches = [{existing_code(rng.randrange(links)): 1 for _ in range(100)} for _ in range(max(1, ops // 100))]
+    prefix = f"https://example.com/{threads}"
+    return {
+        "get_url_info": run_threads(store.get_url_info, hits, threads),
+        "create_url": run_threads(store.create_url, [f"{prefix}/create/{i}" for i in range(ops)], threads),
+        "add_url": run_threads(
+            lambda i: store.add_url(existing_code(links + i), f"{prefix}/add/{i}"),
+            list(range(threads * ops, (threads + 1) * ops)),
+            threads,
+        ),
+        "increment_clicks": run_threads(store.increment_clicks, hits, threads),
+        "add_clicks_batch_100": run_threads(store.add_clicks, batches, threads),
+    }
+
+def run(links: int, ops: int, thread_counts, seed: int, path: str = None, batch_size: int = 1000) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        stores = {
+            "dict": URLStore(),
+            "sqlite": SQLiteURLStore(path or os.path.join(directory, "bench.db"), batch_size=batch_size),
+        }
+        for engine, store in stores.items():
+            started = time.perf_counter()
+            store.load_entries(generate_entries(links))
+            results[engine] = {"load_seconds": round(time.perf_counter() - started, 3), "threads": {}}
+            for threads in thread_counts:
+                results[engine]["threads"][str(threads)] = measure(store, links, ops, threads, seed)
+        stores["sqlite"].close()
+    return {
+        "benchmark": "sqlite",
+        "environment": environment(),
+        "settings": {"links": links, "ops": ops, "threads": thread_counts, "seed": seed, "batch_size": batch_size},
+        "stores": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--links", type=int, default=100_000, help="links loaded before measuring")
+    parser.add_argument("--ops", type=int, default=20_000, help="operations per measurement")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1000, help="SQLite writes per transaction (1 disables grouping)")
+    parser.add_argument("--path", help="database file to use instead of a temporary one")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    report = run(args.links, args.ops, args.threads, args.seed, args.path, args.batch_size)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
@@ -0,0 +1,43 @@
+# common.py
+# Helpers shared by the benchmark scripts.
+import itertools
+import platform
+import sys
+
+def latency_summary(samples_ns: list, elapsed: float) -> dict:
+    """
+    Summarises per-operation latencies (nanoseconds) measured over 'elapsed'
+    wall-clock seconds: count, throughput and p50/p99/p999/max in microseconds.
+    """
+    if not samples_ns:
+        return {"ops": 0}
+    ordered = sorted(samples_ns)
+    count = len(ordered)
+
+    def percentile(q):
+        return round(ordered[min(count - 1, int(q * count))] / 1000, 2)
+
+    return {
+        "ops": count,
+        "ops_per_sec": round(count / elapsed) if elapsed > 0 else None,
+        "p50_us": percentile(0.50),
+        "p99_us": percentile(0.99),
+        "p999_us": percentile(0.999),
+        "max_us": round(ordered[-1] / 1000, 2),
+    }
+
+def zipf_cumulative_weights(count: int, exponent: float) -> list:
+    """
+    Cumulative weights for random.choices(): rank r (0-based) is drawn with
+    probability proportional to 1 / (r + 1) ** exponent.
+    """
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+def environment() -> dict:
+    # Recorded with every report so runs from different machines are not mixed up
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
@@ -0,0 +1,46 @@
+# test_allocators.py
+from app.allocators import CodeAllocator, CounterCodeAllocator, PooledCodeAllocator
+from app.models import URLStore
+from app.utils import ALPHANUMERIC_CHARS, SHORT_CODE_LENGTH, decode_base62, encode_base62
+
+# Test base62 helpers round-trip at the edges of the code space
+def test_base62_round_trip():
+    for number in (0, 1, 61, 62, 123456789, 62 ** SHORT_CODE_LENGTH - 1):
+        code = encode_base62(number)
+        assert len(code) == SHORT_CODE_LENGTH
+        assert decode_base62(code) == number
+
+# Counter allocator must be a bijection and must not look sequential
+def test_counter_allocator_unique_and_scrambled():
+    allocator = CounterCodeAllocator(secret=b"test-secret")
+    codes = [allocator.next_code() for _ in range(5000)]
+    assert len(set(codes)) == len(codes)
+    assert all(len(c) == SHORT_CODE_LENGTH and all(ch in ALPHANUMERIC_CHARS for ch in c) for c in codes)
+    assert codes != sorted(codes)
+
+    # Same secret and start reproduce the same sequence; a different secret does not
+    assert CounterCodeAllocator(secret=b"test-secret").next_code() == codes[0]
+    assert CounterCodeAllocator(secret=b"other-secret").next_code() != codes[0]
+
+# Pool allocator hands out distinct codes and keeps working past its pool size
+def test_pooled_allocator_refills():
+    allocator = PooledCodeAllocator(pool_size=50)
+    try:
+        codes = {allocator.next_code() for _ in range(200)}
+        assert len(codes) == 200
+    finally:
+        allocator.close()
+
+# The store retries when the allocator proposes a code that is already taken
+def test_store_skips_taken_codes():
+    class FixedAllocator(CodeAllocator):
+        def __init__(self, codes):
+            self.codes = iter(codes)
+
+        def next_code(self):
+            return next(self.codes)
+
+    store = URLStore(allocator=FixedAllocator(["aaaaaa", "aaaaaa", "bbbbbb"]))
+    assert store.create_url("https://one.example") == "aaaaaa"
+    assert store.create_url("https://two.example") == "bbbbbb"
+    assert store.get_url_info("bbbbbb")["original_url"] == "https://two.example"
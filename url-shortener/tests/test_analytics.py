@@ -0,0 +1,56 @@
+# test_analytics.py
+import pytest
+
+from app.analytics import ClickAnalytics, parse_window
+from app.models import URLStore
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+# Clicks land in the right minute/hour/day buckets and old buckets expire
+def test_windows_roll_over():
+    clock = FakeClock(1_000_000 * 60.0)
+    analytics = ClickAnalytics(clock=clock)
+    analytics.record("abc123", 3)
+    clock.now += 60
+    analytics.record("abc123")
+
+    minutes = analytics.window("abc123", "minute", 5)
+    assert minutes["buckets"] == [0, 0, 0, 3, 1]
+    assert minutes["total"] == 4
+    assert analytics.window("abc123", "day", 30)["total"] == 4
+
+    # After more than an hour the minute ring has forgotten, the day ring has not
+    clock.now += 2 * 3600
+    assert analytics.window("abc123", "minute", 60)["total"] == 0
+    analytics.record("abc123")
+    assert analytics.window("abc123", "minute", 60)["total"] == 1
+    assert analytics.window("abc123", "hour", 48)["total"] == 5
+    assert analytics.window("unknown", "hour", 3)["buckets"] == [0, 0, 0]
+
+# Windows are dropped when the store overwrites or deletes a link, and all of
+# them when it is cleared
+def test_windows_follow_store_invalidation():
+    store = URLStore()
+    analytics = ClickAnalytics()
+    store.invalidation_hooks.append(analytics.on_store_invalidated)
+    codes = store.create_urls(["https://example.com/a", "https://example.com/b"])
+    for short_code in codes:
+        analytics.record(short_code)
+
+    store.add_url(codes[0], "https://example.com/replaced")
+    assert analytics.window(codes[0], "day", 1)["total"] == 0
+    assert analytics.window(codes[1], "day", 1)["total"] == 1
+    store.clear()
+    assert analytics.window(codes[1], "day", 1)["total"] == 0
+
+def test_parse_window():
+    assert parse_window("60m") == ("minute", 60)
+    assert parse_window("30d") == ("day", 30)
+    for bad in ("", "m", "61m", "0h", "10x", "-1d"):
+        with pytest.raises(ValueError):
+            parse_window(bad)
@@ -0,0 +1,95 @@
+# test_asgi.py
+import asyncio
+import json
+
+import pytest
+
+from app import config
+from app.asgi import app as asgi_app
+from app.models import url_store
+
+def call(method, path, body=b"", query=b"", headers=None):
+    """
+    Runs one request through the ASGI app and returns (status, headers, body).
+    """
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": method, "path": path, "query_string": query,
+        "scheme": "http", "server": ("localhost", 5000),
+        "headers": [(b"host", b"localhost:5000")] + (headers or []),
+    }
+    asyncio.run(asgi_app(scope, receive, send))
+    start = sent[0]
+    return start["status"], dict(start["headers"]), b"".join(m.get("body", b"") for m in sent[1:])
+
+@pytest.fixture(autouse=True)
+def empty_store():
+    url_store.clear()
+
+# Shorten, redirect and stats are served natively and share the Flask app's store
+def test_asgi_native_routes():
+    status, _, body = call("POST", "/api/shorten", json.dumps({"url": "https://example.com/asgi"}).encode())
+    assert status == 201
+    data = json.loads(body)
+    assert data["short_url"] == "http://localhost:5000/" + data["short_code"]
+    assert url_store.get_url_info(data["short_code"])["original_url"] == "https://example.com/asgi"
+
+    for _ in range(2):
+        status, headers, _ = call("GET", "/" + data["short_code"])
+        assert status == 302
+        assert headers[b"location"] == b"https://example.com/asgi"
+
+    status, _, body = call("GET", "/api/stats/" + data["short_code"])
+    assert status == 200 and json.loads(body)["clicks"] == 2
+
+    assert call("GET", "/nope00")[0] == 404
+    assert call("GET", "/api/stats/nope00")[0] == 404
+    assert call("POST", "/api/shorten", b'{"url": "not a url"}')[0] == 400
+    assert call("POST", "/api/shorten", b"garbage")[0] == 400
+
+# Other routes are served by the Flask app, including streamed responses
+def test_asgi_falls_back_to_flask():
+    status, _, body = call("GET", "/api/health")
+    assert status == 200 and json.loads(body)["status"] == "ok"
+
+    status, headers, body = call(
+        "POST", "/api/shorten/batch", b'"https://example.com/a"\n"https://example.com/b"\n',
+        headers=[(b"content-type", b"application/x-ndjson")],
+    )
+    assert status == 200 and headers[b"content-type"] == b"application/x-ndjson"
+    assert len(body.splitlines()) == 2
+
+    status, _, body = call("GET", "/api/stats/bulk", query=b"sort=clicks")
+    assert status == 200 and len(body.splitlines()) == 2
+
+# Request bodies reach Flask as a stream: results go out before the upload ends
+def test_asgi_streams_request_body_to_flask():
+    lines = b"".join(b'"https://example.com/%d"\n' % i for i in range(config.BATCH_CHUNK_SIZE))
+    messages = [{"type": "http.request", "body": lines, "more_body": True} for _ in range(3)]
+    messages[-1]["more_body"] = False
+    events = []
+
+    async def receive():
+        events.append("receive")
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message.get("body"):
+            events.append("send")
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/api/shorten/batch", "query_string": b"",
+        "headers": [(b"host", b"localhost:5000"), (b"content-type", b"application/x-ndjson")],
+    }
+    asyncio.run(asgi_app(scope, receive, send))
+    assert events.count("send") == 3
+    assert events.index("send") < len(events) - 1 - events[::-1].index("receive")
+    assert len(url_store) == 3 * config.BATCH_CHUNK_SIZE
@@ -12,8 +12,7 @@ def client():
     app.config['SERVER_NAME'] = 'localhost:5000'
     # If you moved URLStore into models.py and it's a global instance:
     from app.models import url_store # Import here to ensure it's loaded correctly within fixture scope
-    with url_store.lock: # Use the lock when clearing
-        url_store.urls.clear() # Clear the store for each test
+    url_store.clear() # Clear the store for each test (thread-safe, works for every store type)
     with app.test_client() as client:
         yield client
 
@@ -198,4 +197,143 @@ def test_concurrency_click_increment(client):
 
         stats_response = client.get(f'/api/stats/{short_code}')
         data = stats_response.get_json()
-        assert data["clicks"] == num_requests
\ No newline at end of file
+        assert data["clicks"] == num_requests
+
+
+# Batch shortening with a JSON body returns one result per item, in order
+def test_shorten_batch_json(client):
+    urls = ["https://example.com/a", "not-a-url", {"url": "https://example.com/b"}, {}]
+    response = client.post('/api/shorten/batch', json={"urls": urls})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["created"] == 2 and data["failed"] == 2
+    results = data["results"]
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert results[1]["error"] == "Invalid URL provided."
+    assert results[3]["error"] == "URL is required."
+    for result in (results[0], results[2]):
+        assert result["short_url"] == f"http://localhost:5000/{result['short_code']}"
+        assert url_store.get_url_info(result["short_code"])["original_url"] == result["url"]
+
+    for body in ({"url": "https://example.com"}, [1, 2], "x"):
+        response = client.post('/api/shorten/batch', json=body)
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "A list of URLs is required in request body."
+
+
+# Batch shortening with an NDJSON body streams NDJSON results back
+def test_shorten_batch_ndjson(client):
+    lines = [json.dumps(f"https://example.com/{i}") for i in range(2500)]
+    lines[5] = "{not json"
+    body = "\n".join(lines) + "\n"
+    response = client.post('/api/shorten/batch', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(results) == 2500
+    assert results[5]["error"] == "Malformed JSON line."
+    assert sum(1 for r in results if "short_code" in r) == 2499
+    assert len({r["short_code"] for r in results if "short_code" in r}) == 2499
+
+
+# Bulk stats by code list, streamed as NDJSON with exact click counts
+def test_bulk_stats_codes(client):
+    codes = [client.post('/api/shorten', json={"url": f"https://example.com/{i}"}).get_json()["short_code"] for i in range(3)]
+    client.get(f'/{codes[1]}')
+    client.get(f'/{codes[1]}')
+    client.get(f'/{codes[2]}')
+
+    response = client.post('/api/stats/bulk', json={"codes": codes + ["missing", codes[0]], "sort": "clicks"})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["short_code"] for row in rows] == [codes[1], codes[2], codes[0]]
+    assert [row["clicks"] for row in rows] == [2, 1, 0]
+    assert rows[0]["url"] == "https://example.com/1"
+    datetime.fromisoformat(rows[0]["created_at"])
+
+
+# Bulk stats scan with prefix, time range, sort and limit
+def test_bulk_stats_scan(client):
+    url_store.add_url("aaa001", "https://example.com/a1")
+    url_store.add_url("aaa002", "https://example.com/a2")
+    url_store.add_url("bbb001", "https://example.com/b1")
+    for _ in range(3):
+        client.get('/aaa002')
+
+    response = client.get('/api/stats/bulk?prefix=aaa&sort=clicks&limit=1')
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(row["short_code"], row["clicks"]) for row in rows] == [("aaa002", 3)]
+
+    future = (datetime.now() + timedelta(days=1)).isoformat()
+    response = client.get(f'/api/stats/bulk?created_after={future}')
+    assert response.get_data(as_text=True) == ""
+
+    assert client.get('/api/stats/bulk?sort=bogus').status_code == 400
+    assert client.get('/api/stats/bulk?limit=0').status_code == 400
+
+
+# Windowed stats view on the analytics endpoint
+def test_get_analytics_window(client):
+    from app.models import click_analytics
+    if click_analytics is None:
+        pytest.skip("windowed stats are disabled (SHORTENER_CLICK_WINDOWS=0)")
+    short_code = client.post('/api/shorten', json={"url": "https://example.com/windowed"}).get_json()["short_code"]
+    client.get(f'/{short_code}')
+    client.get(f'/{short_code}')
+
+    data = client.get(f'/api/stats/{short_code}?window=60m').get_json()
+    assert data["clicks"] == 2
+    assert data["window"]["unit"] == "minute"
+    assert len(data["window"]["buckets"]) == 60
+    assert data["window"]["total"] == 2
+    datetime.fromisoformat(data["window"]["start"])
+
+    assert client.get(f'/api/stats/{short_code}?window=90m').status_code == 400
+
+
+# Admin stats report the store size
+def test_admin_stats(client):
+    client.post('/api/shorten', json={"url": "https://example.com/admin"})
+    data = client.get('/api/admin/stats').get_json()
+    assert data["links"] == 1
+
+
+# Repeat redirects are served from the redirect cache and still counted
+def test_redirect_served_from_cache(client):
+    from app.main import redirect_cache
+    if redirect_cache is None:
+        pytest.skip("redirect cache disabled")
+    short_code = client.post('/api/shorten', json={"url": "https://example.com/cached"}).get_json()["short_code"]
+    for _ in range(3):
+        response = client.get(f'/{short_code}')
+        assert response.status_code == 302
+        assert response.headers["Location"] == "https://example.com/cached"
+    assert redirect_cache.stats()["hits"] >= 2
+    assert client.get(f'/api/stats/{short_code}').get_json()["clicks"] == 3
+
+
+# Links with a TTL stop redirecting once expired and are then reclaimed
+def test_shorten_with_expiry(client):
+    from app.main import link_expiry
+    if link_expiry is None:
+        pytest.skip("link expiry disabled")
+    response = client.post('/api/shorten', json={"url": "https://example.com/ttl", "expires_in": 0.5})
+    assert response.status_code == 201
+    data = response.get_json()
+    assert "expires_at" in data
+    short_code = data["short_code"]
+    assert client.get(f'/{short_code}').status_code == 302
+    assert "expires_at" in client.get(f'/api/stats/{short_code}').get_json()
+
+    time.sleep(0.6)
+    assert client.get(f'/{short_code}').status_code == 404
+    assert client.get(f'/api/stats/{short_code}').status_code == 404
+    link_expiry.sweep(now=time.time() + 1)
+    assert url_store.get_url_info(short_code) is None
+    assert client.get('/api/admin/stats').get_json()["expiry"]["reclaimed"] >= 1
+
+    past = client.post('/api/shorten', json={"url": "https://example.com/ttl", "expires_at": "2000-01-01T00:00:00"})
+    assert past.status_code == 400
+    both = client.post('/api/shorten', json={"url": "https://example.com/ttl", "expires_in": 5, "expires_at": 4102444800})
+    assert both.status_code == 400
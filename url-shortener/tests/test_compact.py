@@ -0,0 +1,53 @@
+# test_compact.py
+import pytest
+
+from app.compact import CompactURLStore, URLRecord
+
+# Compact store supports the URLStore API and survives table growth
+def test_compact_store_round_trip():
+    store = CompactURLStore(capacity=8)
+    codes = {store.create_url(f"https://example.com/{i}/ünïcode"): i for i in range(2000)}
+    assert len(store) == 2000
+    for code, i in codes.items():
+        record = store.get_url_info(code)
+        assert isinstance(record, URLRecord)
+        assert record["original_url"] == f"https://example.com/{i}/ünïcode"
+        assert record.short_code == code
+        assert record["clicks"] == 0 and "created_at" in record
+
+    code = next(iter(codes))
+    assert store.increment_clicks(code) is True
+    store.add_clicks({code: 4, "zzzzzz": 1})
+    assert store.get_url_info(code)["clicks"] == 5
+    assert store.increment_clicks("zzzzzz") is False
+    assert store.get_url_info("zzzzzz") is None
+
+    store.add_url(code, "https://example.org/replaced")
+    assert store.get_url_info(code)["original_url"] == "https://example.org/replaced"
+    assert len(store) == 2000
+
+# Codes that cannot be encoded as integers are rejected on write and missed on read
+def test_compact_store_rejects_non_standard_codes():
+    store = CompactURLStore()
+    with pytest.raises(ValueError):
+        store.add_url("toolongcode", "https://example.com")
+    assert store.get_url_info("bad!") is None
+    assert store.is_short_code_taken("abc") is False
+
+# Compact layout is far smaller than one dict per link
+def test_compact_store_memory_per_link():
+    store = CompactURLStore()
+    store.load_entries((f"{i:06d}", "https://example.com/x", 0, 0.0) for i in range(10000))
+    assert store.memory_usage() / len(store) < 100
+
+# Iteration skips freed rows reused by links created after it started
+def test_compact_store_iter_skips_reused_rows():
+    store = CompactURLStore()
+    codes = [store.create_url(f"https://example.com/{i}") for i in range(4)]
+    store.delete_many(codes[2:])
+    entries = store.iter_entries(chunk_size=1)
+    seen = [next(entries)[0]]
+    new_code = store.create_url("https://example.com/new")
+    seen.extend(entry[0] for entry in entries)
+    assert new_code not in seen
+    assert sorted(seen) == sorted(codes[:2])
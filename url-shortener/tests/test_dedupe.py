@@ -0,0 +1,50 @@
+# test_dedupe.py
+import threading
+
+from app.dedupe import ReverseIndex
+from app.models import ShardedURLStore
+from app.utils import normalize_url
+
+# Normalization only folds spellings that mean the same URL
+def test_normalize_url():
+    assert normalize_url("HTTPS://Example.COM:443") == "https://example.com/"
+    assert normalize_url("http://example.com:80/a?b=1#c") == "http://example.com/a?b=1#c"
+    assert normalize_url("http://example.com:8080/A") == "http://example.com:8080/A"
+    assert normalize_url("http://user:pw@Example.com/") == "http://user:pw@example.com/"
+    assert normalize_url("http://[::1]:80/") == "http://[::1]/"
+    assert normalize_url("https://example.com/?q=A") != normalize_url("https://example.com/?q=a")
+
+# Shortening the same URL twice returns the first code
+def test_reverse_index_reuses_code():
+    store = ShardedURLStore(num_shards=4)
+    index = ReverseIndex()
+    code, created = index.shorten(store, "https://Example.com")
+    assert created is True
+    assert index.shorten(store, "https://example.com/") == (code, False)
+    assert len(store) == 1
+
+    # A stale index entry (e.g. after the store was cleared) is not trusted
+    store.clear()
+    new_code, created = index.shorten(store, "https://example.com/")
+    assert created is True and store.get_url_info(new_code) is not None
+
+    index.rebuild(store)
+    assert index.shorten(store, "https://EXAMPLE.com") == (new_code, False)
+
+# Concurrent writers for the same URL end up with exactly one link
+def test_reverse_index_concurrent_writers():
+    store = ShardedURLStore(num_shards=4)
+    index = ReverseIndex()
+    results = []
+
+    def worker():
+        for _ in range(50):
+            results.append(index.shorten(store, "https://example.com/same")[0])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(results)) == 1
+    assert len(store) == 1
@@ -0,0 +1,153 @@
+# test_expiry.py
+import random
+import threading
+
+import pytest
+
+from app.compact import CompactURLStore
+from app.expiry import LinkExpiry, TimerWheel
+from app.models import ShardedURLStore, URLStore
+from app.persistence import Persistence
+
+# Every timer fires on the first advance that reaches its tick, across all levels
+def test_timer_wheel_fires_on_time():
+    wheel = TimerWheel(start_tick=1000, bits=3, levels=3)
+    rng = random.Random(7)
+    ticks = {f"t{i}": 1000 + rng.choice([0, 1, 5, 8, 63, 64, 300, 511, 512, 2000]) + rng.randint(0, 9)
+             for i in range(300)}
+    for item, tick in ticks.items():
+        wheel.schedule(item, tick)
+
+    fired = {}
+    now = 1000
+    while now < 3600:
+        now += rng.randint(1, 40)
+        for item, tick in wheel.advance(now):
+            fired[item] = now
+            assert tick <= now
+    assert fired.keys() == ticks.keys()
+    # Nothing fired a whole step late
+    assert all(fired[item] - ticks[item] < 40 for item in ticks)
+    assert wheel.size == 0
+
+@pytest.mark.parametrize("store_class", [URLStore, CompactURLStore, ShardedURLStore])
+def test_link_expiry_reclaims_links(store_class):
+    store = store_class()
+    clock = [1000.0]
+    expiry = LinkExpiry(store, clock=lambda: clock[0])
+    keep = store.create_url("https://example.com/keep")
+    short = [store.create_url(f"https://example.com/short/{i}") for i in range(50)]
+    late = store.create_url("https://example.com/late")
+    for code in short:
+        expiry.set(code, 1010.5)
+    expiry.set(late, 5000.0)
+
+    assert not expiry.is_expired(short[0])
+    assert expiry.sweep() == 0
+    clock[0] = 1010.5
+    # Expired at once for readers; reclaimed by the first sweep of the next tick
+    assert expiry.is_expired(short[0]) and not expiry.is_expired(keep)
+    assert expiry.sweep() == 0
+    clock[0] = 1011.0
+    assert expiry.sweep() == 50
+    assert all(store.get_url_info(code) is None for code in short)
+    assert store.get_url_info(keep) is not None and store.get_url_info(late) is not None
+    assert len(store) == 2
+
+    stats = expiry.stats()
+    assert stats["reclaimed"] == 50 and stats["scheduled"] == 1 and stats["bytes_freed"] > 0
+    assert expiry.sweep(now=5000.0) == 1 and len(store) == 1
+
+# Deleted compact rows are reused, probe chains stay intact and garbage is compacted
+def test_compact_store_delete():
+    store = CompactURLStore(capacity=8)
+    codes = [store.create_url(f"https://example.com/{i}") for i in range(500)]
+    removed = [code for i, code in enumerate(codes) if i % 3]
+    kept = codes[::3]
+    assert store.delete_many(removed + ["zzzzzz", "bad"]) > 0
+    assert len(store) == 167
+    assert all(store.get_url_info(code) is None for code in removed)
+    assert all(store.get_url_info(code)["original_url"] == f"https://example.com/{i * 3}"
+               for i, code in enumerate(kept))
+    assert sorted(entry[0] for entry in store.iter_entries()) == sorted(kept)
+    # Live URLs are 20-22 bytes each once the garbage is compacted away
+    assert len(store._arena) < 167 * 23
+    rows = len(store._codes)
+    store.create_urls([f"https://example.com/new/{i}" for i in range(100)])
+    assert len(store._codes) == rows and len(store) == 267
+
+# Deadlines survive a restart, and compaction leaves expired links out
+def test_expiry_persistence(tmp_path):
+    store = URLStore()
+    persistence = Persistence(str(tmp_path), commit_interval=0, snapshot_interval=0)
+    persistence.load_into(store)
+    persistence.start()
+    store.journal = persistence
+    expiry = LinkExpiry(store)
+    expiry.journal = persistence
+    gone = store.create_url("https://example.com/gone")
+    later = store.create_url("https://example.com/later")
+    expiry.set(gone, 1.0)
+    expiry.set(later, 4102444800.0)
+    persistence.close()
+
+    restored = URLStore()
+    restored_expiry = LinkExpiry(restored)
+    replay = Persistence(str(tmp_path), commit_interval=0, snapshot_interval=0)
+    replay.load_into(restored, restored_expiry)
+    assert restored_expiry.expires_at(later) == 4102444800.0
+    assert restored_expiry.is_expired(gone)
+    assert restored_expiry.sweep() == 1 and restored.get_url_info(gone) is None
+
+    replay.start()
+    replay.compact()
+    replay.close()
+    compacted = URLStore()
+    compacted_expiry = LinkExpiry(compacted)
+    Persistence(str(tmp_path), commit_interval=0, snapshot_interval=0).load_into(compacted, compacted_expiry)
+    assert len(compacted) == 1 and compacted_expiry.expires_at(later) == 4102444800.0
+
+# An overwritten link loses its deadline, in memory and after a restart
+@pytest.mark.parametrize("store_class", [URLStore, CompactURLStore])
+def test_overwrite_drops_deadline(tmp_path, store_class):
+    store = store_class()
+    persistence = Persistence(str(tmp_path), commit_interval=0, snapshot_interval=0)
+    persistence.load_into(store)
+    persistence.start()
+    store.journal = persistence
+    expiry = LinkExpiry(store)
+    expiry.journal = persistence
+    store.invalidation_hooks.append(expiry.on_store_invalidated)
+    kept = store.create_url("https://example.com/kept")
+    replaced = store.create_url("https://example.com/replaced")
+    expiry.set(kept, 1.0)
+    expiry.set(replaced, 1.0)
+    store.load_entries([(replaced, "https://example.com/new", 0, 2.0)])
+    assert expiry.expires_at(replaced) is None and not expiry.is_expired(replaced)
+    assert expiry.sweep() == 1 and store.get_url_info(replaced) is not None
+    persistence.close()
+
+    restored = store_class()
+    restored_expiry = LinkExpiry(restored)
+    Persistence(str(tmp_path), commit_interval=0, snapshot_interval=0).load_into(restored, restored_expiry)
+    assert restored_expiry.expires_at(replaced) is None
+    assert restored_expiry.expires_at(kept) == 1.0
+
+# A sweep and a store clear() running together don't deadlock
+def test_sweep_concurrent_with_clear():
+    store = URLStore()
+    expiry = LinkExpiry(store)
+    store.invalidation_hooks.append(expiry.on_store_invalidated)
+    expiry.set(store.create_url("https://example.com/gone"), 1.0)
+    delete_many = store.delete_many
+
+    def delete_during_clear(short_codes):
+        clearing = threading.Thread(target=store.clear)
+        clearing.start()
+        clearing.join(2)
+        assert not clearing.is_alive()
+        return delete_many(short_codes)
+
+    store.delete_many = delete_during_clear
+    assert expiry.sweep() == 1
+    assert len(store) == 0 and expiry.stats()["scheduled"] == 0
@@ -0,0 +1,28 @@
+# test_filters.py
+from app.filters import BloomFilter
+from app.models import ShardedURLStore
+
+# No false negatives, and the false-positive rate stays near the target
+def test_bloom_filter_accuracy():
+    bloom = BloomFilter(capacity=5000, fp_rate=0.01)
+    added = [f"in{i:04d}" for i in range(5000)]
+    bloom.add_many(added)
+    assert all(bloom.might_contain(code) for code in added)
+
+    false_positives = sum(bloom.might_contain(f"out{i:04d}") for i in range(10000))
+    assert false_positives / 10000 < 0.03
+    stats = bloom.stats()
+    assert stats["items"] == 5000
+    assert 0.3 < stats["fill_ratio"] < 0.7
+    assert stats["rejected"] == 10000 - false_positives
+
+# The store keeps the filter in sync on every insert path
+def test_store_feeds_filter():
+    store = ShardedURLStore(num_shards=4)
+    store.code_filter = BloomFilter(capacity=1000)
+    codes = [store.create_url("https://example.com/one")]
+    codes += store.create_urls(["https://example.com/two", "https://example.com/three"])
+    store.add_url("manual", "https://example.com/manual")
+    store.load_entries([("loaded", "https://example.com/loaded", 0, 0.0)])
+    for code in codes + ["manual", "loaded"]:
+        assert store.code_filter.might_contain(code)
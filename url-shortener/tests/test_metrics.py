@@ -0,0 +1,75 @@
+# test_metrics.py
+import threading
+import time
+
+import pytest
+
+from app.main import app
+from app.metrics import LatencyHistogram, instrument_store_locks, route_name
+from app.models import ShardedURLStore, URLStore, metrics
+
+# Percentiles stay within the histogram's relative error, and the
+# cumulative export counts every value below each bound
+def test_latency_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for value in range(1, 100001):
+        histogram.record(value * 1000)
+    result = histogram.percentiles([0.5, 0.99, 0.999])
+    for quantile, expected in ((0.5, 50_000_000), (0.99, 99_000_000), (0.999, 99_900_000)):
+        assert abs(result[quantile] - expected) / expected < 1 / 32
+
+    assert histogram.cumulative([0, 10**12]) == [0, 100000]
+    assert LatencyHistogram().percentiles([0.5]) == {0.5: None}
+
+# Shards of exited threads are folded into the totals instead of piling up
+def test_latency_histogram_prunes_exited_threads():
+    histogram = LatencyHistogram()
+    for i in range(20):
+        thread = threading.Thread(target=histogram.record, args=(1000 + i,))
+        thread.start()
+        thread.join()
+    histogram.record(5)
+    counts, count, total = histogram.snapshot()
+    assert count == 21 and total == sum(range(1000, 1020)) + 5
+    assert len(histogram._shards) == 1
+
+# Only acquisitions that had to wait are recorded, for every shard
+def test_instrumented_store_lock_counts_contention():
+    histogram = LatencyHistogram()
+    assert instrument_store_locks(ShardedURLStore(num_shards=4), histogram) == 4
+
+    store = URLStore()
+    instrument_store_locks(store, histogram)
+    short_code = store.create_url("https://example.com")
+    assert histogram.snapshot()[1] == 0
+
+    store.lock.acquire()
+    reader = threading.Thread(target=store.get_url_info, args=(short_code,))
+    reader.start()
+    time.sleep(0.05)
+    store.lock.release()
+    reader.join()
+    _, contended, waited = histogram.snapshot()
+    assert contended == 1 and waited >= 10_000_000
+
+# Requests to the timed routes show up in the Prometheus output
+def test_metrics_endpoint():
+    client = app.test_client()
+    if metrics is None:
+        assert client.get('/api/metrics').status_code == 404
+        pytest.skip("metrics disabled")
+    short_code = client.post('/api/shorten', json={"url": "https://example.com/metrics"}).get_json()["short_code"]
+    client.get(f'/{short_code}')
+    client.get(f'/api/stats/{short_code}')
+
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    for route in ("shorten_url", "redirect_to_long_url", "get_url_stats"):
+        assert f'url_shortener_request_duration_seconds_bucket{{route="{route}",le="+Inf"}}' in text
+    assert 'url_shortener_store_lock_contended_total' in text
+    assert 'url_shortener_links ' in text
+
+    assert route_name("GET", "/api/stats/bulk") is None
+    assert route_name("GET", "/abc123") == "redirect_to_long_url"
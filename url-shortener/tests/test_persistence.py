@@ -0,0 +1,70 @@
+# test_persistence.py
+import os
+
+from app.models import ShardedURLStore, URLStore
+from app.persistence import Persistence
+
+def open_store(directory, store):
+    persistence = Persistence(str(directory), commit_interval=0, snapshot_interval=0)
+    persistence.load_into(store)
+    persistence.start()
+    store.journal = persistence
+    return persistence
+
+# Links and clicks survive a restart through log replay alone
+def test_log_replay_restores_store(tmp_path):
+    store = URLStore()
+    persistence = open_store(tmp_path, store)
+    code = store.create_url("https://example.com/durable")
+    store.add_clicks({code: 3})
+    store.increment_clicks(code)
+    batch = store.create_urls(["https://example.com/b1", "https://example.com/b2"])
+    persistence.close()
+
+    restored = URLStore()
+    open_store(tmp_path, restored).close()
+    info = restored.get_url_info(code)
+    assert info["original_url"] == "https://example.com/durable"
+    assert info["clicks"] == 4
+    assert info["created_at"] == store.get_url_info(code)["created_at"]
+    assert restored.get_url_info(batch[1])["original_url"] == "https://example.com/b2"
+
+# Compaction folds the log into a snapshot; later events are replayed on top
+def test_compaction_and_snapshot_load(tmp_path):
+    store = ShardedURLStore(num_shards=4)
+    persistence = open_store(tmp_path, store)
+    codes = [store.create_url(f"https://example.com/{i}") for i in range(100)]
+    store.add_clicks({code: 2 for code in codes})
+    persistence.compact()
+    assert os.path.exists(persistence.snapshot_path)
+    store.add_clicks({codes[0]: 5})
+    late_code = store.create_url("https://example.com/late")
+    persistence.close()
+
+    restored = URLStore()
+    persistence = open_store(tmp_path, restored)
+    assert len(restored) == 101
+    assert restored.get_url_info(codes[0])["clicks"] == 7
+    assert restored.get_url_info(codes[1])["clicks"] == 2
+    assert restored.get_url_info(late_code)["original_url"] == "https://example.com/late"
+
+    # A second compaction keeps the same state
+    persistence.compact()
+    persistence.close()
+    again = URLStore()
+    open_store(tmp_path, again).close()
+    assert len(again) == 101 and again.get_url_info(codes[0])["clicks"] == 7
+
+# A torn frame at the end of a segment is ignored on replay
+def test_torn_log_tail_is_ignored(tmp_path):
+    store = URLStore()
+    persistence = open_store(tmp_path, store)
+    code = store.create_url("https://example.com/ok")
+    persistence.close()
+    segment = os.path.join(str(tmp_path), sorted(os.listdir(str(tmp_path)))[-1])
+    with open(segment, "ab") as f:
+        f.write(b"\x20\x00\x00\x00garbage")
+
+    restored = URLStore()
+    open_store(tmp_path, restored).close()
+    assert len(restored) == 1 and restored.get_url_info(code) is not None
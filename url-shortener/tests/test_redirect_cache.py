@@ -0,0 +1,73 @@
+# test_redirect_cache.py
+from flask import redirect
+
+from app.main import app
+from app.models import URLStore
+from app.redirect_cache import RedirectCache, RedirectCacheMiddleware
+
+def make_response(url):
+    with app.test_request_context():
+        return redirect(url)
+
+# Entries are evicted least recently used first, and by byte budget
+def test_redirect_cache_lru_bounds():
+    cache = RedirectCache(max_entries=2)
+    for code in ("aaaaaa", "bbbbbb"):
+        cache.put(code, make_response(f"https://example.com/{code}"), cache.token())
+    assert cache.get("aaaaaa") is not None
+    cache.put("cccccc", make_response("https://example.com/c"), cache.token())
+    assert cache.get("bbbbbb") is None
+    assert cache.get("aaaaaa") is not None and cache.get("cccccc") is not None
+    assert cache.stats()["evictions"] == 1
+
+    small = RedirectCache(max_bytes=1)
+    small.put("aaaaaa", make_response("https://example.com/a"), small.token())
+    assert small.get("aaaaaa") is None
+
+# Overwriting a code invalidates its cached response, and a fill that raced
+# an invalidation is dropped
+def test_redirect_cache_invalidation():
+    store = URLStore()
+    cache = RedirectCache()
+    store.invalidation_hooks.append(cache.invalidate)
+    store.add_url("abcdef", "https://example.com/old")
+
+    token = cache.token()
+    cache.put("abcdef", make_response("https://example.com/old"), token)
+    store.add_url("abcdef", "https://example.com/new")
+    assert cache.get("abcdef") is None
+
+    cache.put("abcdef", make_response("https://example.com/old"), token)
+    assert cache.get("abcdef") is None
+    store.clear()
+    assert cache.stats()["entries"] == 0
+
+    # Changes made by other processes arrive through the generation source
+    generation = [0]
+    shared = RedirectCache(generation=lambda: generation[0])
+    shared.put("abcdef", make_response("https://example.com/old"), shared.token())
+    assert shared.get("abcdef") is not None
+    generation[0] += 1
+    assert shared.get("abcdef") is None
+
+# The middleware answers cached codes itself and passes everything else on
+def test_redirect_cache_middleware():
+    cache = RedirectCache()
+    cache.put("abcdef", make_response("https://example.com/target"), cache.token())
+    hits, passed = [], []
+
+    def downstream(environ, start_response):
+        passed.append(environ["PATH_INFO"])
+        start_response("404 NOT FOUND", [])
+        return [b""]
+
+    middleware = RedirectCacheMiddleware(downstream, cache, lambda short_code, environ: hits.append(short_code))
+    statuses = []
+    start_response = lambda status, headers: statuses.append((status, dict(headers)))
+    middleware({"REQUEST_METHOD": "GET", "PATH_INFO": "/abcdef"}, start_response)
+    middleware({"REQUEST_METHOD": "GET", "PATH_INFO": "/api/abcdef"}, start_response)
+    middleware({"REQUEST_METHOD": "POST", "PATH_INFO": "/abcdef"}, start_response)
+    assert hits == ["abcdef"]
+    assert passed == ["/api/abcdef", "/abcdef"]
+    assert statuses[0][0].startswith("302")
+    assert statuses[0][1]["Location"] == "https://example.com/target"
@@ -0,0 +1,94 @@
+# test_shared.py
+import multiprocessing
+import threading
+import uuid
+
+import pytest
+
+from app.shared import SharedMemoryURLStore
+
+@pytest.fixture
+def segment_name():
+    name = f"test-shortener-{uuid.uuid4().hex[:12]}"
+    yield name
+    store = SharedMemoryURLStore(name=name)
+    store.unlink()
+    store.close()
+
+def click_worker(name, short_code, rounds):
+    store = SharedMemoryURLStore(name=name)
+    for _ in range(rounds):
+        store.increment_clicks(short_code)
+    store.create_url(f"https://example.com/from-{multiprocessing.current_process().pid}")
+    store.close()
+
+# The shared store behaves like the other engines within one process
+def test_shared_store_api(segment_name):
+    store = SharedMemoryURLStore(name=segment_name, capacity=100, arena_bytes=4096)
+    short_code = store.create_url("https://example.com/one")
+    codes = store.create_urls(["https://example.com/two", "https://example.com/three"])
+    assert store.get_url_info(short_code)["original_url"] == "https://example.com/one"
+    assert store.add_clicks({short_code: 3, "zzzzzz": 1}) == 1
+    assert store.get_many(codes + [short_code])[short_code][1] == 3
+    assert store.insert_many([(codes[0], "https://example.com/dup"), ("abcdef", "https://example.com/x")]) == {codes[0]}
+    assert len(store) == 4
+    assert sorted(entry[0] for entry in store.iter_entries(chunk_size=3)) == sorted(codes + [short_code, "abcdef"])
+
+    with pytest.raises(RuntimeError):
+        store.create_url("https://example.com/" + "x" * 5000)
+    store.clear()
+    assert len(store) == 0 and store.get_url_info(short_code) is None
+    store.close()
+
+# Links and clicks written by other processes are visible, and no click is lost
+def test_shared_store_across_processes(segment_name):
+    store = SharedMemoryURLStore(name=segment_name, capacity=1000, arena_bytes=65536)
+    short_code = store.create_url("https://example.com/shared")
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=click_worker, args=(segment_name, short_code, 200)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    assert store.get_url_info(short_code)["clicks"] == 600
+    assert len(store) == 4
+    store.close()
+
+def forked_worker(store):
+    store.create_url("https://example.com/forked")
+
+# Workers forked after the store was opened (gunicorn --preload) still exclude each other
+def test_shared_store_forked_workers(segment_name):
+    store = SharedMemoryURLStore(name=segment_name, capacity=100, arena_bytes=4096)
+    worker = multiprocessing.get_context("fork").Process(target=forked_worker, args=(store,))
+    with store.lock:
+        worker.start()
+        worker.join(0.5)
+        assert worker.is_alive()
+    worker.join(10)
+    assert worker.exitcode == 0
+    assert len(store) == 1
+    store.close()
+
+# Lookups without the lock never see a half-overwritten link
+def test_shared_store_reads_during_overwrites(segment_name):
+    store = SharedMemoryURLStore(name=segment_name, capacity=100, arena_bytes=1 << 20)
+    store.add_url("abcdef", "https://example.com/" + "a" * 10)
+    urls = {"https://example.com/" + "a" * 10, "https://example.com/" + "é" * 30}
+    done = threading.Event()
+
+    def writer():
+        for i in range(2000):
+            store.add_url("abcdef", sorted(urls)[i % 2])
+        done.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    while not done.is_set():
+        assert store.get_url_info("abcdef")["original_url"] in urls
+        assert store.get_many(["abcdef"])["abcdef"][0] in urls
+        assert store.is_short_code_taken("abcdef")
+    thread.join()
+    store.close()
@@ -0,0 +1,105 @@
+# test_sqlite_store.py
+import threading
+import time
+
+from app.expiry import LinkExpiry
+from app.filters import BloomFilter
+from app.sqlite_store import SQLiteURLStore
+
+# Links, clicks and deadlines survive reopening the database
+def test_sqlite_store_persists(tmp_path):
+    path = str(tmp_path / "links.db")
+    store = SQLiteURLStore(path)
+    expiry = LinkExpiry(store)
+    expiry.journal = store
+    codes = store.create_urls([f"https://example.com/{i}" for i in range(10)])
+    store.add_url("abc123", "https://example.com/fixed")
+    assert store.increment_clicks(codes[0])
+    assert not store.increment_clicks("zzz999")
+    store.add_clicks({codes[1]: 5, "zzz999": 2})
+    expiry.set(codes[2], time.time() + 3600)
+    store.close()
+
+    reopened = SQLiteURLStore(path)
+    assert len(reopened) == 11
+    assert reopened.get_url_info(codes[0])["clicks"] == 1
+    assert reopened.get_url_info(codes[1])["clicks"] == 5
+    assert reopened.get_url_info("abc123")["original_url"] == "https://example.com/fixed"
+    assert dict(reopened.deadlines()) == {codes[2]: expiry.expires_at(codes[2])}
+    assert sorted(entry[0] for entry in reopened.iter_entries(chunk_size=3)) == sorted(codes + ["abc123"])
+    reopened.close()
+
+# Concurrent writers are grouped into shared transactions without losing updates
+def test_sqlite_store_concurrent_writes(tmp_path):
+    store = SQLiteURLStore(str(tmp_path / "links.db"), batch_size=64)
+    short_code = store.create_url("https://example.com/hot")
+    created = []
+
+    def worker():
+        for i in range(50):
+            created.append(store.create_url(f"https://example.com/{i}"))
+            store.increment_clicks(short_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(created)) == 400
+    assert len(store) == 401
+    assert store.get_url_info(short_code)["clicks"] == 400
+    assert store.get_many(created[:5]).keys() == set(created[:5])
+    store.close()
+
+# Overwrites and deletes notify the invalidation hooks; a filter sees existing codes
+def test_sqlite_store_invalidation_and_filter(tmp_path):
+    store = SQLiteURLStore(str(tmp_path / "links.db"))
+    store.add_url("abc123", "https://example.com/a")
+    store.add_url("def456", "https://example.com/b")
+    invalidated = []
+    store.invalidation_hooks.append(invalidated.append)
+    store.code_filter = BloomFilter(capacity=100)
+    assert store.code_filter.might_contain("abc123")
+
+    store.add_url("abc123", "https://example.com/c")
+    assert store.try_insert("abc123", "https://example.com/d") is False
+    assert store.delete_many(["def456", "zzz999"]) > 0
+    assert store.get_url_info("def456") is None
+    store.clear()
+    assert invalidated == ["abc123", "def456", None]
+    assert len(store) == 0
+    store.close()
+
+# Connections of exited threads are reused by new ones or closed
+def test_sqlite_store_bounded_readers(tmp_path):
+    store = SQLiteURLStore(str(tmp_path / "links.db"), idle_readers=4)
+    short_code = store.create_url("https://example.com/a")
+    barrier = threading.Barrier(50)
+    found = []
+
+    def reader():
+        barrier.wait()
+        found.append(store.get_url_info(short_code)["original_url"])
+        found.append(store.is_short_code_taken(short_code))
+
+    threads = [threading.Thread(target=reader) for _ in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert found.count("https://example.com/a") == 50 and found.count(True) == 50
+    assert len(store._connections) <= 5  # 4 idle readers and the writer
+    store.close()
+
+# An overwritten link's deadline is dropped in memory, matching the database
+def test_sqlite_store_overwrite_drops_deadline(tmp_path):
+    store = SQLiteURLStore(str(tmp_path / "links.db"))
+    expiry = LinkExpiry(store)
+    expiry.journal = store
+    store.invalidation_hooks.append(expiry.on_store_invalidated)
+    store.add_url("abc123", "https://example.com/a")
+    expiry.set("abc123", time.time() + 3600)
+    store.add_url("abc123", "https://example.com/b")
+    assert expiry.expires_at("abc123") is None
+    assert list(store.deadlines()) == []
+    store.close()
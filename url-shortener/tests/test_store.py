@@ -0,0 +1,97 @@
+# test_store.py
+import threading
+
+from app.clicks import ClickBuffer
+from app.models import ShardedURLStore, URLStore
+
+# Sharded store keeps the URLStore API and spreads codes across shards
+def test_sharded_store_api():
+    store = ShardedURLStore(num_shards=8)
+    codes = [store.create_url(f"https://example.com/{i}") for i in range(200)]
+    assert len(set(codes)) == 200
+    assert len(store) == 200
+    assert sum(1 for shard in store.shards if len(shard)) > 1
+
+    store.add_url("abc123", "https://example.org")
+    assert store.is_short_code_taken("abc123")
+    assert store.increment_clicks("abc123") is True
+    assert store.increment_clicks("zzz999") is False
+    assert store.get_url_info("abc123")["clicks"] == 1
+
+    store.clear()
+    assert len(store) == 0
+    assert store.get_url_info("abc123") is None
+
+# Concurrent increments on many codes from several threads are not lost
+def test_sharded_store_concurrent_clicks():
+    store = ShardedURLStore(num_shards=4)
+    codes = [store.create_url(f"https://example.com/{i}") for i in range(20)]
+
+    def worker():
+        for _ in range(50):
+            for code in codes:
+                store.increment_clicks(code)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(store.get_url_info(code)["clicks"] == 200 for code in codes)
+
+# Buffered clicks are visible immediately through get_clicks and land in the store on flush
+def test_click_buffer_exact_counts_and_flush():
+    store = ShardedURLStore(num_shards=4)
+    code = store.create_url("https://example.com/buffered")
+    counter = ClickBuffer(store, flush_interval=60, flush_threshold=10 ** 6)
+    try:
+        def worker():
+            for _ in range(100):
+                counter.record(code)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert store.get_url_info(code)["clicks"] == 0
+        assert counter.get_clicks(code) == 400
+        counter.flush()
+        assert store.get_url_info(code)["clicks"] == 400
+        assert counter.get_clicks(code) == 400
+        assert counter.get_clicks("nope00") is None
+    finally:
+        counter.close()
+
+# Pending clicks are dropped when the store overwrites a link or is cleared
+def test_click_buffer_drops_invalidated_clicks():
+    store = URLStore()
+    codes = store.create_urls(["https://example.com/a", "https://example.com/b"])
+    counter = ClickBuffer(store, flush_interval=60, flush_threshold=10 ** 6)
+    store.invalidation_hooks.append(counter.on_store_invalidated)
+    try:
+        for short_code in codes * 3:
+            counter.record(short_code)
+        store.add_url(codes[0], "https://example.com/replaced")
+        assert counter.get_clicks(codes[0]) == 0
+        assert counter.get_clicks(codes[1]) == 3
+        counter.flush()
+        assert store.get_url_info(codes[0])["clicks"] == 0
+        assert store.get_url_info(codes[1])["clicks"] == 3
+
+        counter.record(codes[1])
+        store.clear()
+        store.add_url(codes[1], "https://example.com/again")
+        counter.flush()
+        assert counter.get_clicks(codes[1]) == 0
+    finally:
+        counter.close()
+
+# Batch creation keeps input order and unique codes across shards
+def test_create_urls_batch():
+    store = ShardedURLStore(num_shards=4)
+    urls = [f"https://example.com/{i}" for i in range(500)]
+    codes = store.create_urls(urls)
+    assert len(set(codes)) == 500
+    assert [store.get_url_info(code)["original_url"] for code in codes] == urls
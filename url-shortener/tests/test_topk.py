@@ -0,0 +1,83 @@
+# test_topk.py
+import random
+import threading
+
+import pytest
+
+from app.main import app
+from app.models import top_links, url_store
+from app.topk import SpaceSaving, TopLinks
+from tests.test_analytics import FakeClock
+
+# Heavy hitters of a skewed stream are found, and every count stays within
+# its reported error of the true count
+def test_space_saving_finds_heavy_hitters():
+    rng = random.Random(7)
+    stream = [f"hot{rng.randrange(5)}" for _ in range(5000)] + [f"cold{i}" for i in range(5000)]
+    rng.shuffle(stream)
+    sketch = SpaceSaving(capacity=50)
+    for key in stream:
+        sketch.add(key)
+
+    assert len(sketch.counts) == 50
+    true_counts = {key: stream.count(key) for key in sketch.counts}
+    for key, count in sketch.counts.items():
+        assert count - sketch.errors[key] <= true_counts[key] <= count
+    ranked = sorted(sketch.counts, key=sketch.counts.get, reverse=True)
+    assert set(ranked[:5]) == {f"hot{i}" for i in range(5)}
+
+# Windowed rankings only count clicks from the buckets inside the window
+def test_top_links_window():
+    clock = FakeClock(1_000_000 * 3600.0)
+    tracker = TopLinks(capacity=10, clock=clock)
+    tracker.record("old", 100)
+    clock.now += 2 * 3600
+    tracker.record("new", 5)
+    tracker.record("old")
+
+    assert [row[0] for row in tracker.top()] == ["old", "new"]
+    assert tracker.top("hour", 1) == [("new", 5, 0), ("old", 1, 0)]
+    assert tracker.top("day", 1)[0] == ("old", 101, 0)
+    with pytest.raises(ValueError):
+        tracker.top("minute", 5)
+
+# Clicks counted in other threads' buffers are merged before every read
+def test_top_links_merges_thread_buffers():
+    tracker = TopLinks(capacity=10, clock=FakeClock(1_000_000 * 3600.0), flush_threshold=50)
+
+    def clicks(short_code, hits):
+        for _ in range(hits):
+            tracker.record(short_code)
+
+    threads = [threading.Thread(target=clicks, args=(f"code{i}", 40 + i)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tracker.top() == [(f"code{i}", 40 + i, 0) for i in reversed(range(4))]
+    assert tracker.top("hour", 1)[0] == ("code3", 43, 0)
+    assert tracker.stats()["clicks"] == 166
+    assert tracker._buffers == []
+
+    tracker.record("code0")
+    tracker.clear()
+    assert tracker.top() == []
+
+# /api/stats/top ranks links by redirects and skips links the store lacks
+def test_top_links_endpoint():
+    client = app.test_client()
+    if top_links is None:
+        pytest.skip("top links disabled")
+    url_store.clear()
+    codes = url_store.create_urls([f"https://example.com/top/{i}" for i in range(2)])
+    for short_code, hits in zip(codes, (1, 5)):
+        for _ in range(hits):
+            client.get(f'/{short_code}')
+    # e.g. a link reclaimed after it expired
+    top_links.record("gone00", 3)
+
+    data = client.get('/api/stats/top?k=2&window=24h').get_json()
+    assert [link["short_code"] for link in data["links"]] == [codes[1], codes[0]]
+    assert data["links"][0]["clicks"] == 5 and data["links"][0]["url"] == "https://example.com/top/1"
+    assert client.get('/api/stats/top?k=0').status_code == 400
+    assert client.get('/api/stats/top?window=5m').status_code == 400
@@ -0,0 +1,85 @@
+# test_transfer.py
+import io
+import time
+
+import pytest
+
+from app.compact import CompactURLStore
+from app.expiry import LinkExpiry
+from app.main import app, url_store
+from app.models import URLStore
+from app.transfer import import_records, iter_export, iter_records
+from tests.test_persistence import open_store
+
+def sorted_entries(store):
+    return sorted(store.iter_entries())
+
+# Both formats round-trip links, clicks, timestamps and deadlines into another
+# engine, leave expired links out, and imports are journalled
+@pytest.mark.parametrize("fmt", ["ndjson", "binary"])
+def test_export_import_round_trip(tmp_path, fmt):
+    source = URLStore()
+    source_expiry = LinkExpiry(source)
+    codes = source.create_urls([f"https://example.com/{i}" for i in range(25)])
+    source.add_clicks({codes[0]: 7})
+    source_expiry.set(codes[1], time.time() + 3600)
+    source_expiry.set(codes[2], time.time() - 1)
+
+    data = b"".join(iter_export(source, source_expiry, fmt, chunk_size=10))
+    target = CompactURLStore()
+    target_expiry = LinkExpiry(target)
+    persistence = open_store(tmp_path, target)
+    summary = import_records(target, iter_records(io.BytesIO(data), fmt), expiry=target_expiry, batch_size=7)
+    persistence.close()
+
+    assert summary == {"imported": 24, "skipped": 0, "failed": 0, "errors": []}
+    expected = [entry for entry in sorted_entries(source) if entry[0] != codes[2]]
+    assert sorted_entries(target) == expected
+    assert target_expiry.expires_at(codes[1]) == source_expiry.expires_at(codes[1])
+
+    restored = CompactURLStore()
+    open_store(tmp_path, restored).close()
+    assert sorted_entries(restored) == expected
+
+# Bad records are reported without stopping the import, existing codes can be
+# kept, and damaged binary streams are rejected
+def test_import_errors_and_conflicts():
+    store = URLStore()
+    store.add_url("abc123", "https://example.com/original")
+    lines = (
+        b'{"short_code": "abc123", "url": "https://example.com/new", "created_at": 1}\n'
+        b'{"short_code": "bad code", "url": "https://example.com"}\n'
+        b'not json\n'
+        b'{"short_code": "xyz789", "url": "https://example.com/x", "clicks": 2, "created_at": "2024-01-01T00:00:00"}\n'
+    )
+    summary = import_records(store, iter_records(io.BytesIO(lines)), skip_existing=True)
+    assert (summary["imported"], summary["skipped"], summary["failed"]) == (1, 1, 2)
+    assert summary["errors"][0].startswith("record 2:")
+    assert store.get_url_info("abc123")["original_url"] == "https://example.com/original"
+    assert store.get_url_info("xyz789")["clicks"] == 2
+
+    data = b"".join(iter_export(store, fmt="binary"))
+    with pytest.raises(ValueError):
+        list(iter_records(io.BytesIO(data[:-10]), "binary"))
+    with pytest.raises(ValueError):
+        list(iter_records(io.BytesIO(b"garbage!" + data[8:]), "binary"))
+
+# The admin endpoints stream a backup out and restore it
+def test_export_import_endpoints():
+    client = app.test_client()
+    url_store.clear()
+    codes = url_store.create_urls([f"https://example.com/backup/{i}" for i in range(5)])
+    backup = client.get('/api/admin/export?format=binary')
+    assert backup.status_code == 200 and backup.mimetype == 'application/octet-stream'
+    # The body is generated as it is read, so read it before clearing
+    data = backup.data
+
+    url_store.clear()
+    response = client.post('/api/admin/import?format=binary', data=data)
+    assert response.status_code == 200
+    assert response.get_json()["imported"] == 5
+    assert client.get(f'/api/stats/{codes[3]}').get_json()["url"] == "https://example.com/backup/3"
+
+    lines = client.get('/api/admin/export').get_data(as_text=True).splitlines()
+    assert len(lines) == 5
+    assert client.get('/api/admin/export?format=xml').status_code == 400
@@ -0,0 +1,62 @@
+# test_uniques.py
+import random
+
+from app import service
+from app.main import app, url_store
+from app.models import click_analytics
+from app.uniques import HyperLogLog, UniqueVisitors
+from tests.test_analytics import FakeClock
+
+# Estimates stay within a few standard errors, small sets are counted almost
+# exactly, and merging gives the union
+def test_hyperloglog_estimates():
+    rng = random.Random(3)
+    large = HyperLogLog(precision=10)
+    for _ in range(100_000):
+        large.add_hash(rng.getrandbits(64))
+    assert abs(large.estimate() - 100_000) < 3 * large.relative_error * 100_000
+
+    small = HyperLogLog(precision=10)
+    hashes = [rng.getrandbits(64) for _ in range(200)]
+    for value in hashes * 3:
+        small.add_hash(value)
+    assert abs(small.estimate() - 200) < 5
+
+    other = HyperLogLog(precision=10)
+    for value in hashes[:100] + [rng.getrandbits(64) for _ in range(100)]:
+        other.add_hash(value)
+    small.merge(other)
+    assert abs(small.estimate() - 300) < 3 * small.relative_error * 300
+    assert len(small.registers) == 1024
+
+# Repeat visitors count once; day windows only union the days inside them
+def test_unique_visitors_windows():
+    clock = FakeClock(20_000 * 86400.0)
+    visitors = UniqueVisitors(days=7, clock=clock)
+    for fingerprint in ("a", "b", "a"):
+        visitors.record("abc123", fingerprint)
+    clock.now += 86400
+    for fingerprint in ("b", "c"):
+        visitors.record("abc123", fingerprint)
+
+    assert visitors.estimate("abc123")["estimate"] == 3
+    assert visitors.estimate("abc123", days=1)["estimate"] == 2
+    assert visitors.estimate("abc123", days=2)["estimate"] == 3
+    assert visitors.estimate("zzz999") == {"estimate": 0, "error": 0}
+    visitors.on_store_invalidated("abc123")
+    assert visitors.estimate("abc123")["estimate"] == 0
+
+# Redirects feed the estimate reported by /api/stats/<short_code>
+def test_stats_report_unique_visitors(monkeypatch):
+    monkeypatch.setattr(service, "unique_visitors", UniqueVisitors())
+    client = app.test_client()
+    short_code = url_store.create_url("https://example.com/uniques")
+    for address, agent in (("10.0.0.1", "a"), ("10.0.0.2", "a"), ("10.0.0.1", "b"), ("10.0.0.1", "a")):
+        response = client.get(f'/{short_code}', headers={"User-Agent": agent}, environ_base={"REMOTE_ADDR": address})
+        assert response.status_code == 302
+
+    data = client.get(f'/api/stats/{short_code}').get_json()
+    assert data["unique_visitors"] == {"estimate": 3, "error": 1}
+    if click_analytics is not None:
+        data = client.get(f'/api/stats/{short_code}?window=7d').get_json()
+        assert data["window"]["unique_visitors"]["estimate"] == 3